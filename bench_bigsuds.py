@@ -0,0 +1,772 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmarks for bigsuds, run against the local iControl stub server.
+
+Usage:
+    python bench_bigsuds.py [--calls N] [--scenario NAME ...]
+                            [--recordings DIR] [--json FILE]
+                            [--compare FILE]
+
+--json writes the results (with the git commit and Python version) to a
+file, and --compare prints them next to those of an earlier --json run, so
+that two commits can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import shutil
+import sys
+import tempfile
+import time
+
+import bigsuds
+import bigsuds_daemon
+import icontrol_stub
+
+
+def bench_connection_pool(server, calls):
+    """Times small iControl calls with and without connection pooling."""
+    results = {}
+    for pool_size in (0, 8):
+        b = bigsuds.BIGIP('127.0.0.1', port=server.port, pool_size=pool_size)
+        b.LocalLB.Pool.get_list()
+        server.reset()
+        start = time.time()
+        for _ in range(calls):
+            b.LocalLB.Pool.get_list()
+        elapsed = time.time() - start
+        result = {'calls': calls,
+                  'seconds': elapsed,
+                  'calls_per_second': calls / elapsed,
+                  'connections': server.counters.get('connections', 0),
+                  'requests': server.counters.get('requests', 0)}
+        if b.connection_pool is not None:
+            result['pool'] = b.connection_pool.stats()
+        results['pool_size=%d' % pool_size] = result
+    return results
+
+
+def bench_cold_start(server, namespaces):
+    """Times creating namespace clients from the BIGIP and from a bundle."""
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'bench.bundle')
+        bigsuds.compile_bundle('127.0.0.1', path, namespaces, port=server.port)
+        results = {}
+        for name, bundle in (('wsdl', None), ('bundle', path)):
+            start = time.time()
+            b = bigsuds.BIGIP('127.0.0.1', port=server.port, bundle=bundle,
+                              share_wsdls=False)
+            for wsdl_name in namespaces:
+                module, interface = wsdl_name.split('.', 1)
+                getattr(getattr(b, module), interface)
+            elapsed = time.time() - start
+            results['cold_start_%s' % name] = {
+                'namespaces': len(namespaces),
+                'seconds': elapsed,
+                'ms_per_namespace': elapsed * 1000 / len(namespaces)}
+        return results
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def bench_debug_start(server):
+    """Times BIGIP(debug=True) until its namespaces are listed and until
+    all its clients are created."""
+    start = time.time()
+    b = bigsuds.BIGIP('127.0.0.1', port=server.port, debug=True,
+                      share_wsdls=False)
+    listed = time.time() - start
+    b._loading.wait()
+    return {'debug_start': {'listed_ms': listed * 1000,
+                            'loaded_ms': (time.time() - start) * 1000}}
+
+
+def bench_sessions(server, sessions):
+    """Times creating sessions (with_session_id) and making their first
+    call, with and without the process-wide WSDL registry."""
+    results = {}
+    for share_wsdls in (False, True):
+        b = bigsuds.BIGIP('127.0.0.1', port=server.port,
+                          share_wsdls=share_wsdls)
+        b.LocalLB.Pool.get_list()
+        server.reset()
+        start = time.time()
+        for session_id in range(sessions):
+            b.with_session_id(session_id).LocalLB.Pool.get_list()
+        elapsed = time.time() - start
+        results['share_wsdls=%s' % share_wsdls] = {
+            'sessions': sessions,
+            'ms_per_session': elapsed * 1000 / sessions,
+            'wsdls_fetched': server.counters.get('wsdls', 0)}
+    return results
+
+
+def bench_daemon(server, scripts):
+    """Times short scripts (a new BIGIP making a few calls) run directly
+    and through a bigsuds daemon with warm clients."""
+    def script(b):
+        b.LocalLB.Pool.get_list()
+        b.LocalLB.Pool.get_member(['/Common/pool'])
+        b.System.SystemInfo.get_uptime()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'bench.sock')
+        with bigsuds_daemon.Daemon(path) as daemon:
+            daemon.add_device('127.0.0.1', port=server.port, namespaces=[
+                'LocalLB.Pool', 'System.SystemInfo'])
+            results = {}
+            for name in ('direct', 'daemon'):
+                server.reset()
+                start = time.time()
+                for _ in range(scripts):
+                    if name == 'direct':
+                        # A new process has no parsed WSDLs.
+                        script(bigsuds.BIGIP('127.0.0.1', port=server.port,
+                                             share_wsdls=False))
+                    else:
+                        b = bigsuds_daemon.DaemonBIGIP(
+                            '127.0.0.1', socket_path=path, fallback=False,
+                            port=server.port)
+                        script(b)
+                        b.close()
+                elapsed = time.time() - start
+                results[name] = {
+                    'scripts': scripts,
+                    'ms_per_script': elapsed * 1000 / scripts,
+                    'wsdls_fetched': server.counters.get('wsdls', 0)}
+            return results
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def bench_call_logging(server, size):
+    """Times a call with a large argument with debug logging off and on
+    (to a handler discarding the records)."""
+    import logging
+    b = bigsuds.BIGIP('127.0.0.1', port=server.port)
+    names = ['/Common/pool'] * size
+    b.LocalLB.Pool.get_member(names[:1])
+    logger = logging.getLogger('bigsuds')
+    handler = logging.NullHandler()
+    results = {}
+    for level in (logging.INFO, logging.DEBUG):
+        logger.setLevel(level)
+        logger.addHandler(handler)
+        try:
+            start = time.time()
+            b.LocalLB.Pool.get_member(names)
+            elapsed = time.time() - start
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(logging.NOTSET)
+        results['call_logging_%s' % logging.getLevelName(level).lower()] = {
+            'items': size, 'seconds': elapsed}
+    return results
+
+
+def bench_arg_processing(server, sizes):
+    """Times marshalling pool members for add_member, per element."""
+    b = bigsuds.BIGIP('127.0.0.1', port=server.port)
+    client = b.LocalLB.Pool._client
+    method = client.service.add_member
+    results = {}
+
+    start = time.time()
+    for _ in range(1000):
+        client.factory.create('Common.IPPortDefinition')
+    results['factory_create'] = {'us_per_element': (time.time() - start) * 1000}
+
+    for size in sizes:
+        members = [{'address': '10.%d.%d.%d' % (i >> 16, (i >> 8) & 255,
+                                                i & 255), 'port': 80}
+                   for i in range(size)]
+        processor = bigsuds._DefaultArgProcessor(method, client.factory)
+        args = (['/Common/pool'], [members])
+        start = time.time()
+        processed = processor.process(args, {})
+        elapsed = time.time() - start
+        results['add_member_%d' % size] = {
+            'elements': size,
+            'seconds': elapsed,
+            'us_per_element': elapsed * 1e6 / size}
+        # The whole envelope, marshalled by suds and written directly.
+        start = time.time()
+        bigsuds._raw_request(method, *processed)
+        elapsed += time.time() - start
+        results['add_member_envelope_suds_%d' % size] = {
+            'elements': size,
+            'seconds': elapsed,
+            'us_per_element': elapsed * 1e6 / size}
+        processor.serialize(args[:1], {})
+        start = time.time()
+        processor.serialize(args, {})
+        elapsed = time.time() - start
+        results['add_member_envelope_direct_%d' % size] = {
+            'elements': size,
+            'seconds': elapsed,
+            'us_per_element': elapsed * 1e6 / size}
+    return results
+
+
+def bench_result_processing(stat_pools):
+    """Times get_all_statistics with the generic, compiled and raw XML
+    result converters, and streamed."""
+    device = icontrol_stub.StubDevice(stat_pools=stat_pools)
+    results = {}
+    with icontrol_stub.StubServer(device) as server:
+        for name in ('generic', 'compiled', 'fast_parse'):
+            b = bigsuds.BIGIP('127.0.0.1', port=server.port,
+                              fast_parse=name == 'fast_parse')
+            if name == 'generic':
+                b._result_processor_factory = (
+                    lambda client, method: bigsuds._NativeResultProcessor())
+            b.LocalLB.Pool.get_all_statistics()
+            start = time.time()
+            b.LocalLB.Pool.get_all_statistics()
+            elapsed = time.time() - start
+            results['get_all_statistics_%s' % name] = {
+                'pools': stat_pools,
+                'seconds': elapsed}
+
+        start = time.time()
+        for _ in b.LocalLB.Pool.get_all_statistics.stream():
+            pass
+        results['get_all_statistics_stream'] = {
+            'pools': stat_pools,
+            'seconds': time.time() - start}
+
+        # The conversion step alone, on the same suds result.
+        client = b.LocalLB.Pool._client
+        method = client.service.get_all_statistics
+        value = method()
+        for name, processor in (
+                ('generic', bigsuds._NativeResultProcessor()),
+                ('compiled', bigsuds._NativeResultProcessor(method,
+                                                            client.factory))):
+            processor.process(value)
+            start = time.time()
+            processor.process(value)
+            results['convert_%s' % name] = {
+                'pools': stat_pools,
+                'seconds': time.time() - start}
+    return results
+
+
+def bench_result_formats(stat_pools):
+    """Times get_all_statistics (with fast_parse) for each result format,
+    and measures the memory its result takes (on Python 3.4 and newer)."""
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+    device = icontrol_stub.StubDevice(stat_pools=stat_pools)
+    results = {}
+    with icontrol_stub.StubServer(device) as server:
+        for result_format in ('native', 'records', 'columns'):
+            b = bigsuds.BIGIP('127.0.0.1', port=server.port, fast_parse=True,
+                              result_format=result_format)
+            b.LocalLB.Pool.get_all_statistics()
+            start = time.time()
+            b.LocalLB.Pool.get_all_statistics()
+            elapsed = time.time() - start
+            results[result_format] = {'pools': stat_pools,
+                                      'seconds': elapsed}
+            if tracemalloc is not None:
+                tracemalloc.start()
+                try:
+                    before = tracemalloc.get_traced_memory()[0]
+                    result = b.LocalLB.Pool.get_all_statistics()
+                    size = tracemalloc.get_traced_memory()[0] - before
+                finally:
+                    tracemalloc.stop()
+                del result
+                results[result_format]['result_mb'] = size / 1e6
+    return results
+
+def bench_compression(stat_pools):
+    """Times get_all_statistics with uncompressed and gzip compressed
+    replies, and counts the bytes received."""
+    device = icontrol_stub.StubDevice(stat_pools=stat_pools)
+    results = {}
+    with icontrol_stub.StubServer(device, gzip=True) as server:
+        for accept in (False, True):
+            compression = bigsuds.Compression(accept=accept)
+            b = bigsuds.BIGIP('127.0.0.1', port=server.port, fast_parse=True,
+                              compression=compression)
+            b.LocalLB.Pool.get_all_statistics()
+            before = compression.stats()
+            start = time.time()
+            b.LocalLB.Pool.get_all_statistics()
+            elapsed = time.time() - start
+            stats = compression.stats()
+            results['gzip=%s' % accept] = {
+                'pools': stat_pools,
+                'seconds': elapsed,
+                'reply_bytes': stats['reply_bytes'] - before['reply_bytes'],
+                'wire_bytes': stats['reply_wire_bytes'] -
+                before['reply_wire_bytes']}
+    return results
+
+
+def bench_statistics_poller(stat_pools, polls):
+    """Times polling get_all_statistics and computing the deltas of every
+    counter, keeping the previous sample as native dicts and with
+    StatisticsPoller, and measures the memory the sample takes (on Python
+    3.4 and newer)."""
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+    device = icontrol_stub.StubDevice(stat_pools=stat_pools)
+    results = {}
+    with icontrol_stub.StubServer(device) as server:
+        b = bigsuds.BIGIP('127.0.0.1', port=server.port, fast_parse=True)
+
+        def native_sample():
+            statistics = b.LocalLB.Pool.get_all_statistics()['statistics']
+            return dict((pool['pool_name'], dict(
+                (stat['type'], (stat['value']['high'] << 32) +
+                 stat['value']['low']) for stat in pool['statistics']))
+                for pool in statistics)
+
+        def native_poll(previous):
+            sample = native_sample()
+            changes = [(name, dict((stat_type, value - before[stat_type])
+                                   for stat_type, value in counters.items()))
+                       for name, counters in sample.items()
+                       for before in [previous.get(name)]
+                       if before is not None and before != counters]
+            return sample, changes
+
+        poller = bigsuds.StatisticsPoller(b)
+        for name in ('native', 'poller'):
+            if name == 'native':
+                sample, _ = native_poll({})
+                poll = lambda: native_poll(sample)[1]
+            else:
+                poller.poll()
+                poll = poller.poll
+            start = time.time()
+            for _ in range(polls):
+                changes = poll()
+            elapsed = time.time() - start
+            results[name] = {'pools': stat_pools,
+                             'changed': len(changes),
+                             'ms_per_poll': elapsed * 1000 / polls}
+            if tracemalloc is not None:
+                tracemalloc.start()
+                try:
+                    before = tracemalloc.get_traced_memory()[0]
+                    if name == 'native':
+                        kept = native_sample()
+                    else:
+                        poller.poll()
+                        kept = poller._sample
+                    size = tracemalloc.get_traced_memory()[0] - before
+                finally:
+                    tracemalloc.stop()
+                del kept
+                results[name]['sample_mb'] = size / 1e6
+    return results
+
+
+def bench_phases(stat_pools):
+    """Breaks get_all_statistics down into the phases reported to the
+    metrics hook."""
+    device = icontrol_stub.StubDevice(stat_pools=stat_pools)
+    results = {}
+    with icontrol_stub.StubServer(device) as server:
+        for fast_parse in (False, True):
+            measured = []
+            b = bigsuds.BIGIP('127.0.0.1', port=server.port,
+                              fast_parse=fast_parse, metrics=measured.append)
+            b.LocalLB.Pool.get_all_statistics()
+            b.LocalLB.Pool.get_all_statistics()
+            m = measured[-1]
+            result = dict(('%s_ms' % phase, seconds * 1000)
+                          for phase, seconds in m.phases.items())
+            result.update(pools=stat_pools, response_bytes=m.response_bytes)
+            results['phases_fast_parse=%s' % fast_parse] = result
+    return results
+
+
+def bench_batch(pools, delay):
+    """Times get_member for many pools, one call per pool and batched."""
+    device = icontrol_stub.StubDevice(stat_pools=pools)
+    names = sorted(device.pools)
+    results = {}
+    with icontrol_stub.StubServer(device, delay=delay) as server:
+        b = bigsuds.BIGIP('127.0.0.1', port=server.port)
+        b.LocalLB.Pool.get_member([names[0]])
+        start = time.time()
+        for name in names:
+            b.LocalLB.Pool.get_member([name])
+        results['batch_off'] = {'pools': pools,
+                                'seconds': time.time() - start}
+        server.reset()
+        start = time.time()
+        with b.batch():
+            calls = [b.LocalLB.Pool.get_member([name]) for name in names]
+        [call.result() for call in calls]
+        results['batch_on'] = {'pools': pools,
+                               'seconds': time.time() - start,
+                               'requests': server.counters.get('requests', 0)}
+    return results
+
+
+def bench_transaction(pools, delay):
+    """Times a transaction creating many pools, sent call by call, pipelined
+    and pipelined over several connections."""
+    results = {}
+    modes = (('blocking', {}), ('pipelined', {'pipelined': True}),
+             ('pipelined_workers=4', {'pipelined': True, 'workers': 4}))
+    with icontrol_stub.StubServer(delay=delay) as server:
+        b = bigsuds.BIGIP('127.0.0.1', port=server.port).with_session_id(1)
+        b.LocalLB.Pool.get_list()
+        for name, options in modes:
+            server.reset()
+            start = time.time()
+            with bigsuds.Transaction(b, **options) as bigip:
+                for i in range(pools):
+                    bigip.LocalLB.Pool.create(['/Common/%s_%d' % (name, i)],
+                                              ['LB_METHOD_ROUND_ROBIN'],
+                                              [[]])
+            results[name] = {'pools': pools,
+                             'seconds': time.time() - start,
+                             'connections': server.counters.get(
+                                 'connections', 0)}
+    return results
+
+def bench_chunking(pools, delay):
+    """Times get_statistics for many pools in one call, and chunked."""
+    device = icontrol_stub.StubDevice(stat_pools=pools)
+    names = sorted(device.pools)
+    results = {}
+    with icontrol_stub.StubServer(device, delay=delay) as server:
+        for chunk_size in (0, pools // 8):
+            b = bigsuds.BIGIP('127.0.0.1', port=server.port, fast_parse=True,
+                              chunk_size=chunk_size)
+            b.LocalLB.Pool.get_statistics(names[:1])
+            server.reset()
+            start = time.time()
+            b.LocalLB.Pool.get_statistics(names)
+            results['chunk_size=%d' % chunk_size] = {
+                'pools': pools,
+                'seconds': time.time() - start,
+                'requests': server.counters.get('requests', 0)}
+    return results
+
+
+def bench_fleet(devices, delay):
+    """Times a call on many BIGIPs, one after the other and with a
+    BIGIPFleet."""
+    servers = [icontrol_stub.StubServer(delay=delay).start()
+               for _ in range(devices)]
+    hostnames = ['127.0.0.1:%d' % server.port for server in servers]
+    results = {}
+    try:
+        start = time.time()
+        for hostname in hostnames:
+            host, port = hostname.split(':')
+            bigsuds.BIGIP(host, port=int(port)).LocalLB.Pool.get_list()
+        results['fleet_sequential'] = {'devices': devices,
+                                       'seconds': time.time() - start}
+        for server in servers:
+            server.reset()
+        start = time.time()
+        with bigsuds.BIGIPFleet(hostnames) as fleet:
+            fleet.LocalLB.Pool.get_list()
+        results['fleet_parallel'] = {
+            'devices': devices,
+            'seconds': time.time() - start,
+            'wsdls_fetched': sum(server.counters.get('wsdls', 0)
+                                 for server in servers)}
+    finally:
+        for server in servers:
+            server.stop()
+    return results
+
+
+def bench_auth(server, calls):
+    """Times small calls without connection pooling (a new connection per
+    call) with basic and token authentication, counting the requests."""
+    results = {}
+    for token_auth in (False, True):
+        b = bigsuds.BIGIP('127.0.0.1', port=server.port, pool_size=0,
+                          token_auth=token_auth)
+        b.LocalLB.Pool.get_list()
+        server.reset()
+        start = time.time()
+        for _ in range(calls):
+            b.LocalLB.Pool.get_list()
+        elapsed = time.time() - start
+        results['token_auth=%s' % token_auth] = {
+            'calls': calls,
+            'calls_per_second': calls / elapsed,
+            'requests_per_call': server.counters.get('requests', 0) /
+            float(calls)}
+    return results
+
+def bench_latency(server, calls):
+    """Measures the latency distribution of a small call."""
+    b = bigsuds.BIGIP('127.0.0.1', port=server.port)
+    b.LocalLB.Pool.get_list()
+    latencies = []
+    for _ in range(calls):
+        start = time.time()
+        b.LocalLB.Pool.get_list()
+        latencies.append(time.time() - start)
+    latencies.sort()
+    return {'latency_get_list': {
+        'calls': calls,
+        'seconds': sum(latencies),
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p90_ms': latencies[int(len(latencies) * 0.9)] * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000}}
+
+
+def bench_concurrency(calls, threads, delay):
+    """Times calls made by many threads through one thread-safe BIGIP."""
+    import threading
+    results = {}
+    with icontrol_stub.StubServer(delay=delay) as server:
+        b = bigsuds.BIGIP('127.0.0.1', port=server.port, thread_safe=True,
+                          pool_size=threads)
+        b.LocalLB.Pool.get_list()
+        for count in (1, threads):
+            def work(each=calls // count):
+                for _ in range(each):
+                    b.LocalLB.Pool.get_list()
+            # (About) the same number of calls, made by count threads.
+            workers = [threading.Thread(target=work)
+                       for _ in range(count)]
+            start = time.time()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.time() - start
+            made = calls // count * count
+            results['concurrency_threads=%d' % count] = {
+                'calls': made,
+                'seconds': elapsed,
+                'calls_per_second': made / elapsed}
+    return results
+
+
+class _SerialStubServer(icontrol_stub.StubServer):
+    # A stub which, like mcpd, processes one request at a time: latency
+    # grows with the number of requests in flight.
+
+    def __init__(self, *args, **kwargs):
+        import threading
+        icontrol_stub.StubServer.__init__(self, *args, **kwargs)
+        self._busy = threading.Lock()
+
+    def sleep(self, seconds):
+        with self._busy:
+            icontrol_stub.StubServer.sleep(self, seconds)
+
+
+def bench_scheduler(reads, writers, delay):
+    """Times interactive reads made while many threads make bulk writes to
+    a BIGIP which processes one request at a time, with and without a
+    Scheduler."""
+    import threading
+    results = {}
+    for name, scheduler in (
+            ('none', None),
+            ('scheduler', bigsuds.Scheduler(max_concurrent=2))):
+        device = icontrol_stub.StubDevice(pools={'/Common/pool': []})
+        with _SerialStubServer(device, delay=delay) as server:
+            b = bigsuds.BIGIP('127.0.0.1', port=server.port, thread_safe=True,
+                              pool_size=writers + 1, scheduler=scheduler)
+            b.LocalLB.Pool.get_list()
+            done = threading.Event()
+            writes = []
+
+            def write(writer):
+                count = 0
+                while not done.is_set():
+                    b.LocalLB.Pool.create(
+                        ['/Common/bulk_%d_%d' % (writer, count)],
+                        ['LB_METHOD_ROUND_ROBIN'], [[]])
+                    count += 1
+                writes.append(count)
+
+            workers = [threading.Thread(target=write, args=(writer,))
+                       for writer in range(writers)]
+            for worker in workers:
+                worker.start()
+            time.sleep(delay * writers)
+            latencies = []
+            start = time.time()
+            for _ in range(reads):
+                call_start = time.time()
+                b.LocalLB.Pool.get_list()
+                latencies.append(time.time() - call_start)
+            elapsed = time.time() - start
+            done.set()
+            for worker in workers:
+                worker.join()
+            latencies.sort()
+            result = {
+                'reads': reads,
+                'seconds': elapsed,
+                'read_p50_ms': latencies[len(latencies) // 2] * 1000,
+                'read_p90_ms': latencies[int(len(latencies) * 0.9)] * 1000,
+                'writes_per_second': sum(writes) / elapsed}
+            if scheduler is not None:
+                stats = scheduler.stats()
+                result.update(max_waiting=stats['max_waiting'],
+                              wait_seconds=stats['wait_seconds'])
+            results['scheduler_%s' % name] = result
+    return results
+
+
+def bench_result_cache(server, calls):
+    """Times repeated get_list calls with and without a ResultCache."""
+    results = {}
+    for name, cache in (('uncached', None),
+                        ('cached', bigsuds.ResultCache(ttl=60))):
+        b = bigsuds.BIGIP('127.0.0.1', port=server.port, result_cache=cache)
+        start = time.time()
+        for _ in range(calls):
+            b.LocalLB.Pool.get_list()
+        elapsed = time.time() - start
+        results['result_cache_%s' % name] = {
+            'calls': calls,
+            'seconds': elapsed,
+            'calls_per_second': calls / elapsed,
+            'hit_rate': cache and cache.stats()['hit_rate'] or 0.0}
+    return results
+
+
+def _served(function, *args):
+    # Runs a scenario against a fresh stub with a single empty pool.
+    def run(options):
+        device = icontrol_stub.StubDevice(pools={'/Common/pool': []})
+        with icontrol_stub.StubServer(
+                device, recordings=options.recordings) as server:
+            return function(server, *args)
+    return run
+
+
+def _calls(function, *args):
+    # Runs a scenario taking the --calls option.
+    def run(options):
+        device = icontrol_stub.StubDevice(pools={'/Common/pool': []})
+        with icontrol_stub.StubServer(
+                device, recordings=options.recordings) as server:
+            return function(server, options.calls, *args)
+    return run
+
+
+# The scenarios, in the order they are run.
+SCENARIOS = [
+    ('connection_pool', _calls(bench_connection_pool)),
+    ('latency', _calls(bench_latency)),
+    ('auth', _calls(bench_auth)),
+    ('cold_start', _served(bench_cold_start,
+                           sorted(icontrol_stub.INTERFACES))),
+    ('debug_start', _served(bench_debug_start)),
+    ('sessions', _served(bench_sessions, 50)),
+    ('daemon', _served(bench_daemon, 20)),
+    ('arg_processing', _served(bench_arg_processing, (100, 1000, 10000))),
+    ('result_processing', lambda options: bench_result_processing(2000)),
+    ('phases', lambda options: bench_phases(2000)),
+    ('result_formats', lambda options: bench_result_formats(2000)),
+    ('compression', lambda options: bench_compression(2000)),
+    ('statistics_poller', lambda options: bench_statistics_poller(2000, 5)),
+    ('result_cache', _calls(bench_result_cache)),
+    ('call_logging', _served(bench_call_logging, 20000)),
+    ('batch', lambda options: bench_batch(500, 0.002)),
+    ('chunking', lambda options: bench_chunking(2000, 0.2)),
+    ('transaction', lambda options: bench_transaction(200, 0.002)),
+    ('concurrency', lambda options: bench_concurrency(options.calls, 8,
+                                                      0.005)),
+    ('fleet', lambda options: bench_fleet(32, 0.05)),
+    ('scheduler', lambda options: bench_scheduler(20, 16, 0.005)),
+]
+if sys.version_info >= (3, 5):
+    # (A separate module, as Python 2 can't compile coroutines.)
+    from bench_bigsuds_async import bench_async
+    SCENARIOS.append(('async', lambda options: bench_async(200, 0.01)))
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.PIPE).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _format(value):
+    if isinstance(value, float):
+        return '%.4g' % value
+    return str(value)
+
+
+def _print_results(results, baseline=None):
+    for scenario in sorted(results):
+        for name, metrics in sorted(results[scenario].items()):
+            line = '%-18s %-36s ' % (scenario, name)
+            old = ((baseline or {}).get(scenario) or {}).get(name) or {}
+            fields = []
+            for key, value in sorted(metrics.items()):
+                field = '%s=%s' % (key, _format(value))
+                if isinstance(old.get(key), (int, float)) and old[key] and \
+                        isinstance(value, (int, float)):
+                    field += ' (%.2fx)' % (float(value) / old[key])
+                fields.append(field)
+            print(line + '  '.join(fields))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--scenario', action='append',
+                        choices=[name for name, _ in SCENARIOS],
+                        help='a scenario to run (default: all)')
+    parser.add_argument('--recordings',
+                        help='serve the WSDLs and replies recorded in this '
+                             'directory (see icontrol_stub.record)')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare',
+                        help='show the ratios to the results in this file')
+    options = parser.parse_args()
+
+    results = {}
+    try:
+        for name, run in SCENARIOS:
+            if options.scenario and name not in options.scenario:
+                continue
+            # Every scenario starts from unparsed WSDLs (and stubs may reuse
+            # the ports of earlier ones).
+            bigsuds.wsdl_registry.clear()
+            results[name] = run(options)
+    finally:
+        icontrol_stub.cleanup()
+    baseline = None
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)['results']
+    _print_results(results, baseline)
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump({'commit': _commit(),
+                       'python': platform.python_version(),
+                       'bigsuds': bigsuds.__version__,
+                       'calls': options.calls,
+                       'results': results}, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
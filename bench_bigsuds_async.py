@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""The asyncio benchmarks of bench_bigsuds.py (Python 3.5 and newer)."""
+import asyncio
+import time
+
+import bigsuds
+import bigsuds_async
+import icontrol_stub
+from icontrol_stub_async import AsyncStubServer
+
+
+def bench_async(calls, delay):
+    """Times concurrent calls with AsyncBIGIP against sequential ones with
+    BIGIP (Python 3.5 and newer)."""
+    async def run():
+        async with AsyncStubServer(delay=delay) as server:
+            async with bigsuds_async.AsyncBIGIP('127.0.0.1',
+                                                port=server.port) as b:
+                await b.LocalLB.Pool.get_list()
+                start = time.time()
+                await asyncio.gather(*[b.LocalLB.Pool.get_list()
+                                       for _ in range(calls)])
+                return time.time() - start
+
+    loop = asyncio.new_event_loop()
+    try:
+        elapsed = loop.run_until_complete(run())
+    finally:
+        loop.close()
+    results = {'async_gather': {'calls': calls, 'seconds': elapsed}}
+    with icontrol_stub.StubServer(delay=delay) as server:
+        b = bigsuds.BIGIP('127.0.0.1', port=server.port)
+        b.LocalLB.Pool.get_list()
+        start = time.time()
+        for _ in range(calls):
+            b.LocalLB.Pool.get_list()
+        results['async_sequential'] = {'calls': calls,
+                                       'seconds': time.time() - start}
+    return results
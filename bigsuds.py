@@ -11,7 +11,6 @@ try:
     from httplib import BadStatusLine
     from urllib2 import build_opener
     from urllib2 import HTTPBasicAuthHandler
-    from urllib2 import HTTPSHandler
 except ImportError:
      # Python 3.x
      import http.client as httplib
@@ -19,26 +18,51 @@ except ImportError:
      from http.client import BadStatusLine
      from urllib.request import build_opener
      from urllib.request import HTTPBasicAuthHandler
-     from urllib.request import HTTPSHandler
 
 from six import PY2
+from six.moves.urllib.parse import urlsplit
+from io import BytesIO
+import argparse
+import contextlib
+import copy
+import fnmatch
+import getpass
 import logging
+import operator
 import os
+import random
 import re
-import ssl
+import socket
+import threading
+import tempfile
+import time
+from array import array
+from collections import OrderedDict
+from hashlib import sha1
+from multiprocessing.pool import ThreadPool
+from xml.etree import ElementTree
 from xml.sax import SAXParseException
+from six.moves import cPickle as pickle
 
 import suds.client
-from suds.cache import ObjectCache
+from suds.cache import Cache
 from suds.sudsobject import Object as SudsObject
-from suds.client import Client
+from suds.client import Client, ServiceSelector
+from suds.options import Options
+from suds.properties import Unskin
+from suds.sax.enc import Encoder
 from suds.xsd.doctor import ImportDoctor, Import
-from suds.transport import TransportError
-from suds.transport.https import HttpAuthenticated
+from suds.transport import Request, Transport, TransportError
 from suds import WebFault, TypeNotFound, MethodNotFound as _MethodNotFound
 
 import six
 
+from bigsuds_transport import (Compression, ConnectionPool,
+                               HTTPSHandlerNoVerify, HTTPSTransport,
+                               HTTPSTransportNoVerify, PooledHTTPSTransport,
+                               Scheduler, TokenAuth, _READ_PREFIXES,
+                               _basic_auth, _clock, _send_reply, _transport)
+
 __version__ = '1.0.6'
 
 
@@ -46,24 +70,6 @@ __version__ = '1.0.6'
 # https://fedorahosted.org/suds/ticket/376
 suds.client.ObjectCache = lambda **kwargs: None
 
-# We need to add support for SSL Contexts for Python 2.7.9+
-class HTTPSHandlerNoVerify(HTTPSHandler):
-    def __init__(self, *args, **kwargs):
-        try:
-            kwargs['context'] = ssl._create_unverified_context()
-        except AttributeError:
-            # Python prior to 2.7.9 doesn't have default-enabled certificate
-            # verification
-            pass
-
-        HTTPSHandler.__init__(self, *args, **kwargs)
-
-class HTTPSTransportNoVerify(HttpAuthenticated):
-    def u2handlers(self):
-        handlers = HttpAuthenticated.u2handlers(self)
-        handlers.append(HTTPSHandlerNoVerify())
-        return handlers
-
 log = logging.getLogger('bigsuds')
 
 
@@ -90,6 +96,22 @@ class ArgumentError(OperationFailed):
     """Raised when too many arguments or incorrect keyword arguments
     are passed to an iControl method."""
 
+class TransactionError(OperationFailed):
+    """Raised when a call queued by a pipelined L{Transaction} failed. The
+    transaction was rolled back.
+
+    @ivar index: The position of the failed call in the transaction.
+    @ivar method: The full name of its method (e.g. "LocalLB.Pool.create").
+    @ivar error: The L{OperationFailed} error of the call.
+    """
+    def __init__(self, index, method, error):
+        super(TransactionError, self).__init__(
+            'Call %d of the transaction (%s) failed: %s' % (index, method,
+                                                            error))
+        self.index = index
+        self.method = method
+        self.error = error
+
 
 class BIGIP(object):
     """This class exposes the BIGIP's iControl interface.
@@ -115,9 +137,16 @@ class BIGIP(object):
        keyword arguments are passed.
      * All of these exceptions derive from L{OperationFailed}.
     """
+    # The session id of the calls made through the instance.
+    _session_id = None
+
     def __init__(self, hostname, username='admin', password='admin',
                  debug=False, cachedir=None, verify=False, timeout=90,
-                 port=443):
+                 port=443, pool_size=8, pool=None, bundle=None,
+                 fast_parse=False, thread_safe=False, chunk_size=0,
+                 chunk_workers=4, result_cache=None, metrics=None,
+                 share_wsdls=False, result_format='native', token_auth=False,
+                 compression=False, scheduler=None):
         """init
 
         @param hostname: The IP address or hostname of the BIGIP.
@@ -125,25 +154,145 @@ class BIGIP(object):
         @param password: The admin password on the BIGIP.
         @param debug: When True sets up additional interactive features
             like the ability to introspect/tab-complete the list of method
-            names.
-        @param cachedir: The directory to cache wsdls in. None indicates
-            that caching should be disabled.
+            names. The names are available right away; the clients of all
+            namespaces are then created in the background.
+        @param cachedir: The directory to cache parsed wsdls in, or a
+            L{WsdlCache}. None indicates that caching should be disabled.
+            Cached wsdls are keyed on the BIGIP's software version, which
+            is looked up once per instance.
         @param verify: When True, performs SSL certificate validation in
             Python / urllib2 versions that support it (v2.7.9 and newer)
         @param timeout: The time (in seconds) to wait before timing out
             the connection to the URL
+        @param port: The port of the iControl portal.
+        @param pool_size: The number of keep-alive connections to the BIGIP
+            that are kept open and shared by all iControl clients of this
+            instance. 0 disables connection pooling, in which case each
+            request is sent over a new connection.
+        @param pool: An existing L{ConnectionPool} to the same BIGIP to use
+            instead of creating a new one.
+        @param bundle: A L{WsdlBundle} (or the path to one) created by
+            L{compile_bundle}. Clients for namespaces in the bundle are
+            created without fetching or parsing any WSDL. The BIGIP's
+            software version is looked up by the first namespace lookup:
+            a bundle compiled from another version is not used.
+        @param fast_parse: When True, iControl replies are parsed straight
+            from XML into native types, skipping the suds object tree. This
+            is much faster for large replies.
+        @param thread_safe: When True, the instance can be used by many
+            threads at once. Each namespace client is created only once, and
+            every thread makes its calls through its own copy of the suds
+            client (sharing the parsed WSDL). Transactions still need a
+            session per thread (see L{with_session_id}).
+        @param chunk_size: When above 0, calls whose sequence arguments
+            (like pool_names) have more than chunk_size items are split into
+            calls of chunk_size items, which are sent concurrently. Their
+            results are joined in order. Chunked calls are not atomic: when
+            one chunk fails, the others may have been applied.
+        @param chunk_workers: The maximum number of chunks in flight at once
+            (also limited by pool_size).
+        @param result_cache: A L{ResultCache} for the results of read-only
+            methods, which may be shared with sessions of this instance and
+            other instances (each gets its own results). None disables
+            result caching.
+        @param metrics: A callable which is passed a L{CallMetrics} after
+            every iControl call (except streamed calls), e.g. to export
+            latency metrics. Calls answered by the result cache are passed
+            with cached set. It is called by the calling thread, so it
+            should be quick.
+        @param share_wsdls: When True, the parsed WSDLs are kept in the
+            process-wide L{wsdl_registry} and shared with every other
+            instance (and session) for the same hostname, port and software
+            version, which only make their own lightweight copies of the
+            clients. The version is looked up (see L{get_software_version})
+            by the first namespace lookup of each instance.
+        @param result_format: How complex iControl types are returned:
+            "native" returns dicts. "records" returns L{Record}s, which take
+            less memory: one slotted class is generated per iControl type.
+            "columns" returns arrays of structures as dicts of columns (one
+            list per field), and integer fields as arrays (from the array
+            module), with Common.ULong64 values joined into one integer.
+            This takes far less memory for large statistics replies and
+            lets them be aggregated without building an object per row.
+        @param token_auth: When True, logs in once and authenticates
+            requests with a token (see L{TokenAuth}) shared by all the
+            namespace clients and sessions of this instance, instead of
+            the username and password. May also be an existing
+            L{TokenAuth}.
+        @param compression: When True, replies are asked for gzip
+            compressed (see L{Compression}); requests are not compressed.
+            May also be a L{Compression}, e.g. to compress large requests
+            too, shared with sessions of this instance. False (the default)
+            disables compression.
+        @param scheduler: A L{Scheduler} limiting and ordering the
+            iControl calls in flight to the BIGIP, shared with sessions of
+            this instance (and possibly other instances for the BIGIP).
+            True creates one with the default settings. None sends every
+            call right away.
         """
+        if result_format not in _RESULT_PROCESSORS:
+            raise ValueError('result_format must be one of %s' % ', '.join(
+                sorted(_RESULT_PROCESSORS)))
         self._hostname = hostname
         self._port = port
         self._username = username
         self._password = password
         self._debug = debug
+        if isinstance(cachedir, six.string_types):
+            cachedir = WsdlCache(cachedir)
         self._cachedir = cachedir
+        self._cache_view = None
+        self._version = None
         self._verify = verify
         self._timeout = timeout
+        if pool is None and pool_size > 0:
+            pool = ConnectionPool(hostname, port, verify, timeout, pool_size)
+        self._pool = pool
+        if token_auth is True:
+            token_auth = TokenAuth(hostname, username, password, port, verify,
+                                   timeout, pool)
+        self._auth = token_auth or None
+        if compression is True:
+            compression = Compression()
+        self._compression = compression or None
+        if scheduler is True:
+            scheduler = Scheduler()
+        self._scheduler = scheduler or None
+        if isinstance(bundle, six.string_types):
+            bundle = WsdlBundle.load(bundle)
+        self._bundle = bundle
+        self._fast_parse = fast_parse
+        self._thread_safe = thread_safe
+        # debug mode creates clients in the background while the user may
+        # look them up.
+        self._locks = (thread_safe or debug) and _LockMap() or None
+        self._loading = None
+        self._batches = threading.local()
+        self._chunk_size = chunk_size
+        self._chunk_workers = chunk_workers
+        self._chunker = None
+        if chunk_size > 0:
+            if pool is not None:
+                chunk_workers = min(chunk_workers, pool.maxsize)
+            self._chunker = _Chunker(chunk_size, chunk_workers)
+        self._result_cache = result_cache
+        self._metrics = metrics
+        self._share_wsdls = share_wsdls
+        self._result_format = result_format
         if debug:
             self._instantiate_namespaces()
 
+    @property
+    def connection_pool(self):
+        """The L{ConnectionPool} used by this instance (None when connection
+        pooling is disabled)."""
+        return self._pool
+
+    @property
+    def scheduler(self):
+        """The L{Scheduler} of this instance's iControl calls, or None."""
+        return self._scheduler
+
     def with_session_id(self, session_id=None):
         """Returns a new instance of L{BIGIP} that uses a unique session id.
 
@@ -161,9 +310,95 @@ class BIGIP(object):
             fails for some other reason.
         """
         if session_id is None:
-            session_id = self.System.Session.get_session_identifier()
-        return _BIGIPSession(self._hostname, session_id, self._username,
-                             self._password, self._debug, self._cachedir)
+            # Bypasses the result cache and any batch.
+            session_id = self.System.Session.get_session_identifier._send()
+        session = _BIGIPSession(self._hostname, session_id, self._username,
+                                self._password, **self._options())
+        session._version = self._version
+        return session
+
+    def _copy(self, **overrides):
+        # A new instance like this one (in the same session, if any), with
+        # some of its options changed.
+        bigip = BIGIP(self._hostname, self._username, self._password,
+                      **dict(self._options(), **overrides))
+        bigip._version = self._version
+        return bigip
+
+    def _options(self):
+        # The keyword arguments creating an instance like this one (sharing
+        # its connection pool, caches and authentication).
+        return dict(debug=self._debug, cachedir=self._cachedir,
+                    verify=self._verify, timeout=self._timeout,
+                    port=self._port, pool=self._pool,
+                    pool_size=0 if self._pool is None else self._pool.maxsize,
+                    bundle=self._bundle,
+                    fast_parse=self._fast_parse,
+                    thread_safe=self._thread_safe,
+                    chunk_size=self._chunk_size,
+                    chunk_workers=self._chunk_workers,
+                    result_cache=self._result_cache, metrics=self._metrics,
+                    share_wsdls=self._share_wsdls,
+                    result_format=self._result_format,
+                    token_auth=self._auth, compression=self._compression,
+                    scheduler=self._scheduler)
+
+    @contextlib.contextmanager
+    def batch(self, max_size=1000):
+        """Returns a context manager which batches the iControl calls made
+        inside it (by the current thread).
+
+        Consecutive calls to the same method whose arguments are all
+        sequences (like pool_names) are merged into one call of up to
+        max_size items, and its result is split back between the calls.
+        This turns one round trip per object into one per max_size objects.
+        The other calls are sent in order, as usual.
+
+        Every call returns a L{BatchedCall}. Batched calls are sent when a
+        call to another method is made, when max_size items are queued, when
+        the result of a queued call is asked for and when the with block
+        exits. If the with block raises, the calls still queued are
+        discarded instead.
+
+        When a merged call fails, read calls (get_, query_ and is_ methods)
+        are made again one by one, so that each gets its own result or
+        error. Other calls may have been partly applied by the device, so
+        they all fail with the error of the merged call.
+
+        Example:
+            >>> with b.batch():
+            ...     members = [b.LocalLB.Pool.get_member([name])
+            ...                for name in pool_names]
+            >>> print members[0].result()
+            [[{'port': 80, 'address': '10.10.10.10'}]]
+
+        Batches can't be used inside a pipelined L{Transaction}, which
+        already queues every call.
+
+        @param max_size: The maximum number of items per merged call.
+        @return: The L{Batch}, usable as the value of the with statement.
+        @raise RuntimeError: When used inside a pipelined L{Transaction}.
+        """
+        previous = getattr(self._batches, 'batch', None)
+        if isinstance(previous, _TransactionQueue):
+            # The merged calls would be sent right away, outside of the
+            # transaction.
+            raise RuntimeError('batch() can not be used inside a pipelined '
+                               'Transaction')
+        batch = Batch(max_size)
+        self._batches.batch = batch
+        try:
+            yield batch
+        except BaseException:
+            # Don't send the calls queued before the with block failed.
+            batch.discard()
+            raise
+        finally:
+            self._batches.batch = previous
+            batch.flush()
+
+    def _current_batch(self):
+        return getattr(self._batches, 'batch', None)
 
     def __getattr__(self, attr):
         if attr.startswith('__'):
@@ -172,15 +407,51 @@ class BIGIP(object):
             # Backwards compatibility with pycontrol:
             first, second = attr.split('_', 1)
             return getattr(getattr(self, first), second)
-        ns = _Namespace(attr, self._create_client)
-        setattr(self, attr, ns)
+        if self._locks is None:
+            ns = _Namespace(attr, self._create_client)
+            setattr(self, attr, ns)
+            return ns
+        with self._locks(attr):
+            # Another thread may have created it in the meantime.
+            ns = self.__dict__.get(attr)
+            if ns is None:
+                ns = _Namespace(attr, self._create_client, self._locks)
+                setattr(self, attr, ns)
         return ns
 
+    def _software_version(self):
+        # Returns the BIGIP's software version, looking it up on first use.
+        if self._version is None:
+            self._version = get_software_version(
+                self._hostname, self._username, self._password, self._verify,
+                self._timeout, self._port, self._pool, self._auth)
+        return self._version
+
+    def _wsdl_cache(self):
+        # Returns the cache for this BIGIP's software version.
+        if isinstance(self._cachedir, WsdlCache):
+            if self._cache_view is None:
+                self._cache_view = self._cachedir.view(
+                    self._hostname, self._port, self._software_version())
+            return self._cache_view
+        return self._cachedir
+
     def _create_client(self, wsdl_name):
         try:
-            client = get_client(self._hostname, wsdl_name, self._username,
-                                self._password, self._cachedir, self._verify,
-                                self._timeout,self._port)
+            if self._share_wsdls:
+                client = wsdl_registry.get(
+                    self._hostname, self._port, self._software_version(),
+                    wsdl_name, lambda: self._registered_client(wsdl_name))
+                transport = _transport(self._username, self._password,
+                                       self._verify, self._timeout,
+                                       self._pool, self._auth,
+                                       self._compression, self._scheduler)
+                client = _clone_client(client, transport=transport,
+                                       username=self._username,
+                                       password=self._password,
+                                       timeout=self._timeout)
+            else:
+                client = self._get_client(wsdl_name)
         except SAXParseException as e:
             raise ParseError('%s\nFailed to parse wsdl. Is "%s" a valid '
                     'namespace?' % (e, wsdl_name))
@@ -189,23 +460,95 @@ class BIGIP(object):
             raise ConnectionError(str(e))
         return self._create_client_wrapper(client, wsdl_name)
 
+    def _registered_client(self, wsdl_name):
+        # The client kept by the WSDL registry is only copied, so it doesn't
+        # need (and must not keep alive) this instance's transport, with its
+        # credentials and connection pool.
+        client = self._get_client(wsdl_name)
+        client.set_options(transport=Transport())
+        return client
+
+    def _get_client(self, wsdl_name):
+        return get_client(self._hostname, wsdl_name, self._username,
+                          self._password, self._wsdl_cache(), self._verify,
+                          self._timeout, self._port, self._pool,
+                          self._checked_bundle(), self._auth,
+                          self._compression, self._scheduler)
+
+    def _checked_bundle(self):
+        # Returns the bundle, unless it was compiled from another software
+        # version than the BIGIP's (its WSDLs would describe another schema).
+        bundle = self._bundle
+        if bundle is not None and bundle.version is not None and \
+                bundle.version != self._software_version():
+            log.warning('Not using the WSDL bundle of version %s for %s, '
+                        'which runs version %s', bundle.version,
+                        self._hostname, self._software_version())
+            bundle = self._bundle = None
+        return bundle
+
     def _create_client_wrapper(self, client, wsdl_name):
-        return _ClientWrapper(client,
+        wrapper_class = _ClientWrapper
+        if self._thread_safe:
+            wrapper_class = _ThreadSafeClientWrapper
+        return wrapper_class(client,
             self._arg_processor_factory,
-            _NativeResultProcessor,
+            self._result_processor_factory,
             wsdl_name,
-            self._debug)
+            self._debug,
+            self._current_batch,
+            self._chunker,
+            self._result_cache,
+            self._metrics,
+            (self._hostname, self._port, self._session_id))
 
     def _arg_processor_factory(self, client, method):
         return _DefaultArgProcessor(method, client.factory)
 
-    def _instantiate_namespaces(self):
-        wsdl_hierarchy = get_wsdls(self._hostname, self._username,
-                                   self._password, self._verify,
-                                   self._timeout, self._port)
+    def _result_processor_factory(self, client, method):
+        return _RESULT_PROCESSORS[self._result_format](
+            method, client.factory, self._fast_parse)
+
+    def _instantiate_namespaces(self, workers=8):
+        wsdl_hierarchy = self._wsdl_hierarchy()
+        wsdl_names = []
         for namespace, attr_list in six.iteritems(wsdl_hierarchy):
             ns = getattr(self, namespace)
             ns.set_attr_list(attr_list)
+            wsdl_names.extend((namespace, attr) for attr in attr_list)
+
+        def load(names):
+            try:
+                _lookup(self, names)
+            except OperationFailed:
+                log.debug('Failed to load %s.%s', *names, exc_info=True)
+
+        # Fetching and parsing every WSDL takes a while, so it is done in the
+        # background. Namespaces looked up in the meantime are created by the
+        # caller (or waited for, when already being created).
+        pool = ThreadPool(workers)
+        self._loading = pool.map_async(load, wsdl_names)
+        pool.close()
+
+    def _wsdl_hierarchy(self):
+        # Returns the get_wsdls() result, from the WSDL registry or cache if
+        # possible.
+        if self._share_wsdls:
+            return wsdl_registry.get(self._hostname, self._port,
+                                     self._software_version(), None,
+                                     self._load_wsdl_hierarchy)
+        return self._load_wsdl_hierarchy()
+
+    def _load_wsdl_hierarchy(self):
+        cache = self._wsdl_cache()
+        wsdl_hierarchy = cache is not None and cache.get('wsdls') or None
+        if wsdl_hierarchy is None:
+            wsdl_hierarchy = get_wsdls(self._hostname, self._username,
+                                       self._password, self._verify,
+                                       self._timeout, self._port, self._auth)
+            if cache is not None:
+                cache.put('wsdls', wsdl_hierarchy)
+        return wsdl_hierarchy
 
 class Transaction(object):
     """This class is a context manager for iControl transactions.
@@ -224,16 +567,56 @@ class Transaction(object):
     > bigip = BIGIP(<args>)
     > with Transaction(bigip.use_session_id()) as bigip:
     >     <perform actions inside a transaction>
+
+    A pipelined transaction queues the calls made inside the with statement
+    (by the current thread) instead of sending them one at a time. Each call
+    is checked and serialized when it is made and returns a L{BatchedCall}.
+    Upon exit, the transaction is started and the queued calls are sent
+    back to back over one connection, and it is submitted once they have
+    all been queued by the BIGIP. When one of them fails, the transaction
+    is rolled back and L{TransactionError} is raised.
+    > with Transaction(bigip.with_session_id(), pipelined=True) as bigip:
+    >     for name in pool_names:
+    >         bigip.LocalLB.Pool.create([name], [lb_method], [[]])
     """
-    def __init__(self, bigip):
+    def __init__(self, bigip, pipelined=False, workers=1, depth=16):
+        """init
+
+        @param bigip: The L{BIGIP} to make the transaction on.
+        @param pipelined: When True, calls are queued and sent all at once.
+        @param workers: The number of connections a pipelined transaction
+            sends its calls over. Above 1, calls are sent concurrently, so
+            the BIGIP may queue them in any order: only use it for calls
+            which don't depend on each other.
+        @param depth: The maximum number of calls sent ahead of the reply
+            being read on a connection.
+        """
         self.bigip = bigip
+        self.pipelined = pipelined
+        self.workers = workers
+        self.depth = depth
+        self._queue = None
+        self._previous = None
 
     def __enter__(self):
+        if self.pipelined:
+            self._queue = _TransactionQueue(self.bigip, self.workers,
+                                            self.depth)
+            self._previous = self.bigip._current_batch()
+            self.bigip._batches.batch = self._queue
+            return self.bigip
         self.bigip.System.Session.start_transaction()
         return self.bigip
 
     def __exit__(self, excy_type, exc_value, exc_tb):
-        if exc_tb is None:
+        if self._queue is not None:
+            queue, self._queue = self._queue, None
+            self.bigip._batches.batch = self._previous
+            if exc_tb is None:
+                queue.submit()
+            else:
+                queue.rollback()
+        elif exc_tb is None:
             self.bigip.System.Session.submit_transaction()
         else:
             try:
@@ -245,8 +628,541 @@ class Transaction(object):
                 pass
 
 
+class _TransactionQueue(object):
+    # The calls queued by a pipelined Transaction. It takes the place of the
+    # active Batch of the BIGIP, so that wrapped methods add their calls to
+    # it.
+    def __init__(self, bigip, workers, depth):
+        self._bigip = bigip
+        self._workers = workers
+        self._depth = depth
+        self._pending = []
+        self._count = 0
+        self._started = False
+        self._error = None
+
+    def add(self, method, args, kwargs):
+        call = BatchedCall(self)
+        wsdl_name, name = method._wsdl_name, method._method.method.name
+        if log.isEnabledFor(logging.DEBUG):
+            _log_call('Queueing', wsdl_name, name, args, kwargs)
+        # Raises ArgumentError right away for invalid arguments.
+        args, kwargs, request = _build_request(
+            method._method, method._arg_processor, args, kwargs)
+        self._pending.append((call, method, args, kwargs, request))
+        return call
+
+    def flush(self):
+        # Sends the queued calls, starting the transaction first.
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        if not self._started:
+            self._bigip.System.Session.start_transaction._call()
+            self._started = True
+        replies = self._send(pending[0][1]._method.client.options.transport,
+                             [request for _, _, _, _, request in pending])
+        for call, method, args, kwargs, _ in pending:
+            reply = replies.pop(0)
+            try:
+                with _translated_errors():
+                    if isinstance(reply, TransportError):
+                        _reply_error(method._method, args, kwargs, reply)
+                        reply = None
+                    call._value = _process_reply(
+                        method._method, method._result_processor, reply)
+                    call._done = True
+            except OperationFailed as e:
+                call._error = e
+                if self._error is None:
+                    self._error = TransactionError(
+                        self._count, '%s.%s' % (method._wsdl_name,
+                                                method._method.method.name),
+                        e)
+            self._count += 1
+            if method._cache is not None:
+                method._cache.invalidate(method._wsdl_name)
+
+    def submit(self):
+        self.flush()
+        if self._error is not None:
+            self.rollback()
+            raise self._error
+        if self._started:
+            self._bigip.System.Session.submit_transaction._call()
+
+    def rollback(self):
+        if not self._started:
+            # Nothing was sent.
+            return
+        try:
+            self._bigip.System.Session.rollback_transaction._call()
+        # See Transaction.__exit__.
+        except ServerError:
+            pass
+
+    def _send(self, transport, requests):
+        # Returns the reply body, None or TransportError of each request.
+        with _translated_errors():
+            if self._workers > 1 and len(requests) > 1:
+                pool = ThreadPool(min(self._workers, len(requests)))
+                try:
+                    return pool.map(
+                        lambda request: _send_reply(transport, request),
+                        requests)
+                finally:
+                    pool.close()
+            if isinstance(transport, PooledHTTPSTransport):
+                return transport.send_pipelined(requests, self._depth)
+            return [_send_reply(transport, request) for request in requests]
+
+
+class BIGIPFleet(object):
+    """This class runs iControl calls against many BIGIPs in parallel.
+
+    Calls are made like on a L{BIGIP} and run on every BIGIP of the fleet,
+    over a bounded pool of worker threads. They return a L{FleetResult}
+    mapping each hostname to its result, or to the L{OperationFailed}
+    raised for it.
+
+    Example usage:
+        >>> fleet = BIGIPFleet(['bigip-1', 'bigip-2:8443'])
+        >>> print fleet.LocalLB.Pool.get_list()
+        {'bigip-1': ['/Common/test_pool'], 'bigip-2:8443': []}
+
+    The parsed WSDLs are shared by all BIGIPs running the same software
+    version (through a L{WsdlBundle} per version), so each namespace is
+    only fetched and parsed once per version rather than once per BIGIP.
+    A bundle passed to the fleet (see L{compile_bundle}) is the bundle of
+    its version.
+    """
+    def __init__(self, hostnames, username='admin', password='admin',
+                 max_workers=16, **kwargs):
+        """init
+
+        @param hostnames: The hostnames (or IP addresses) of the BIGIPs,
+            optionally followed by ":<port>". IPv6 addresses followed by a
+            port are written in brackets, e.g. "[2001:db8::1]:8443".
+        @param username: The admin username on the BIGIPs.
+        @param password: The admin password on the BIGIPs.
+        @param max_workers: The maximum number of BIGIPs called at the same
+            time.
+        @param kwargs: Further arguments for every L{BIGIP}.
+        """
+        self.hostnames = list(hostnames)
+        self._username = username
+        self._password = password
+        self._max_workers = max_workers
+        self._kwargs = kwargs
+        self._bigips = {}
+        self._bundles = {}
+        bundle = kwargs.get('bundle')
+        if isinstance(bundle, six.string_types):
+            bundle = kwargs['bundle'] = WsdlBundle.load(bundle)
+        if bundle is not None and bundle.version is not None:
+            self._bundles[bundle.version] = bundle
+        self._parsed = set()
+        self._locks = _LockMap()
+        self._lock = threading.Lock()
+        self._workers = None
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            return getattr(super(BIGIPFleet, self), attr)
+        return _FleetAttribute(self, (attr,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+    def bigip(self, hostname):
+        """Returns the L{BIGIP} used for one of the fleet's hostnames."""
+        return self._bigip(hostname)[0]
+
+    def map(self, function):
+        """Calls function with the L{BIGIP} of every hostname, in parallel.
+
+        Unlike calls made on the fleet directly, namespaces first used by
+        function may be parsed by several BIGIPs of a version at once.
+
+        @param function: A callable taking a L{BIGIP}.
+        @return: A L{FleetResult} of the return values of function.
+        """
+        return self._run(lambda hostname: function(self.bigip(hostname)))
+
+    def close(self):
+        """Stops the worker threads and closes all connections."""
+        with self._lock:
+            workers, self._workers = self._workers, None
+            bigips = list(self._bigips.values())
+        if workers is not None:
+            workers.terminate()
+            workers.join()
+        for bigip, _ in bigips:
+            if bigip.connection_pool is not None:
+                bigip.connection_pool.close()
+
+    def _run(self, function):
+        # Calls function(hostname) for every hostname on the worker threads.
+        def call(hostname):
+            try:
+                return hostname, function(hostname)
+            except OperationFailed as e:
+                return hostname, e
+        with self._lock:
+            if self._workers is None:
+                self._workers = ThreadPool(
+                    max(1, min(self._max_workers, len(self.hostnames))))
+            workers = self._workers
+        return FleetResult(workers.map(call, self.hostnames))
+
+    def _call(self, hostname, names, args, kwargs):
+        bigip, version = self._bigip(hostname)
+        # The first lookup of a namespace for a version holds a lock, so that
+        # it is parsed once and then loaded from the version's bundle by the
+        # other BIGIPs, instead of being parsed by all of them at once.
+        key = (version,) + names[:-1]
+        target = None
+        if key not in self._parsed:
+            with self._locks(key):
+                if key not in self._parsed:
+                    target = _lookup(bigip, names[:-1])
+                    self._parsed.add(key)
+        if target is None:
+            target = _lookup(bigip, names[:-1])
+        return getattr(target, names[-1])(*args, **kwargs)
+
+    def _bigip(self, hostname):
+        # Returns the BIGIP for hostname and its software version, creating
+        # it on first use.
+        with self._locks(hostname):
+            try:
+                return self._bigips[hostname]
+            except KeyError:
+                pass
+            kwargs = dict(self._kwargs)
+            host, port = _split_hostname(hostname, kwargs.pop('port', 443))
+            bigip = _FleetBIGIP(self._version_bundle, host, self._username,
+                                self._password, port=port, **kwargs)
+            # The version is looked up first (over the BIGIP's own
+            # connections and token) to give it the bundle of its version.
+            try:
+                version = bigip._software_version()
+            except OperationFailed:
+                if kwargs.get('pool') is None and \
+                        bigip.connection_pool is not None:
+                    bigip.connection_pool.close()
+                raise
+            bigip._checked_bundle()
+            self._bigips[hostname] = bigip, version
+            return bigip, version
+
+    def _version_bundle(self, version):
+        # Returns the bundle shared by the BIGIPs running version.
+        with self._lock:
+            return self._bundles.setdefault(version, WsdlBundle(version))
+
+
+class _FleetBIGIP(BIGIP):
+    # A BIGIP of a fleet. It uses the fleet's bundle of its software
+    # version, unless it was given a bundle which applies to it.
+    def __init__(self, version_bundle, *args, **kwargs):
+        self._version_bundle = version_bundle
+        BIGIP.__init__(self, *args, **kwargs)
+
+    def _checked_bundle(self):
+        bundle = BIGIP._checked_bundle(self)
+        if bundle is None:
+            bundle = self._bundle = self._version_bundle(
+                self._software_version())
+        return bundle
+
+
+def _split_hostname(hostname, port):
+    # Splits a "host:port" of a fleet (or "[IPv6 address]:port") into the
+    # host (with an IPv6 address in brackets, as in URLs) and port. Hosts
+    # without a port use the default port.
+    if hostname.count(':') > 1 and not hostname.startswith('['):
+        # A bare IPv6 address.
+        return '[%s]' % hostname, port
+    parts = urlsplit('//' + hostname)
+    host = parts.hostname
+    if ':' in host:
+        host = '[%s]' % host
+    return host, parts.port or port
+
+
+def _lookup(obj, names):
+    for name in names:
+        obj = getattr(obj, name)
+    return obj
+
+
+class _FleetAttribute(object):
+    # An attribute path (like ("LocalLB", "Pool", "get_list")) looked up on a
+    # BIGIPFleet. Calling it calls the method on every BIGIP of the fleet.
+    def __init__(self, fleet, names):
+        self._fleet = fleet
+        self._names = names
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            return getattr(super(_FleetAttribute, self), attr)
+        return _FleetAttribute(self._fleet, self._names + (attr,))
+
+    def __call__(self, *args, **kwargs):
+        fleet, names = self._fleet, self._names
+        return fleet._run(
+            lambda hostname: fleet._call(hostname, names, args, kwargs))
+
+
+class FleetResult(dict):
+    """The results of a call on a L{BIGIPFleet}, by hostname.
+
+    The value for a hostname is the call's result or, if it failed, the
+    L{OperationFailed} exception it raised.
+    """
+    @property
+    def succeeded(self):
+        """A dict of the results of the hostnames where the call
+        succeeded."""
+        return dict((hostname, value) for hostname, value in self.items()
+                    if not isinstance(value, OperationFailed))
+
+    @property
+    def failed(self):
+        """A dict of the exceptions of the hostnames where the call
+        failed."""
+        return dict((hostname, value) for hostname, value in self.items()
+                    if isinstance(value, OperationFailed))
+
+
+class StatisticsPoller(object):
+    """Polls the statistics of a BIGIP's objects and reports the objects
+    whose counters changed since the previous poll, with their deltas and
+    rates.
+
+    Example:
+        >>> poller = StatisticsPoller(b, 'LocalLB.VirtualServer')
+        >>> poller.poll()  # The first poll only takes the baseline.
+        []
+        >>> for change in poller.poll():
+        ...     print change.key, change.rate('STATISTIC_CLIENT_SIDE_BYTES_IN')
+        /Common/vs_http 15034.2
+
+    Replies are parsed straight from XML into columns (see the "columns"
+    result format of L{BIGIP}), which joins the high and low halves of the
+    64-bit counters, and each sample is kept as one flat array of counters.
+    When the objects are the same as on the previous poll, the deltas are
+    computed over the whole array at once, and an object whose counters
+    didn't change costs one comparison of two slices of arrays, so CPU and
+    memory stay low with thousands of objects.
+    """
+    def __init__(self, bigip, wsdl_name='LocalLB.Pool',
+                 method='get_all_statistics', args=(), kwargs=None):
+        """init
+
+        @param bigip: The L{BIGIP} to poll. Its connection pool,
+            authentication and session (if any) are shared, the result
+            format and result cache aren't.
+        @param wsdl_name: The namespace of the statistics method (e.g.
+            "LocalLB.VirtualServer").
+        @param method: A method returning a statistics structure (or a list
+            of them, one per item of its first argument, like
+            LocalLB.PoolMember.get_all_statistics).
+        @param args: The arguments of the method.
+        @param kwargs: The keyword arguments of the method.
+        """
+        self._bigip = bigip._copy(debug=False, fast_parse=True,
+                                  result_format='columns', result_cache=None,
+                                  chunk_size=0)
+        self._names = wsdl_name.split('.') + [method]
+        self._args = tuple(args)
+        self._kwargs = kwargs or {}
+        self._sample = None
+        # Every distinct list of statistic types is kept once.
+        self._types = {}
+
+    def poll(self):
+        """Calls the statistics method.
+
+        @return: A list of L{StatisticsChange}s, one per object whose
+            counters changed since the previous poll. The first poll returns
+            an empty list, and so do objects on the poll where they first
+            appear.
+        """
+        method = _lookup(self._bigip, self._names)
+        result = method(*self._args, **self._kwargs)
+        sample = self._sample_of(result, _first_argument(method, self._args,
+                                                         self._kwargs))
+        previous, self._sample = self._sample, sample
+        if previous is None:
+            return []
+        return list(self._changes(previous, sample))
+
+    def watch(self, interval=10):
+        """Polls every interval seconds (forever), and yields the changes
+        of each poll."""
+        while True:
+            start = _clock()
+            for change in self.poll():
+                yield change
+            time.sleep(max(0, interval - (_clock() - start)))
+
+    def _sample_of(self, result, names):
+        entries = result['statistics']
+        if isinstance(entries, dict):
+            groups = [(None, entries)]
+        else:
+            # The columns of an array of statistics structures, one per item
+            # of the first argument (e.g. per pool).
+            groups = zip(names or range(len(entries)), entries)
+        keys = []
+        types = []
+        offsets = array('L', [0])
+        values = array(_UINT64)
+        for prefix, entries in groups:
+            if not entries:
+                continue
+            columns = _key_columns(entries)
+            if len(columns) == 1:
+                group_keys = columns[0]
+            else:
+                group_keys = zip(*columns)
+            if prefix is not None:
+                group_keys = [(prefix, key) for key in group_keys]
+            keys.extend(group_keys)
+            for statistics in entries['statistics']:
+                values.extend(statistics['value'])
+                offsets.append(len(values))
+                statistic_types = tuple(statistics['type'])
+                types.append(self._types.setdefault(statistic_types,
+                                                    statistic_types))
+        return _StatisticsSample(keys, types, offsets, values, _clock())
+
+    def _changes(self, previous, sample):
+        new, old = sample.values, previous.values
+        offsets, old_offsets = sample.offsets, previous.offsets
+        seconds = sample.time - previous.time
+        if previous.keys == sample.keys and previous.types == sample.types \
+                and old_offsets == offsets:
+            if new == old:
+                return
+            deltas = list(map(operator.sub, new, old))
+            for row in range(len(sample.keys)):
+                start, end = offsets[row], offsets[row + 1]
+                current = new[start:end]
+                if current != old[start:end]:
+                    yield StatisticsChange(sample.keys[row], sample.types[row],
+                                           current, deltas[start:end],
+                                           seconds)
+            return
+        # Objects were added, removed or reordered.
+        index = dict((key, row) for row, key in enumerate(previous.keys))
+        for row, key in enumerate(sample.keys):
+            old_row = index.get(key)
+            if old_row is None or \
+                    sample.types[row] is not previous.types[old_row]:
+                continue
+            current = new[offsets[row]:offsets[row + 1]]
+            before = old[old_offsets[old_row]:old_offsets[old_row + 1]]
+            if current != before:
+                yield StatisticsChange(
+                    key, sample.types[row], current,
+                    list(map(operator.sub, current, before)), seconds)
+
+
+def _first_argument(wrapped_method, args, kwargs):
+    # Returns the value of the first parameter of a call, whether it was
+    # passed by position or by keyword, or None.
+    if args:
+        return args[0]
+    argspec = getattr(wrapped_method._arg_processor, '_argspec', None)
+    if not argspec:
+        return None
+    return kwargs.get(argspec[0][0])
+
+
+class _StatisticsSample(object):
+    # The counters of every object of a poll: the counters of the object
+    # keys[i], of types[i], are values[offsets[i]:offsets[i + 1]].
+    __slots__ = ('keys', 'types', 'offsets', 'values', 'time')
+
+    def __init__(self, keys, types, offsets, values, time):
+        self.keys = keys
+        self.types = types
+        self.offsets = offsets
+        self.values = values
+        self.time = time
+
+
+def _key_columns(entries):
+    # Returns the columns identifying the objects of a statistics array:
+    # every column but the statistics, with structures (like a pool
+    # member's address and port) flattened.
+    columns = []
+    for name in sorted(entries):
+        column = entries[name]
+        if name == 'statistics':
+            continue
+        if isinstance(column, dict):
+            columns.extend(_key_columns(column))
+        else:
+            columns.append(column)
+    return columns
+
+
+class StatisticsChange(object):
+    """The counters of an object which changed between two polls of a
+    L{StatisticsPoller}.
+
+    @ivar key: The object: the value of its identifying field (e.g. the pool
+        name), or a tuple of them (e.g. a pool member's address and port).
+        For methods taking a list of names, it is a tuple of the name and
+        the object's key.
+    @ivar types: The statistic types (e.g. "STATISTIC_SERVER_SIDE_BYTES_IN").
+    @ivar values: The counters, in the same order.
+    @ivar deltas: The differences with the counters of the previous poll.
+        Gauges (like current connections) which went down and counters which
+        were reset have negative deltas.
+    @ivar seconds: The time between the two polls.
+    """
+    __slots__ = ('key', 'types', 'values', 'deltas', 'seconds')
+
+    def __init__(self, key, types, values, deltas, seconds):
+        self.key = key
+        self.types = types
+        self.values = values
+        self.deltas = deltas
+        self.seconds = seconds
+
+    def __repr__(self):
+        return '<StatisticsChange %r: %d changed in %.1fs>' % (
+            self.key, len(self.deltas) - self.deltas.count(0), self.seconds)
+
+    def rates(self):
+        """Returns the deltas per second."""
+        seconds = float(self.seconds)
+        return [delta / seconds for delta in self.deltas]
+
+    def value(self, statistic_type):
+        """Returns the counter of a statistic type."""
+        return self.values[self.types.index(statistic_type)]
+
+    def delta(self, statistic_type):
+        """Returns the delta of a statistic type."""
+        return self.deltas[self.types.index(statistic_type)]
+
+    def rate(self, statistic_type):
+        """Returns the delta per second of a statistic type."""
+        return self.delta(statistic_type) / float(self.seconds)
+
+
 def get_client(hostname, wsdl_name, username='admin', password='admin',
-               cachedir=None, verify=False, timeout=90, port=443):
+               cachedir=None, verify=False, timeout=90, port=443, pool=None,
+               bundle=None, auth=None, compression=None, scheduler=None):
     """Returns and instance of suds.client.Client.
 
     A separate client is used for each iControl WSDL/Namespace (e.g.
@@ -258,30 +1174,53 @@ def get_client(hostname, wsdl_name, username='admin', password='admin',
     @param wsdl_name: The iControl namespace (e.g. "LocalLB.Pool")
     @param username: The admin username on the BIGIP.
     @param password: The admin password on the BIGIP.
-    @param cachedir: The directory to cache wsdls in. None indicates
-        that caching should be disabled.
+    @param cachedir: The directory to cache parsed wsdls in, a L{WsdlCache}
+        or any other suds cache. None indicates that caching should be
+        disabled. For a directory or a L{WsdlCache}, the BIGIP's software
+        version is looked up to key the cached wsdls on.
     @param verify: When True, performs SSL certificate validation in
         Python / urllib2 versions that support it (v2.7.9 and newer)
     @param timeout: The time to wait (in seconds) before timing out
         the connection to the URL
+    @param port: The port of the iControl portal.
+    @param pool: A L{ConnectionPool} to send requests over. When None, a new
+        connection is made for every request.
+    @param bundle: A L{WsdlBundle}. When it contains wsdl_name, the parsed
+        WSDL is loaded from it instead of being fetched from the BIGIP.
+        Otherwise the WSDL is added to it once parsed.
+    @param auth: A L{TokenAuth} to authenticate with instead of the username
+        and password.
+    @param compression: A L{Compression} of the requests and replies
+        (including the WSDL). None disables compression.
+    @param scheduler: A L{Scheduler} limiting the iControl calls in flight.
     """
     url = 'https://%s:%s/iControl/iControlPortal.cgi?WSDL=%s' % (
             hostname, port, wsdl_name)
     imp = Import('http://schemas.xmlsoap.org/soap/encoding/')
     imp.filter.add('urn:iControl')
 
-    if cachedir is not None:
-        cachedir = ObjectCache(location=os.path.expanduser(cachedir), days=1)
+    options = {}
+    if bundle is not None and wsdl_name in bundle:
+        cachedir = None
+    elif cachedir is not None:
+        if isinstance(cachedir, six.string_types):
+            cachedir = WsdlCache(cachedir)
+        if isinstance(cachedir, WsdlCache):
+            version = get_software_version(hostname, username, password,
+                                           verify, timeout, port, pool, auth)
+            cachedir = cachedir.view(hostname, port, version)
+        # Cache the parsed WSDL definitions rather than the XML documents.
+        options['cachingpolicy'] = 1
+    if bundle is not None:
+        cachedir = _BundleCache(bundle, wsdl_name, cachedir)
+        options['cachingpolicy'] = 1
 
     doctor = ImportDoctor(imp)
-    if verify:
-        client = Client(url, doctor=doctor, username=username, password=password,
-                        cache=cachedir, timeout=timeout)
-    else:
-        transport = HTTPSTransportNoVerify(username=username,
-                                           password=password, timeout=timeout)
-        client = Client(url, doctor=doctor, username=username, password=password,
-                        cache=cachedir, transport=transport, timeout=timeout)
+    transport = _transport(username, password, verify, timeout, pool, auth,
+                           compression, scheduler)
+    client = Client(url, doctor=doctor, username=username, password=password,
+                    cache=cachedir, transport=transport, timeout=timeout,
+                    **options)
 
     # Without this, subsequent requests will use the actual hostname of the
     # BIGIP, which is often times invalid.
@@ -291,7 +1230,7 @@ def get_client(hostname, wsdl_name, username='admin', password='admin',
 
 
 def get_wsdls(hostname, username='admin', password='admin', verify=False,
-              timeout=90, port=443):
+              timeout=90, port=443, auth=None):
     """Returns the set of all available WSDLs on this server
 
     Used for providing introspection into the available namespaces and WSDLs
@@ -304,6 +1243,9 @@ def get_wsdls(hostname, username='admin', password='admin', verify=False,
         Python / urllib2 versions that support it (v2.7.9 and newer)
     @param timeout: The time to wait (in seconds) before timing out the connection
         to the URL
+    @param port: The port of the iControl portal.
+    @param auth: A L{TokenAuth} to authenticate with instead of the username
+        and password.
     """
     url = 'https://%s:%s/iControl/iControlPortal.cgi' % (hostname, port)
     regex = re.compile(r'/iControl/iControlPortal.cgi\?WSDL=([^"]+)"')
@@ -319,13 +1261,20 @@ def get_wsdls(hostname, username='admin', password='admin', verify=False,
         opener = build_opener(auth_handler)
     else:
         opener = build_opener(auth_handler, HTTPSHandlerNoVerify)
+    # Send the credentials up front rather than waiting for the challenge
+    # (the handler still answers one, e.g. if the token was rejected).
+    if auth is not None:
+        opener.addheaders.extend(auth.headers().items())
+    else:
+        opener.addheaders.append(('Authorization',
+                                  _basic_auth(username, password)))
     try:
         result = opener.open(url, timeout=timeout)
     except URLError as e:
         raise ConnectionError(str(e))
 
     wsdls = {}
-    for line in result.readlines():
+    for line in result.read().decode('utf-8', 'replace').splitlines():
         result = regex.search(line)
         if result:
             namespace, rest = result.groups()[0].split(".", 1)
@@ -335,15 +1284,636 @@ def get_wsdls(hostname, username='admin', password='admin', verify=False,
     return wsdls
 
 
+_PRODUCT_INFORMATION_REQUEST = (
+    b'<?xml version="1.0" encoding="UTF-8"?>'
+    b'<SOAP-ENV:Envelope '
+    b'xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/" '
+    b'SOAP-ENV:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">'
+    b'<SOAP-ENV:Body><m:get_product_information '
+    b'xmlns:m="urn:iControl:System/SystemInfo"/></SOAP-ENV:Body>'
+    b'</SOAP-ENV:Envelope>')
+
+
+def get_software_version(hostname, username='admin', password='admin',
+                         verify=False, timeout=90, port=443, pool=None,
+                         auth=None):
+    """Returns the software version and build of the BIGIP.
+
+    This makes a single System.SystemInfo.get_product_information call
+    without loading any WSDL.
+
+    @param hostname: The IP address or hostname of the BIGIP.
+    @param username: The admin username on the BIGIP.
+    @param password: The admin password on the BIGIP.
+    @param verify: When True, performs SSL certificate validation.
+    @param timeout: The time to wait (in seconds) before timing out the
+        connection to the BIGIP.
+    @param port: The port of the iControl portal.
+    @param pool: A L{ConnectionPool} to send the request over.
+    @param auth: A L{TokenAuth} to authenticate with instead of the username
+        and password.
+    @return: The version and build, e.g. "12.1.2 0.0.249".
+    """
+    if pool is None:
+        pool = ConnectionPool(hostname, port, verify, timeout, maxsize=0)
+    headers = {'Content-Type': 'text/xml; charset=utf-8',
+               'SOAPAction': 'urn:iControl:System/SystemInfo'}
+    if auth is not None:
+        headers.update(auth.headers())
+    else:
+        headers['Authorization'] = _basic_auth(username, password)
+    try:
+        status, reason, _, body = pool.request(
+            'POST', '/iControl/iControlPortal.cgi',
+            _PRODUCT_INFORMATION_REQUEST, headers)
+    except (socket.error, httplib.HTTPException) as e:
+        raise ConnectionError(str(e))
+    if status != httplib.OK:
+        raise ConnectionError('Getting the BIGIP version failed: %s %s' % (
+            status, reason))
+    try:
+        root = ElementTree.fromstring(body)
+    except ElementTree.ParseError as e:
+        raise ParseError("Failed to parse the BIGIP's response: %s" % e)
+    fields = dict((el.tag.rsplit('}', 1)[-1], el.text) for el in root.iter())
+    return '%s %s' % (fields.get('product_version'),
+                      fields.get('package_build'))
+
+
+class WsdlCache(object):
+    """An on-disk cache of parsed WSDLs which many processes can share.
+
+    Entries are keyed on the BIGIP's hostname, port and software version
+    (and the suds version, which determines the pickle format), so an
+    upgraded BIGIP never gets served the WSDLs of its previous version.
+    Entries are written atomically (to a temporary file which is then
+    renamed), so concurrent readers and writers never see partial files.
+    The least recently used entries are removed once the cache holds more
+    than max_entries entries or max_bytes bytes.
+
+    A L{BIGIP} only uses the cache through a view (see L{view}), which
+    implements the suds cache interface.
+    """
+    _SUFFIX = '.wsdl'
+
+    def __init__(self, location, max_entries=1024, max_bytes=None):
+        """init
+
+        @param location: The directory to store entries in. It is created
+            if it doesn't exist.
+        @param max_entries: The maximum number of entries to keep.
+        @param max_bytes: The maximum total size of the entries to keep.
+            None means unlimited.
+        """
+        self.location = os.path.expanduser(location)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(
+            ('hits', 'misses', 'writes', 'evictions', 'errors'), 0)
+        if not os.path.isdir(self.location):
+            try:
+                os.makedirs(self.location)
+            except OSError:
+                # Another process may have created it in the meantime.
+                if not os.path.isdir(self.location):
+                    raise
+
+    def stats(self):
+        """Returns a dict of the hits, misses, writes, evictions and
+        errors (unreadable entries) of this cache in this process."""
+        with self._lock:
+            return dict(self._stats)
+
+    def view(self, hostname, port, version):
+        """Returns a suds cache for the WSDLs of one BIGIP."""
+        return _WsdlCacheView(self, '%s:%s:%s:%s' % (
+            hostname, port, version, suds.__version__))
+
+    def get(self, key):
+        """Returns the object stored for key, or None."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (IOError, OSError):
+            self._count('misses')
+            return None
+        except Exception:
+            log.warning('Removing unreadable WSDL cache entry %s', path,
+                        exc_info=True)
+            self._count('errors')
+            self._remove(path)
+            return None
+        self._count('hits')
+        try:
+            # Record the access for the LRU eviction.
+            os.utime(path, None)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        """Stores value for key, evicting old entries when needed."""
+        try:
+            _atomic_write(self._path(key),
+                          pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        except (IOError, OSError):
+            log.warning('Failed to write WSDL cache entry', exc_info=True)
+            return
+        self._count('writes')
+        self._evict()
+
+    def clear(self):
+        """Removes all entries."""
+        for path, _ in self._entries():
+            self._remove(path)
+
+    def _path(self, key):
+        name = sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.location, name + self._SUFFIX)
+
+    def _entries(self):
+        # Returns [(path, stat)] of all entries, least recently used first.
+        entries = []
+        for name in os.listdir(self.location):
+            if not name.endswith(self._SUFFIX):
+                continue
+            path = os.path.join(self.location, name)
+            try:
+                entries.append((path, os.stat(path)))
+            except OSError:
+                pass
+        entries.sort(key=lambda entry: entry[1].st_mtime)
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(st.st_size for _, st in entries)
+        while entries and (len(entries) > self.max_entries or
+                           (self.max_bytes is not None and
+                            total > self.max_bytes)):
+            path, st = entries.pop(0)
+            total -= st.st_size
+            if self._remove(path):
+                self._count('evictions')
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+
+# The read-only methods whose results must never be reused.
+_UNCACHEABLE_METHODS = frozenset(['get_session_identifier'])
+
+
+class ResultCache(object):
+    """A read-through cache of the results of read-only iControl methods.
+
+    Results are cached per BIGIP (hostname and port), session, namespace,
+    method and arguments for ttl seconds, so a cache can be shared by
+    several BIGIPs and their sessions. Calling any other method of a namespace (through the L{BIGIP} using the
+    cache) removes the cached results of the namespace, since it may have
+    changed them. Changes made otherwise (by other clients, or through
+    another namespace, like LocalLB.PoolMember for LocalLB.Pool) are only
+    seen once the results expire.
+
+    Cached results are copied when returned, so callers may modify them.
+    """
+    def __init__(self, ttl=1.0, max_entries=10000, read_only=None,
+                 ttls=None):
+        """init
+
+        @param ttl: The time (in seconds) to cache results for.
+        @param max_entries: The maximum number of results to keep. The least
+            recently used ones are removed first.
+        @param read_only: The shell-style pattern (see fnmatch) of the
+            methods whose results are cached. None caches the methods
+            which only read (get_*, query_* and is_*), like batches and
+            schedulers consider them. Methods returning a new value
+            on each call (like System.Session.get_session_identifier) are
+            never cached.
+        @param ttls: A dict of TTLs by method name, either full (e.g.
+            "System.SystemInfo.get_version") or short (e.g. "get_version").
+            A TTL of 0 disables caching for the method.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.ttls = dict(ttls or {})
+        self._read_only = None
+        if read_only is not None:
+            self._read_only = re.compile(fnmatch.translate(read_only))
+        self._entries = OrderedDict()
+        self._epoch = 0
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(
+            ('hits', 'misses', 'expired', 'evictions', 'invalidations'), 0)
+
+    def stats(self):
+        """Returns a dict of the hits, misses, expired (misses of expired
+        results), evictions and invalidations of this cache, its size and its
+        hit_rate."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = lookups and float(stats['hits']) / lookups or 0.0
+        return stats
+
+    def clear(self):
+        """Removes all cached results."""
+        self.invalidate()
+
+    def invalidate(self, wsdl_name=None):
+        """Removes the cached results of a namespace (e.g. "LocalLB.Pool"),
+        or all cached results when wsdl_name is None."""
+        with self._lock:
+            self._stats['invalidations'] += 1
+            for key in list(self._entries):
+                if wsdl_name is None or key[0] == wsdl_name:
+                    del self._entries[key]
+            # Results of calls in flight are not cached either.
+            if wsdl_name is None:
+                self._epoch += 1
+            else:
+                self._generations[wsdl_name] = \
+                    self._generations.get(wsdl_name, 0) + 1
+
+    def _is_read_only(self, method_name):
+        if self._read_only is None:
+            return method_name.startswith(_READ_PREFIXES)
+        return self._read_only.match(method_name) is not None
+
+    def call(self, wsdl_name, method_name, key, function, args, kwargs,
+             scope=None):
+        """Returns function(*args, **kwargs) for the method, from the cache
+        if possible.
+
+        @param key: A hashable key for the arguments, or None when the call
+            can't be cached.
+        @param scope: A hashable key for the BIGIP and session the call is
+            made to, like (hostname, port, session_id). Results are only
+            reused for calls of the same scope.
+        """
+        if method_name in _UNCACHEABLE_METHODS:
+            return function(*args, **kwargs)
+        if not self._is_read_only(method_name):
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.invalidate(wsdl_name)
+        ttl = self.ttls.get('%s.%s' % (wsdl_name, method_name),
+                            self.ttls.get(method_name, self.ttl))
+        if key is None or ttl <= 0:
+            return function(*args, **kwargs)
+        key = (wsdl_name, method_name, scope, key)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and entry[0] > time.time():
+                self._entries[key] = entry
+                self._stats['hits'] += 1
+                return copy.deepcopy(entry[1])
+            self._stats['misses'] += 1
+            if entry is not None:
+                self._stats['expired'] += 1
+            generation = (self._epoch, self._generations.get(wsdl_name, 0))
+        value = function(*args, **kwargs)
+        entry = (time.time() + ttl, copy.deepcopy(value))
+        with self._lock:
+            if (self._epoch,
+                    self._generations.get(wsdl_name, 0)) == generation:
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._stats['evictions'] += 1
+        return value
+
+
+def _call_key(arg_processor, args, kwargs):
+    # Returns a hashable key for the arguments of a call (keyword arguments
+    # are put in parameter order), or None.
+    argspec = getattr(arg_processor, '_argspec', None)
+    if argspec is None:
+        return None
+    names = [name for name, _ in argspec]
+    if len(args) > len(names):
+        return None
+    values = dict(zip(names, args))
+    for name, value in six.iteritems(kwargs):
+        if name not in names or name in values:
+            return None
+        values[name] = value
+    try:
+        return tuple(_freeze(values.get(name)) for name in names)
+    except TypeError:
+        return None
+
+
+def _freeze(value):
+    # Returns a hashable version of a (native) iControl argument.
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item))
+                            for key, item in six.iteritems(value)))
+    if isinstance(value, SudsObject):
+        raise TypeError('suds objects are mutable')
+    hash(value)
+    return value
+
+
+class _WsdlCacheView(Cache):
+    # The suds cache interface to the entries of a WsdlCache for one BIGIP.
+    def __init__(self, cache, scope):
+        self.cache = cache
+        self.scope = scope
+
+    def get(self, id):
+        return self.cache.get('%s:%s' % (self.scope, id))
+
+    def put(self, id, object):
+        self.cache.put('%s:%s' % (self.scope, id), object)
+        return object
+
+    def purge(self, id):
+        self.cache._remove(self.cache._path('%s:%s' % (self.scope, id)))
+
+    def clear(self):
+        self.cache.clear()
+
+
+class WsdlBundle(object):
+    """A set of iControl WSDLs that were fetched and parsed ahead of time.
+
+    Bundles are created with L{compile_bundle} (or "bigsuds.py bundle" on
+    the command line) and passed to L{BIGIP} with the bundle argument. A
+    bundle only applies to BIGIPs running the version it was compiled from.
+
+    Each WSDL is stored individually pickled so that loading a bundle is
+    cheap and only the namespaces that are used get unpickled.
+
+    WSDLs which a L{BIGIP} has to fetch because they are missing from its
+    bundle are added to the bundle (in memory), so that other BIGIPs using
+    the same bundle don't fetch and parse them again.
+
+    @ivar version: The software version and build of the BIGIP the WSDLs
+        came from, as returned by L{get_software_version}, or None when the
+        bundle may be used with any BIGIP.
+    """
+    _FORMAT = 1
+
+    def __init__(self, version=None):
+        """init
+
+        @param version: The BIGIP software version the WSDLs came from, as
+            returned by L{get_software_version} (e.g. "12.1.2 0.0.249").
+        """
+        self.version = version
+        self._wsdls = {}
+
+    def __contains__(self, wsdl_name):
+        return wsdl_name in self._wsdls
+
+    def __len__(self):
+        return len(self._wsdls)
+
+    def names(self):
+        """Returns the sorted list of WSDL names in this bundle."""
+        return sorted(self._wsdls)
+
+    def add(self, wsdl_name, definitions):
+        """Adds parsed WSDL definitions (a suds client's wsdl attribute)."""
+        self._wsdls[wsdl_name] = pickle.dumps(definitions,
+                                              pickle.HIGHEST_PROTOCOL)
+
+    def definitions(self, wsdl_name):
+        """Returns a new copy of the parsed definitions for wsdl_name."""
+        return pickle.loads(self._wsdls[wsdl_name])
+
+    def save(self, path):
+        """Writes the bundle to path."""
+        state = {'format': self._FORMAT,
+                 'suds': suds.__version__,
+                 'version': self.version,
+                 'wsdls': self._wsdls}
+        _atomic_write(os.path.expanduser(path),
+                      pickle.dumps(state, pickle.HIGHEST_PROTOCOL))
+
+    @classmethod
+    def load(cls, path):
+        """Reads a bundle written by L{save}.
+
+        @raise ValueError: When the file is not a bundle usable by this
+            version of bigsuds and suds.
+        """
+        with open(os.path.expanduser(path), 'rb') as f:
+            state = pickle.load(f)
+        if not isinstance(state, dict) or state.get('format') != cls._FORMAT:
+            raise ValueError('%s is not a bigsuds WSDL bundle' % path)
+        if state['suds'] != suds.__version__:
+            raise ValueError('%s was compiled with suds %s, but suds %s is '
+                             'installed' % (path, state['suds'],
+                                            suds.__version__))
+        bundle = cls(state['version'])
+        bundle._wsdls = state['wsdls']
+        return bundle
+
+
+def _atomic_write(path, data):
+    # Writes data to a temporary file next to path and renames it over path,
+    # so that readers never see a partially written file.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        getattr(os, 'replace', os.rename)(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+class _BundleCache(Cache):
+    # A suds cache for a single WSDL of a WsdlBundle. A WSDL missing from the
+    # bundle is looked up in the fallback cache, and added to both once
+    # parsed.
+    def __init__(self, bundle, wsdl_name, fallback=None):
+        self._bundle = bundle
+        self._wsdl_name = wsdl_name
+        self._fallback = fallback
+
+    def get(self, id):
+        if self._wsdl_name in self._bundle:
+            return self._bundle.definitions(self._wsdl_name)
+        if self._fallback is None:
+            return None
+        definitions = self._fallback.get(id)
+        if definitions is not None:
+            self._bundle.add(self._wsdl_name, definitions)
+        return definitions
+
+    def put(self, id, object):
+        self._bundle.add(self._wsdl_name, object)
+        if self._fallback is not None:
+            self._fallback.put(id, object)
+        return object
+
+    def purge(self, id):
+        pass
+
+    def clear(self):
+        pass
+
+
+def compile_bundle(hostname, path, wsdl_names=None, username='admin',
+                   password='admin', verify=False, timeout=90, port=443):
+    """Fetches and parses WSDLs from a BIGIP and saves them as a bundle.
+
+    @param hostname: The IP address or hostname of the BIGIP.
+    @param path: The file to write the L{WsdlBundle} to.
+    @param wsdl_names: The iControl namespaces to include (e.g.
+        ["LocalLB.Pool", "System.SystemInfo"]). None includes every WSDL
+        available on the BIGIP.
+    @param username: The admin username on the BIGIP.
+    @param password: The admin password on the BIGIP.
+    @param verify: When True, performs SSL certificate validation.
+    @param timeout: The time to wait (in seconds) before timing out the
+        connection to the BIGIP.
+    @param port: The port of the iControl portal.
+    @return: The L{WsdlBundle} that was written.
+    """
+    bigip = BIGIP(hostname, username, password, verify=verify,
+                  timeout=timeout, port=port)
+    if wsdl_names is None:
+        wsdls = get_wsdls(hostname, username, password, verify, timeout,
+                          port)
+        wsdl_names = ['%s.%s' % (namespace, name) for namespace, names in
+                      six.iteritems(wsdls) for name in names]
+    bundle = WsdlBundle(bigip._software_version())
+    for wsdl_name in sorted(wsdl_names):
+        log.debug('Adding %s to the bundle', wsdl_name)
+        bundle.add(wsdl_name, bigip._create_client(wsdl_name)._client.wsdl)
+    bundle.save(path)
+    return bundle
+
+
+class WsdlRegistry(object):
+    """The parsed WSDLs of the BIGIPs this process talks to, by hostname,
+    port, software version and namespace.
+
+    L{BIGIP} instances (and their sessions) created with share_wsdls=True
+    share the suds client which parsed a namespace's WSDL, and each only
+    makes its own copy of it, with its own credentials, headers and
+    transport. So only the first instance fetches and parses WSDLs, and
+    creating more (e.g. with L{BIGIP.with_session_id}) is cheap.
+
+    Since entries are keyed on the software version, an upgraded BIGIP
+    never gets the WSDLs of its previous version. Up to max_entries entries
+    are kept, least recently used first out.
+    """
+    def __init__(self, max_entries=1024):
+        """init
+
+        @param max_entries: The maximum number of entries kept.
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._locks = _LockMap()
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(('hits', 'misses', 'evictions'), 0)
+
+    def get(self, hostname, port, version, name, create):
+        """Returns the entry for a namespace of a BIGIP.
+
+        @param hostname: The IP address or hostname of the BIGIP.
+        @param port: The port of the iControl portal.
+        @param version: The software version of the BIGIP (see
+            L{get_software_version}).
+        @param name: The iControl namespace (e.g. "LocalLB.Pool"), or None
+            for the list of namespaces (see L{get_wsdls}).
+        @param create: A function which returns the entry when it isn't
+            registered yet. It is called only once, even when many threads
+            ask for the entry at the same time. Exceptions propagate, and
+            nothing is registered.
+        """
+        key = (hostname, port, version, name)
+        entry = self._lookup(key)
+        if entry is None:
+            with self._locks(key):
+                # Another thread may have created it in the meantime.
+                entry = self._lookup(key)
+                if entry is None:
+                    entry = create()
+                    with self._lock:
+                        self._entries[key] = entry
+                        self._stats['misses'] += 1
+                        while len(self._entries) > self.max_entries:
+                            self._entries.popitem(last=False)
+                            self._stats['evictions'] += 1
+                    return entry
+        self._count('hits')
+        return entry
+
+    def clear(self, hostname=None, port=None):
+        """Removes the entries of a BIGIP (or of all of them).
+
+        @param hostname: The hostname to remove the entries of. None
+            removes the entries of all BIGIPs.
+        @param port: The port to remove the entries of. None removes the
+            entries of all ports.
+        """
+        with self._lock:
+            for key in list(self._entries):
+                if hostname in (None, key[0]) and port in (None, key[1]):
+                    del self._entries[key]
+
+    def stats(self):
+        """Returns the number of lookups answered from the registry (hits),
+        the number of entries created (misses) and evicted (evictions), and
+        the number of entries."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        return stats
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+            return entry
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+
 class _BIGIPSession(BIGIP):
     def __init__(self, hostname, session_id, username='admin', password='admin',
-                 debug=False, cachedir=None):
+                 debug=False, cachedir=None, **kwargs):
         super(_BIGIPSession, self).__init__(hostname, username=username,
-              password=password, debug=debug, cachedir=cachedir)
+              password=password, debug=debug, cachedir=cachedir, **kwargs)
+        self._session_id = session_id
         self._headers = {'X-iControl-Session': str(session_id)}
 
+    def _copy(self, **overrides):
+        session = _BIGIPSession(self._hostname, self._session_id,
+                                self._username, self._password,
+                                **dict(self._options(), **overrides))
+        session._version = self._version
+        return session
+
     def _create_client_wrapper(self, client, wsdl_name):
-        client.set_options(headers=self._headers)
+        # Each client gets its own copy, so that changing the headers of one
+        # client never affects the others.
+        client.set_options(headers=dict(self._headers))
         return super(_BIGIPSession, self)._create_client_wrapper(client, wsdl_name)
 
 
@@ -357,16 +1927,20 @@ class _Namespace(object):
     Example:
         <LocalLB namespace>.Pool returns the iControl client for "LocalLB.Pool"
     """
-    def __init__(self, name, client_creator):
+    def __init__(self, name, client_creator, locks=None):
         """init
 
         @param name: The high-level namespace (e.g "LocalLB").
         @param client_creator: A function that will be passed the full
             namespace string (e.g. "LocalLB.Pool") and should return
             some type of iControl client.
+        @param locks: A L{_LockMap}. When given, clients are created while
+            holding the lock of their full namespace, so that threads using
+            the namespace at the same time create a client only once.
         """
         self._name = name
         self._client_creator = client_creator
+        self._locks = locks
         self._attrs = []
 
     def __dir__(self):
@@ -376,8 +1950,17 @@ class _Namespace(object):
     def __getattr__(self, attr):
         if attr.startswith('__'):
             return getattr(super(_Namespace, self), attr)
-        client = self._client_creator('%s.%s' % (self._name, attr))
-        setattr(self, attr, client)
+        wsdl_name = '%s.%s' % (self._name, attr)
+        if self._locks is None:
+            client = self._client_creator(wsdl_name)
+            setattr(self, attr, client)
+            return client
+        with self._locks(wsdl_name):
+            # Another thread may have created it in the meantime.
+            client = self.__dict__.get(attr)
+            if client is None:
+                client = self._client_creator(wsdl_name)
+                setattr(self, attr, client)
         return client
 
     def set_attr_list(self, attr_list):
@@ -388,7 +1971,8 @@ class _ClientWrapper(object):
     """A wrapper class that abstracts/extends the suds client API.
     """
     def __init__(self, client, arg_processor_factory, result_processor_factory,
-                 wsdl_name, debug=False):
+                 wsdl_name, debug=False, batches=None, chunker=None,
+                 cache=None, metrics=None, cache_scope=None):
         """init
 
         @param client: An instance of suds.client.Client.
@@ -398,18 +1982,30 @@ class _ClientWrapper(object):
             instance of L{_ArgProcessor}.
         @param result_processor_factory: This will be called to create
             processors for results returned from suds methods. This callable
-            will be passed no arguments and should return an instance of
-            L{_ResultProcessor}.
+            will be passed the suds client and method and should return an
+            instance of L{_ResultProcessor}.
+        @param batches: A callable returning the active L{Batch} (or None),
+            see L{_wrap_method}.
+        @param chunker: A L{_Chunker} splitting large calls, or None.
+        @param cache: A L{ResultCache}, or None.
+        @param metrics: The metrics hook (see L{BIGIP}), or None.
+        @param cache_scope: The scope of the cached results, see
+            L{ResultCache.call}.
         """
         self._client = client
         self._arg_factory = arg_processor_factory
         self._result_factory = result_processor_factory
         self._wsdl_name = wsdl_name
+        self._batches = batches
+        self._chunker = chunker
+        self._cache = cache
+        self._metrics = metrics
+        self._cache_scope = cache_scope
         self._usage = {}
+        self._method_names = []
 
-        # This populates self.__dict__. Helpful for tab completion.
-        # I'm not sure if this slows things down much. Maybe we should just
-        # always do it.
+        # The method names are listed by __dir__, which is helpful for tab
+        # completion. The methods are wrapped on first use.
         if debug:
             # Extract the documentation from the WSDL (before populating
             # self.__dict__)
@@ -421,8 +2017,12 @@ class _ClientWrapper(object):
                     usage = doc.getText().strip()
                 self._usage[op.get("name")] = usage
 
-            for method in client.sd[0].ports[0][1]:
-                getattr(self, method[0])
+            self._method_names = [method[0]
+                                  for method in client.sd[0].ports[0][1]]
+
+    def __dir__(self):
+        return sorted(set(dir(type(self)) + list(self.__dict__) +
+                          self._method_names))
 
     def __getattr__(self, attr):
         # Looks up the corresponding suds method and returns a wrapped version.
@@ -435,8 +2035,13 @@ class _ClientWrapper(object):
         wrapper = _wrap_method(method,
                 self._wsdl_name,
                 self._arg_factory(self._client, method),
-                self._result_factory(),
-                attr in self._usage and self._usage[attr] or None)
+                self._result_factory(self._client, method),
+                attr in self._usage and self._usage[attr] or None,
+                self._batches,
+                self._chunker,
+                self._cache,
+                self._metrics,
+                self._cache_scope)
         setattr(self, attr, wrapper)
         return wrapper
 
@@ -446,7 +2051,97 @@ class _ClientWrapper(object):
         return str(self._client)
 
 
-def _wrap_method(method, wsdl_name, arg_processor, result_processor, usage):
+class _ThreadSafeClientWrapper(_ClientWrapper):
+    """A L{_ClientWrapper} which many threads can use at once.
+
+    suds clients keep per-call state (like their last sent and received
+    messages) and options, so each thread calls methods through its own
+    clone of the client. The clones share the parsed WSDL and the argument
+    and result processors.
+    """
+    def __init__(self, *args, **kwargs):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._processors = {}
+        super(_ThreadSafeClientWrapper, self).__init__(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        # Wrapped methods are cached per thread instead of on the instance.
+        local = self._local
+        try:
+            return local.methods[attr]
+        except AttributeError:
+            local.client = _clone_client(self._client)
+            local.methods = {}
+        except KeyError:
+            pass
+        try:
+            method = getattr(local.client.service, attr)
+        except _MethodNotFound as e:
+            e.__class__ = MethodNotFound
+            raise
+
+        with self._lock:
+            processors = self._processors.get(attr)
+            if processors is None:
+                base_method = getattr(self._client.service, attr)
+                processors = self._processors[attr] = (
+                    self._arg_factory(self._client, base_method),
+                    self._result_factory(self._client, base_method))
+        wrapper = _wrap_method(method,
+                self._wsdl_name,
+                processors[0],
+                processors[1],
+                attr in self._usage and self._usage[attr] or None,
+                self._batches,
+                self._chunker,
+                self._cache,
+                self._metrics,
+                self._cache_scope)
+        local.methods[attr] = wrapper
+        return wrapper
+
+
+def _clone_client(client, **overrides):
+    # Returns a copy of a suds client which shares its parsed WSDL, but has
+    # its own options, transport and last sent/received messages. (suds'
+    # Client.clone() deep copies the options, which fails on recent Python
+    # versions.) overrides replaces some of the copied options.
+    options = dict(Unskin(client.options).defined)
+    if overrides.get('transport') is None:
+        overrides['transport'] = copy.deepcopy(client.options.transport)
+    options['headers'] = dict(client.options.headers)
+    options.update(overrides)
+    clone = copy.copy(client)
+    clone.options = Options()
+    clone.set_options(**options)
+    clone.service = ServiceSelector(clone, client.wsdl.services)
+    clone.messages = dict(tx=None, rx=None)
+    return clone
+
+
+class _LockMap(object):
+    # Hands out one lock per key, created on first use.
+    def __init__(self):
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, key):
+        with self._lock:
+            try:
+                return self._locks[key]
+            except KeyError:
+                lock = self._locks[key] = threading.Lock()
+                return lock
+
+
+# The registry used by all BIGIPs created with share_wsdls=True.
+wsdl_registry = WsdlRegistry()
+
+
+def _wrap_method(method, wsdl_name, arg_processor, result_processor, usage,
+                 batches=None, chunker=None, cache=None, metrics=None,
+                 cache_scope=None):
     """
     This function wraps a suds method and returns a new function which
     provides argument/result processing.
@@ -457,10 +2152,25 @@ def _wrap_method(method, wsdl_name, arg_processor, result_processor, usage):
     The return value from the underlying suds method will be passed to the
     specified result_processor prior to being returned to the caller.
 
+    The returned function has a stream() method taking the same arguments,
+    which returns a generator over the items of the returned array (or of
+    the only array in the returned structure, like the iControl statistics
+    types) as they are parsed from the reply. This keeps the memory used by
+    calls with very large replies constant.
+
     @param method: A suds method (can be obtained via
         client.service.<method_name>).
     @param arg_processor: An instance of L{_ArgProcessor}.
     @param result_processor: An instance of L{_ResultProcessor}.
+    @param batches: A callable returning the active L{Batch}, or None. While
+        there is one, calls are added to it instead of being made directly.
+    @param chunker: A L{_Chunker}, or None. Calls with more sequence items
+        than its size are split into chunks sent concurrently.
+    @param cache: A L{ResultCache}, or None.
+    @param metrics: A callable passed a L{CallMetrics} for every call, or
+        None.
+    @param cache_scope: The scope of the cached results (see
+        L{ResultCache.call}).
 
     """
 
@@ -473,39 +2183,619 @@ def _wrap_method(method, wsdl_name, arg_processor, result_processor, usage):
             wsdl_name, method.method.name, icontrol_sig)
 
     def wrapped_method(*args, **kwargs):
-        log.debug('Executing iControl method: %s.%s(%s, %s)',
-                  wsdl_name, method.method.name, args, kwargs)
+        batch = batches is not None and batches()
+        if batch:
+            return batch.add(wrapped_method, args, kwargs)
+        return call(*args, **kwargs)
+
+    def call(*args, **kwargs):
+        if cache is None:
+            return send(*args, **kwargs)
+        key = _call_key(arg_processor, args, kwargs)
+        if metrics is not None:
+            return _measured_cache_call(metrics, cache, wsdl_name,
+                                        method.method.name, key, send, args,
+                                        kwargs, cache_scope)
+        return cache.call(wsdl_name, method.method.name, key, send, args,
+                          kwargs, cache_scope)
+
+    def send(*args, **kwargs):
+        if log.isEnabledFor(logging.DEBUG):
+            _log_call('Executing', wsdl_name, method.method.name, args,
+                      kwargs)
+        chunks = None
+        if chunker is not None:
+            chunks = chunker.split(_batch_spec(wrapped_method), args, kwargs)
+        if metrics is not None:
+            return _measured_call(metrics, wsdl_name, wrapped_method, chunker,
+                                  chunks, args, kwargs)
+        if chunks is not None:
+            return chunker.run(wrapped_method, chunks)
+        request = _direct_request(method, arg_processor, args, kwargs)
+        if request is not None:
+            with _translated_errors():
+                return _process_reply(method, result_processor,
+                                      _send_raw(method, (), {}, request))
         args, kwargs = arg_processor.process(args, kwargs)
-        # This exception wrapping is purely for pycontrol compatability.
-        # Maybe we want to make this optional and put it in a separate class?
-        try:
+        with _translated_errors():
+            if result_processor.parses_xml:
+                return result_processor.process_xml(
+                    _send_raw(method, args, kwargs))
             result = method(*args, **kwargs)
-        except AttributeError:
-            # Oddly, this seems to happen when the wrong password is used.
-            raise ConnectionError('iControl call failed, possibly invalid '
-                    'credentials.')
-        except _MethodNotFound as e:
-            e.__class__ = MethodNotFound
-            raise
-        except WebFault as e:
-            e.__class__ = ServerError
-            raise
-        except URLError as e:
-            raise ConnectionError('URLError: %s' % str(e))
-        except BadStatusLine as e:
-            raise ConnectionError('BadStatusLine: %s' %  e)
-        except SAXParseException as e:
-            raise ParseError("Failed to parse the BIGIP's response. This "
-                "was likely caused by a 500 error message.")
         return result_processor.process(result)
 
+    def stream(*args, **kwargs):
+        if log.isEnabledFor(logging.DEBUG):
+            _log_call('Streaming', wsdl_name, method.method.name, args,
+                      kwargs)
+        args, kwargs = arg_processor.process(args, kwargs)
+        with _translated_errors():
+            reply = _open_raw(method, args, kwargs)
+        return _translated_iter(result_processor.process_stream(reply))
+
     wrapped_method.__doc__ = usage
     wrapped_method.__name__ = str(method.method.name)
     # It's occasionally convenient to be able to grab the suds object directly
     wrapped_method._method = method
+    wrapped_method._arg_processor = arg_processor
+    wrapped_method._result_processor = result_processor
+    wrapped_method._call = call
+    wrapped_method._send = send
+    wrapped_method._wsdl_name = wsdl_name
+    wrapped_method._cache = cache
+    wrapped_method.stream = stream
     return wrapped_method
 
 
+def set_call_logging(max_items=3, max_length=80, sample_rate=1.0):
+    """Configures the debug logging of iControl calls (to the "bigsuds"
+    logger).
+
+    Arguments are summarized, so that logging calls with huge arguments
+    stays cheap: sequences are logged as their first max_items items and
+    their length, and strings are cut to max_length characters.
+
+    @param max_items: The number of items of a sequence to log.
+    @param max_length: The number of characters of a string to log.
+    @param sample_rate: The fraction (between 0 and 1) of calls to log.
+    """
+    global _call_logging
+    _call_logging = (max_items, max_length, sample_rate)
+
+
+_call_logging = (3, 80, 1.0)
+
+
+def _log_call(action, wsdl_name, method_name, args, kwargs):
+    # Logs a call with its arguments summarized (see set_call_logging).
+    max_items, max_length, sample_rate = _call_logging
+    if sample_rate < 1 and random.random() >= sample_rate:
+        return
+    arguments = [_summarize(arg, max_items, max_length) for arg in args]
+    arguments.extend('%s=%s' % (name, _summarize(value, max_items,
+                                                 max_length))
+                     for name, value in sorted(kwargs.items()))
+    log.debug('%s iControl method: %s.%s(%s)', action, wsdl_name,
+              method_name, ', '.join(arguments))
+
+
+def _summarize(value, max_items, max_length, depth=0):
+    # Returns a short repr of an argument.
+    if depth > 3:
+        return '...'
+    if isinstance(value, (list, tuple)):
+        items = [_summarize(item, max_items, max_length, depth + 1)
+                 for item in value[:max_items]]
+        if len(value) > max_items:
+            items.append('... (%d items)' % len(value))
+        return '[%s]' % ', '.join(items)
+    if isinstance(value, dict):
+        return '{%s}' % ', '.join(
+            '%r: %s' % (key, _summarize(item, max_items, max_length,
+                                        depth + 1))
+            for key, item in sorted(value.items()))
+    if isinstance(value, six.string_types) and len(value) > max_length:
+        return '%r... (%d chars)' % (value[:max_length], len(value))
+    return repr(value)
+
+
+class Batch(object):
+    """The calls queued by L{BIGIP.batch}."""
+    def __init__(self, max_size=1000):
+        """init
+
+        @param max_size: The maximum number of items per merged call.
+        """
+        self.max_size = max_size
+        self._method = None
+        self._pending = []
+        self._size = 0
+
+    def add(self, method, args, kwargs):
+        """Queues a call of a wrapped method.
+
+        @return: A L{BatchedCall}.
+        """
+        call = BatchedCall(self)
+        values = _batch_spec(method).bind(args, kwargs)
+        if values is None:
+            # This call can't be merged, send it in turn.
+            self.flush()
+            call._run(method._call, args, kwargs)
+            return call
+        size = len(values[0])
+        if self._pending and (self._method is not method or
+                              self._size + size > self.max_size):
+            self.flush()
+        self._method = method
+        self._pending.append((call, values))
+        self._size += size
+        if self._size >= self.max_size:
+            self.flush()
+        return call
+
+    def discard(self):
+        """Drops the queued calls without sending them. Their result raises
+        L{OperationFailed}.
+        """
+        error = OperationFailed('The call was discarded before being sent.')
+        for call, _ in self._pending:
+            call._error = error
+        self._method, self._pending, self._size = None, [], 0
+
+    def flush(self):
+        """Sends the queued calls."""
+        method, pending = self._method, self._pending
+        self._method, self._pending, self._size = None, [], 0
+        if len(pending) == 1:
+            pending[0][0]._run(method._call, pending[0][1], {})
+        if len(pending) < 2:
+            return
+        merged = [[] for _ in pending[0][1]]
+        for _, values in pending:
+            for items, value in zip(merged, values):
+                items.extend(value)
+        try:
+            result = method._call(*merged)
+            parts = method._batch_spec.split(
+                result, [len(values[0]) for _, values in pending])
+        except (ServerError, ArgumentError) as e:
+            if not method.__name__.startswith(_READ_PREFIXES):
+                # The items before the bad one may have been applied, making
+                # them again could apply them twice.
+                for call, _ in pending:
+                    call._error = e
+                return
+            # A single bad item fails the merged call. Make the calls one by
+            # one, so that each gets its own result or error.
+            for call, values in pending:
+                call._run(method._call, values, {})
+            return
+        except OperationFailed as e:
+            for call, _ in pending:
+                call._error = e
+            return
+        for (call, _), part in zip(pending, parts):
+            call._value = part
+            call._done = True
+
+
+class BatchedCall(object):
+    """The pending result of a call made inside L{BIGIP.batch}."""
+    def __init__(self, batch):
+        self._batch = batch
+        self._done = False
+        self._value = None
+        self._error = None
+
+    def done(self):
+        """Returns True once the call has been sent."""
+        return self._done or self._error is not None
+
+    def result(self):
+        """Returns the result of the call, sending the batch first if it
+        hasn't been sent yet.
+
+        @raise OperationFailed: When the call failed.
+        """
+        if not self.done():
+            self._batch.flush()
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    def _run(self, function, args, kwargs):
+        try:
+            self._value = function(*args, **kwargs)
+            self._done = True
+        except OperationFailed as e:
+            self._error = e
+
+
+class _Chunker(object):
+    # Splits calls with more sequence items than size into chunks, which are
+    # sent concurrently by a pool of workers (created for each call, so that
+    # no threads are left behind by BIGIPs and sessions no longer used).
+    # Requests are built and replies processed by the calling thread, in
+    # order; the workers only wait on the network, so one (thread-safe) suds
+    # client serves all chunks.
+    def __init__(self, size, workers):
+        self.size = size
+        self.workers = workers
+
+    def split(self, spec, args, kwargs):
+        # Returns the arguments of each chunk, or None when the call is small
+        # enough or can't be split.
+        values = spec.bind(args, kwargs)
+        if values is None or len(values[0]) <= self.size:
+            return None
+        return [[value[start:start + self.size] for value in values]
+                for start in range(0, len(values[0]), self.size)]
+
+    def run(self, wrapped_method, chunks, measured=None):
+        method = wrapped_method._method
+        arg_processor = wrapped_method._arg_processor
+        result_processor = wrapped_method._result_processor
+        measured = measured or CallMetrics(None, None)
+        calls = [_build_request(method, arg_processor, chunk, {})
+                 for chunk in chunks]
+        # Arguments are processed as they are serialized.
+        measured.phases['args'] = 0.0
+        measured.mark('serialize')
+        measured.request_bytes = sum(len(call[2].message) for call in calls)
+        transport = method.client.options.transport
+        pool = ThreadPool(min(self.workers, len(calls)))
+        try:
+            replies = pool.map(
+                lambda request: _send_reply(transport, request),
+                [call[2] for call in calls])
+        finally:
+            pool.close()
+        measured.mark('network')
+        results = []
+        with _translated_errors():
+            for (args, kwargs, _), reply in zip(calls, replies):
+                if isinstance(reply, TransportError):
+                    _reply_error(method, args, kwargs, reply)
+                    reply = None
+                measured.response_bytes += len(reply or b'')
+                parsed = _parse_reply(method, result_processor, reply)
+                measured.mark('parse')
+                results.append(_convert_reply(result_processor, parsed))
+                measured.mark('convert')
+        return _batch_spec(wrapped_method).join(results)
+
+
+def _batch_spec(wrapped_method):
+    # Returns the _BatchSpec of a wrapped method, created on first use.
+    spec = getattr(wrapped_method, '_batch_spec', None)
+    if spec is None:
+        spec = wrapped_method._batch_spec = _BatchSpec(
+            wrapped_method._arg_processor, wrapped_method._result_processor)
+    return spec
+
+
+class _BatchSpec(object):
+    # Describes how calls to one method are merged. Methods can be merged
+    # when all their parameters are sequences, and they return nothing,
+    # a sequence or a structure with a single sequence (like the statistics
+    # types).
+    def __init__(self, arg_processor, result_processor):
+        self.names = None
+        argspec = getattr(arg_processor, '_argspec', None)
+        if not argspec or \
+                not isinstance(result_processor, _NativeResultProcessor) or \
+                not all(arg_processor._is_sequence(arg_type)
+                        for _, arg_type in argspec):
+            return
+        self.field = None
+        if not result_processor._void:
+            path, _ = result_processor._stream_path()
+            if path is None:
+                return
+            # The name of the sequence field of a structure, or None.
+            self.field = path[1:] and path[1] or None
+        self.void = result_processor._void
+        self.result_processor = result_processor
+        self.names = [name for name, _ in argspec]
+
+    def bind(self, args, kwargs):
+        # Returns the arguments of a call in parameter order, or None when
+        # the call can't be merged.
+        if self.names is None or len(args) > len(self.names):
+            return None
+        values = dict(zip(self.names, args))
+        for name, value in six.iteritems(kwargs):
+            if name not in self.names or name in values:
+                return None
+            values[name] = value
+        if len(values) != len(self.names) or not all(
+                isinstance(value, (list, tuple)) for value in values.values()):
+            return None
+        if len(set(len(value) for value in values.values())) != 1:
+            return None
+        return [list(values[name]) for name in self.names]
+
+    def split(self, result, sizes):
+        # Splits the result of a merged call into the results of the calls.
+        if self.void:
+            return [None] * len(sizes)
+        processor = self.result_processor
+        items = result
+        if self.field is not None:
+            items = processor._field(result, self.field)
+        length = processor._length(items)
+        if length != sum(sizes):
+            raise OperationFailed('The BIGIP returned %d items for %d '
+                                  'batched items' % (length, sum(sizes)))
+        parts = []
+        start = 0
+        for size in sizes:
+            part = processor._slice(items, start, start + size)
+            if self.field is not None:
+                part = processor._with_field(result, self.field, part)
+            parts.append(part)
+            start += size
+        return parts
+
+    def join(self, results):
+        # The reverse of split().
+        if self.void:
+            return None
+        processor = self.result_processor
+        if self.field is None:
+            return processor._join(results)
+        return processor._with_field(results[0], self.field, processor._join(
+            [processor._field(result, self.field) for result in results]))
+
+
+@contextlib.contextmanager
+def _translated_errors():
+    # This exception wrapping is purely for pycontrol compatability.
+    # Maybe we want to make this optional and put it in a separate class?
+    try:
+        yield
+    except AttributeError:
+        # Oddly, this seems to happen when the wrong password is used.
+        raise ConnectionError('iControl call failed, possibly invalid '
+                'credentials.')
+    except _MethodNotFound as e:
+        e.__class__ = MethodNotFound
+        raise
+    except WebFault as e:
+        e.__class__ = ServerError
+        raise
+    except URLError as e:
+        raise ConnectionError('URLError: %s' % str(e))
+    except BadStatusLine as e:
+        raise ConnectionError('BadStatusLine: %s' %  e)
+    except (SAXParseException, ElementTree.ParseError) as e:
+        raise ParseError("Failed to parse the BIGIP's response. This "
+            "was likely caused by a 500 error message.")
+
+
+def _translated_iter(iterable):
+    with _translated_errors():
+        for item in iterable:
+            yield item
+
+
+def _raw_request(method, args, kwargs, message=None):
+    # Returns the transport request for a call, with the envelope built by
+    # suds (unless the message is given).
+    client = method.client
+    if message is None:
+        message = method.method.binding.input.get_message(
+            method.method, args, kwargs).plain().encode('utf-8')
+    request = Request(client.options.location, message)
+    request.headers = {'Content-Type': 'text/xml; charset=utf-8',
+                       'SOAPAction': method.method.soap.action}
+    request.headers.update(client.options.headers)
+    scheduler = getattr(client.options.transport, 'scheduler', None)
+    if scheduler is not None:
+        # Taken now, in the calling thread (chunks are sent by others).
+        request.priority = scheduler.priority_of(method.method.name)
+    return request
+
+
+def _direct_request(method, arg_processor, args, kwargs):
+    # Returns the transport request for a call with the envelope written by
+    # the arg processor, or None when it can't write it.
+    if method.client.options.soapheaders:
+        return None
+    message = arg_processor.serialize(args, kwargs)
+    if message is None:
+        return None
+    return _raw_request(method, args, kwargs, message)
+
+
+def _build_request(method, arg_processor, args, kwargs):
+    # Returns (args, kwargs, request) for a call. The arguments are those
+    # suds needs to process an error reply: none when the arg processor
+    # wrote the envelope, or the processed ones when suds built it.
+    request = _direct_request(method, arg_processor, args, kwargs)
+    if request is not None:
+        return (), {}, request
+    args, kwargs = arg_processor.process(args, kwargs)
+    return args, kwargs, _raw_request(method, args, kwargs)
+
+
+def _reply_error(method, args, kwargs, error):
+    # Has suds process the error reply of a TransportError, raising a
+    # WebFault for SOAP faults like it does for regular calls.
+    if error.httpcode == 401:
+        # Clients sharing a registered WSDL first use their credentials
+        # here.
+        raise ConnectionError('iControl call failed, invalid credentials.')
+    content = error.fp and error.fp.read() or b''
+    method(__inject={'reply': content, 'status': error.httpcode,
+                     'description': str(error)}, *args, **kwargs)
+
+
+def _send_raw(method, args, kwargs, request=None):
+    # Sends a call built by suds and returns the raw SOAP reply (or None for
+    # empty replies), bypassing the suds reply processing.
+    request = request or _raw_request(method, args, kwargs)
+    try:
+        reply = method.client.options.transport.send(request)
+    except TransportError as e:
+        _reply_error(method, args, kwargs, e)
+        return None
+    return reply and reply.message or None
+
+
+def _process_reply(method, result_processor, reply):
+    # Processes a raw SOAP reply like the wrapped method would.
+    return _convert_reply(result_processor,
+                          _parse_reply(method, result_processor, reply))
+
+
+def _parse_reply(method, result_processor, reply):
+    # The parsing half of _process_reply().
+    if result_processor.parses_xml:
+        return result_processor.parse_xml(reply)
+    if reply is None:
+        return None
+    return method(__inject={'reply': reply})
+
+
+def _convert_reply(result_processor, parsed):
+    # The conversion half of _process_reply().
+    if result_processor.parses_xml:
+        return result_processor.convert_xml(parsed)
+    return result_processor.process(parsed)
+
+
+class CallMetrics(object):
+    """The measurements of one iControl call, as passed to the metrics hook
+    of a L{BIGIP}.
+
+    @ivar wsdl_name: The namespace (e.g. "LocalLB.Pool").
+    @ivar method: The method name (e.g. "get_list").
+    @ivar phases: A dict of the time (in seconds) spent in each phase of the
+        call: "args" (argument processing), "serialize" (building the SOAP
+        envelope), "network" (sending the request and receiving the reply),
+        "parse" (parsing the reply) and "convert" (converting it to native
+        types). Phases a failed call didn't reach are missing.
+    @ivar seconds: The total time of the call.
+    @ivar request_bytes: The size of the SOAP request(s).
+    @ivar response_bytes: The size of the SOAP reply(s).
+    @ivar error: The L{OperationFailed} error raised by the call, or None.
+    @ivar cached: True when the call was answered by the result cache (it
+        then has no phases and no request or reply).
+    """
+    PHASES = ('args', 'serialize', 'network', 'parse', 'convert')
+
+    def __init__(self, wsdl_name, method):
+        self.wsdl_name = wsdl_name
+        self.method = method
+        self.phases = {}
+        self.seconds = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.error = None
+        self.cached = False
+        self._start = self._mark = _clock()
+
+    def __repr__(self):
+        if self.cached:
+            return '<CallMetrics %s.%s %.1fms cached>' % (
+                self.wsdl_name, self.method, self.seconds * 1000)
+        return '<CallMetrics %s.%s %.1fms %s>' % (
+            self.wsdl_name, self.method, self.seconds * 1000, ' '.join(
+                '%s=%.1fms' % (phase, self.phases[phase] * 1000)
+                for phase in self.PHASES if phase in self.phases))
+
+    def mark(self, phase):
+        """Adds the time since the previous mark to phase."""
+        now = _clock()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._mark
+        self._mark = now
+
+    def finish(self):
+        """Sets the total time of the call."""
+        self.seconds = _clock() - self._start
+
+
+def _measured_call(metrics, wsdl_name, wrapped_method, chunker, chunks, args,
+                   kwargs):
+    # Makes a call like wrapped methods do, measuring each of its phases,
+    # and passes the measurements to the metrics hook.
+    method = wrapped_method._method
+    result_processor = wrapped_method._result_processor
+    measured = CallMetrics(wsdl_name, method.method.name)
+    try:
+        if chunks is not None:
+            return chunker.run(wrapped_method, chunks, measured)
+        arg_processor = wrapped_method._arg_processor
+        request = _direct_request(method, arg_processor, args, kwargs)
+        if request is None:
+            args, kwargs = arg_processor.process(args, kwargs)
+            measured.mark('args')
+        else:
+            # The arguments are processed while they are serialized.
+            args, kwargs = (), {}
+            measured.phases['args'] = 0.0
+        with _translated_errors():
+            request = request or _raw_request(method, args, kwargs)
+            measured.mark('serialize')
+            measured.request_bytes = len(request.message)
+            reply = _send_raw(method, args, kwargs, request)
+            measured.mark('network')
+            measured.response_bytes = len(reply or b'')
+            parsed = _parse_reply(method, result_processor, reply)
+            measured.mark('parse')
+            result = _convert_reply(result_processor, parsed)
+            measured.mark('convert')
+        return result
+    except OperationFailed as e:
+        measured.error = e
+        raise
+    finally:
+        measured.finish()
+        _report_metrics(metrics, measured)
+
+
+def _measured_cache_call(metrics, cache, wsdl_name, method_name, key, send,
+                         args, kwargs, scope=None):
+    # Makes a call through the result cache. Calls it answers are passed to
+    # the metrics hook as cached, the others are measured by send().
+    measured = CallMetrics(wsdl_name, method_name)
+    sent = []
+
+    def measured_send(*args, **kwargs):
+        sent.append(True)
+        return send(*args, **kwargs)
+
+    result = cache.call(wsdl_name, method_name, key, measured_send, args,
+                        kwargs, scope)
+    if not sent:
+        measured.cached = True
+        measured.finish()
+        _report_metrics(metrics, measured)
+    return result
+
+
+def _report_metrics(metrics, measured):
+    try:
+        metrics(measured)
+    except Exception:
+        log.warning('The metrics hook failed', exc_info=True)
+
+
+def _open_raw(method, args, kwargs):
+    # Like _send_raw(), but returns the SOAP reply as a file-like object.
+    # Transports without send_stream() read the whole reply first.
+    transport = method.client.options.transport
+    if not hasattr(transport, 'send_stream'):
+        reply = _send_raw(method, args, kwargs)
+        return reply and BytesIO(reply)
+    try:
+        return transport.send_stream(_raw_request(method, args, kwargs))
+    except TransportError as e:
+        _reply_error(method, args, kwargs, e)
+
+
 class _ArgProcessor(object):
     """Base class for suds argument processors."""
 
@@ -518,6 +2808,15 @@ class _ArgProcessor(object):
         """
         raise NotImplementedError('process')
 
+    def serialize(self, args, kwargs):
+        """Writes the SOAP envelope of a call straight from the
+        user-specified args and kwargs, without suds.
+
+        @return: The envelope (bytes), or None when the args have to be
+            processed and marshalled by suds instead.
+        """
+        return None
+
 
 class _DefaultArgProcessor(_ArgProcessor):
 
@@ -525,6 +2824,8 @@ class _DefaultArgProcessor(_ArgProcessor):
         self._factory = factory
         self._method = method
         self._argspec = self._make_argspec(method)
+        self._types = {}
+        self._writer = None
 
     def _make_argspec(self, method):
         # Returns a list of tuples indicating the arg names and types.
@@ -537,6 +2838,21 @@ class _DefaultArgProcessor(_ArgProcessor):
     def process(self, args, kwargs):
         return (self._process_args(args), self._process_kwargs(kwargs))
 
+    def serialize(self, args, kwargs):
+        # Invalid arguments are left to process(), which explains what is
+        # wrong with them.
+        if self._writer is None:
+            self._writer = _EnvelopeWriter(self._method,
+                                           self._factory.resolver)
+        return self._writer.write(args, kwargs)
+
+    def _is_sequence(self, arg_type):
+        # Returns True for iControl array types (like Common.StringSequence).
+        if '.' not in arg_type:
+            return False
+        info = self._type_info(arg_type)
+        return info is not None and info.array_type is not None
+
     def _process_args(self, args):
         newargs = []
         for i, arg in enumerate(args):
@@ -575,41 +2891,40 @@ class _DefaultArgProcessor(_ArgProcessor):
             # these types are: ns0:string, ns0:long, ns0:unsignedInt.
             return value
 
-        try:
-            obj = self._factory.create(arg_type)
-        except TypeNotFound:
-            log.error('Failed to create type: %s', arg_type)
+        info = self._type_info(arg_type)
+        if info is None:
             return value
 
         if isinstance(value, dict):
+            obj = info.new()
             for name, value in six.iteritems(value):
-                # The new object we created has the type of each attribute
+                # The template we created has the type of each attribute
                 # accessible via the attribute's class name.
                 try:
-                    class_name = getattr(obj, name).__class__.__name__
-                except AttributeError:
-                    valid_attrs = ', '.join([x[0] for x in obj])
+                    class_name = info.attributes[name]
+                except KeyError:
+                    valid_attrs = ', '.join(info.names)
                     raise ArgumentError(
                         '"%s" is not a valid attribute for %s, '
-                        'expecting: %s' % (name, obj.__class__.__name__,
-                                           valid_attrs))
+                        'expecting: %s' % (name, info.name, valid_attrs))
                 setattr(obj, name, self._process_arg(class_name, value))
             return obj
 
-        array_type = self._array_type(obj)
-        if array_type is not None:
+        if info.array_type is not None:
             # This is a common mistake. We might as well catch it here.
             if isinstance(value, six.string_types):
                 raise ArgumentError(
                     '%s needs an iterable, but was specified as a string: '
-                    '"%s"' % (obj.__class__.__name__, value))
+                    '"%s"' % (info.name, value))
+            obj = info.new()
+            array_type = info.array_type
             obj.items = [self._process_arg(array_type, x) for x in value]
             return obj
 
         # If this object doesn't have any attributes, then we know it's not
         # a complex type or enum type. We'll want to skip the next validation
         # step.
-        if not obj:
+        if not info.names:
             return value
 
         # The passed in value doesn't belong to an array type and wasn't a
@@ -618,13 +2933,34 @@ class _DefaultArgProcessor(_ArgProcessor):
         # an enum, but could be an incorrect argument to a complex type (e.g.
         # the user specified some other type when a dictionary is expected).
         # Either way, this error is more helpful than what the BIGIP provides.
-        if value not in obj:
-            valid_values = ', '.join([x[0] for x in obj])
+        try:
+            valid = value in info.values
+        except TypeError:
+            valid = False
+        if not valid:
+            valid_values = ', '.join(info.names)
             raise ArgumentError('"%s" is not a valid value for %s, expecting: '
-                                '%s' % (value, obj.__class__.__name__,
-                                        valid_values))
+                                '%s' % (value, info.name, valid_values))
         return value
 
+    def _type_info(self, arg_type):
+        # Returns the _TypeInfo for arg_type (or None if the factory doesn't
+        # know the type). Resolving a type with the factory is expensive, so
+        # it is only done once per type.
+        try:
+            return self._types[arg_type]
+        except KeyError:
+            pass
+        try:
+            obj = self._factory.create(arg_type)
+        except TypeNotFound:
+            log.error('Failed to create type: %s', arg_type)
+            info = None
+        else:
+            info = _TypeInfo(obj, self._array_type(obj))
+        self._types[arg_type] = info
+        return info
+
     def _array_type(self, obj):
         # Determines if the specified type is an array.
         # If so, the type name of the elements is returned. Otherwise None
@@ -645,9 +2981,239 @@ class _DefaultArgProcessor(_ArgProcessor):
         return None
 
 
+class _Unserializable(Exception):
+    # Raised by _EnvelopeWriter for arguments it leaves to suds.
+    pass
+
+
+_encoder = Encoder()
+
+
+class _EnvelopeWriter(object):
+    """Writes the rpc/encoded SOAP envelope of calls to one method straight
+    from native arguments (lists, dicts, strings and numbers).
+
+    The output is what suds marshals after L{_DefaultArgProcessor}, without
+    building the suds objects. A writer is compiled for each type from the
+    WSDL schema, once. Anything it doesn't handle exactly like suds (suds
+    objects, missing complex fields, invalid values, ...) makes L{write}
+    return None, so the call takes the regular path.
+    """
+    def __init__(self, method, resolver):
+        self._resolver = resolver
+        self._writers = {}
+        self._simple = set()
+        self._prefixes = {_XSD_NS: 'xsd'}
+        self._params = None
+        body = method.method.soap.input.body
+        try:
+            params = [(part.name, self._writer(part.type))
+                      for part in body.parts]
+        except (_Unserializable, TypeError):
+            return
+        name = method.method.name
+        namespaces = ''.join(' xmlns:%s="%s"' % (prefix, namespace)
+                             for namespace, prefix in
+                             sorted(self._prefixes.items()))
+        self._head = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<SOAP-ENV:Envelope xmlns:SOAP-ENV="%s" xmlns:xsi="%s" '
+            'xmlns:SOAP-ENC="%s"%s xmlns:m="%s" SOAP-ENV:encodingStyle="%s">'
+            '<SOAP-ENV:Header/><SOAP-ENV:Body><m:%s>' % (
+                _SOAP_ENV_NS, _XSI_NS, _SOAP_ENC_NS, namespaces,
+                body.namespace[1], _SOAP_ENC_NS, name))
+        self._tail = '</m:%s></SOAP-ENV:Body></SOAP-ENV:Envelope>' % name
+        self._names = [param for param, _ in params]
+        self._params = params
+
+    def write(self, args, kwargs):
+        """Returns the envelope (bytes) of a call, or None."""
+        params = self._params
+        if params is None or len(args) > len(params):
+            return None
+        values = dict(zip(self._names, args))
+        for name, value in six.iteritems(kwargs):
+            if name not in self._names or name in values:
+                return None
+            values[name] = value
+        out = [self._head]
+        try:
+            for name, writer in params:
+                # Like suds, leave out the arguments that aren't passed.
+                value = values.get(name)
+                if value is not None:
+                    writer(out, name, value)
+                elif name in values:
+                    return None
+        except _Unserializable:
+            return None
+        out.append(self._tail)
+        return ''.join(out).encode('utf-8')
+
+    def _xsi_type(self, qname):
+        name, namespace = qname
+        prefix = self._prefixes.get(namespace)
+        if prefix is None:
+            prefix = self._prefixes[namespace] = 'ns%d' % len(self._prefixes)
+        return '%s:%s' % (prefix, name)
+
+    def _writer(self, qname):
+        # Returns a function writing a value of the type qname as an element,
+        # write(out, tag, value), appending the XML to the list out.
+        try:
+            return self._writers[qname]
+        except KeyError:
+            pass
+        # Recursive types use the writer while it is being compiled.
+        self._writers[qname] = lambda out, tag, value: \
+            self._writers[qname](out, tag, value)
+        try:
+            writer = self._compile(qname)
+        except Exception:
+            del self._writers[qname]
+            raise
+        self._writers[qname] = writer
+        return writer
+
+    def _compile(self, qname):
+        name, namespace = qname
+        if namespace == _XSD_NS:
+            self._simple.add(qname)
+            return self._simple_writer(self._xsi_type(qname),
+                                       name == 'boolean')
+        schema_type = self._resolver.find(name)
+        if schema_type is None or tuple(schema_type.qname) != tuple(qname):
+            raise _Unserializable(name)
+        if schema_type.enum():
+            # suds types enum values as their base type.
+            restrictions = [child for child in schema_type.rawchildren
+                            if getattr(child, 'ref', None)]
+            if len(restrictions) != 1:
+                raise _Unserializable(name)
+            return self._enum_writer(
+                self._xsi_type(restrictions[0].ref),
+                frozenset(child.name for child, _ in schema_type.children()))
+        xsi_type = self._xsi_type(qname)
+        for attribute, _ in schema_type.attributes():
+            aty = getattr(attribute, 'aty', None)
+            if attribute.name == 'arrayType' and aty:
+                return self._array_writer(xsi_type, self._writer(aty))
+        fields = [(child.name, child.type) for child, _ in
+                  schema_type.children()]
+        if not fields or not all(field[0] and field[1] for field in fields):
+            raise _Unserializable(name)
+        return self._struct_writer(xsi_type, [
+            (field, self._writer(field_type),
+             field_type in self._simple and
+             '<%s xsi:type="%s"/>' % (field, self._xsi_type(field_type)))
+            for field, field_type in fields])
+
+    @staticmethod
+    def _simple_writer(xsi_type, boolean):
+        attrs = ' xsi:type="%s"' % xsi_type
+
+        def write(out, tag, value):
+            if value is None:
+                text = ''
+            elif isinstance(value, six.text_type):
+                text = _encoder.encode(value)
+            elif boolean:
+                if value not in (True, False):
+                    raise _Unserializable(value)
+                text = value and 'true' or 'false'
+            elif isinstance(value, six.integer_types + (float,)):
+                text = str(value)
+            elif PY2 and isinstance(value, str):
+                text = _encoder.encode(value.decode('utf-8'))
+            else:
+                raise _Unserializable(value)
+            if text:
+                out.append('<%s%s>%s</%s>' % (tag, attrs, text, tag))
+            else:
+                out.append('<%s%s/>' % (tag, attrs))
+        return write
+
+    @staticmethod
+    def _enum_writer(xsi_type, values):
+        def write(out, tag, value):
+            if not isinstance(value, six.string_types) or value not in values:
+                raise _Unserializable(value)
+            out.append('<%s xsi:type="%s">%s</%s>' % (tag, xsi_type, value,
+                                                       tag))
+        return write
+
+    @staticmethod
+    def _array_writer(xsi_type, item):
+        def write(out, tag, value):
+            # Other iterables (like generators) can't be read twice.
+            if not isinstance(value, (list, tuple)):
+                raise _Unserializable(value)
+            if not value:
+                out.append('<%s xsi:type="%s"/>' % (tag, xsi_type))
+                return
+            out.append('<%s xsi:type="%s">' % (tag, xsi_type))
+            for x in value:
+                item(out, 'items', x)
+            out.append('</%s>' % tag)
+        return write
+
+    @staticmethod
+    def _struct_writer(xsi_type, fields):
+        names = frozenset(field[0] for field in fields)
+
+        def write(out, tag, value):
+            if not isinstance(value, dict) or not names.issuperset(value):
+                raise _Unserializable(value)
+            out.append('<%s xsi:type="%s">' % (tag, xsi_type))
+            for name, writer, empty in fields:
+                if name in value:
+                    writer(out, name, value[name])
+                elif empty:
+                    out.append(empty)
+                else:
+                    # suds would marshal the field's (complex) template.
+                    raise _Unserializable(name)
+            out.append('</%s>' % tag)
+        return write
+
+
+class _TypeInfo(object):
+    """What L{_DefaultArgProcessor} needs to know about an iControl type.
+
+    This holds an empty object of the type, built by the suds factory, as a
+    template. Copying the template is much cheaper than building a new
+    object with the factory for every value.
+    """
+    __slots__ = ('template', 'name', 'names', 'values', 'attributes',
+                 'array_type')
+
+    def __init__(self, template, array_type):
+        self.template = template
+        self.name = template.__class__.__name__
+        # The attribute names (or enum values) of the type, in order.
+        self.names = [name for name, _ in template]
+        self.values = frozenset(self.names)
+        # The type name of each attribute.
+        self.attributes = dict((name, value.__class__.__name__)
+                               for name, value in template)
+        # The type name of the elements, if this is an array type.
+        self.array_type = array_type
+
+    def new(self):
+        """Returns a new object of this type."""
+        obj = copy.copy(self.template)
+        # Attributes that get set must not be added to the template's keys.
+        obj.__keylist__ = list(self.template.__keylist__)
+        return obj
+
+
 class _ResultProcessor(object):
     """Base class for suds result processors."""
 
+    # When True, process_xml() is passed the raw SOAP reply instead of
+    # process() being passed the value unmarshalled by suds.
+    parses_xml = False
+
     def process(self, value):
         """Processes the suds return value for the caller.
 
@@ -656,10 +3222,173 @@ class _ResultProcessor(object):
         """
         raise NotImplementedError('process')
 
+    def process_xml(self, reply):
+        """Processes the raw SOAP reply for the caller.
+
+        @param reply: The SOAP reply (bytes), or None for an empty reply.
+        @return: The processed value.
+        """
+        return self.convert_xml(self.parse_xml(reply))
+
+    def parse_xml(self, reply):
+        """The first half of L{process_xml}: parses the raw SOAP reply.
+
+        @param reply: The SOAP reply (bytes), or None for an empty reply.
+        @return: The parsed reply, to be passed to L{convert_xml}.
+        """
+        raise NotImplementedError('parse_xml')
+
+    def convert_xml(self, parsed):
+        """The second half of L{process_xml}: converts a parsed reply.
+
+        @param parsed: The value returned by L{parse_xml}.
+        @return: The processed value.
+        """
+        raise NotImplementedError('convert_xml')
+
+    def process_stream(self, reply):
+        """Processes the raw SOAP reply while it is being read.
+
+        @param reply: A file-like object of the SOAP reply, or None for an
+            empty reply.
+        @return: An iterator over the processed items of the reply.
+        """
+        raise NotImplementedError('process_stream')
+
+
+_XSD_NS = 'http://www.w3.org/2001/XMLSchema'
+_SOAP_ENC_NS = 'http://schemas.xmlsoap.org/soap/encoding/'
+_SOAP_ENV_NS = 'http://schemas.xmlsoap.org/soap/envelope/'
+_XSI_NS = 'http://www.w3.org/2001/XMLSchema-instance'
+_XSI_NIL = '{%s}nil' % _XSI_NS
+_INTEGER_TYPES = frozenset(('byte', 'short', 'int', 'integer', 'long',
+                            'unsignedByte', 'unsignedShort', 'unsignedInt',
+                            'unsignedLong', 'negativeInteger',
+                            'nonNegativeInteger', 'positiveInteger',
+                            'nonPositiveInteger'))
+_FLOAT_TYPES = frozenset(('float', 'double'))
+# The values of xsd:boolean, converted to integers like suds booleans are.
+_BOOLEANS = {'true': 1, '1': 1, 'false': 0, '0': 0}
+
 
 class _NativeResultProcessor(_ResultProcessor):
+    """Converts results into native python types (lists, dicts, str, int).
+
+    When created with the suds method and factory, a converter is compiled
+    for the method's return type from the WSDL schema, once. Converting a
+    result then only needs a single type check per node instead of walking
+    an isinstance chain. Values that don't match the schema (and results of
+    types the schema doesn't describe) are converted generically.
+    """
+    def __init__(self, method=None, factory=None, parses_xml=False):
+        """init
+
+        @param method: The suds method whose results will be processed.
+        @param factory: The suds factory of the method's client.
+        @param parses_xml: When True, results are parsed straight from the
+            SOAP reply by L{process_xml}.
+        """
+        self._method = method
+        self._resolver = factory and factory.resolver
+        self._plans = {}
+        self._converters = {}
+        self._xml_converters = {}
+        self._returns = None
+        self._void = False
+        if method is not None and factory is not None:
+            parts = method.method.soap.output.body.parts
+            self._void = not parts
+            if len(parts) == 1:
+                self._returns = parts[0].type
+        self.parses_xml = parses_xml and method is not None
+
     def process(self, value):
-        return self._convert_to_native_type(value)
+        if self._returns is None:
+            return self._convert_to_native_type(value)
+        return self._converter(self._returns)(value)
+
+    def parse_xml(self, reply):
+        if reply is None:
+            return None
+        return reply, ElementTree.fromstring(reply).find(
+            '{%s}Body' % _SOAP_ENV_NS)
+
+    def convert_xml(self, parsed):
+        if parsed is None:
+            return None
+        reply, body = parsed
+        if self._returns is None or body is None or not len(body) or \
+                not len(body[0]):
+            # Let suds deal with anything unusual, like faults.
+            return self._convert_to_native_type(
+                self._method(__inject={'reply': reply}))
+        return self._xml_converter(self._returns)(body[0][0])
+
+    def process_stream(self, reply):
+        if reply is None:
+            return
+        try:
+            path, item_type = self._stream_path()
+            if item_type is None:
+                # Nothing to stream, the result is returned as one item.
+                yield self.process_xml(reply.read())
+                return
+            convert = self._xml_converter(item_type, True)
+            depth = 3 + len(path) + 1
+            fault = False
+            # The open elements, from the envelope down.
+            elements = []
+            for event, element in ElementTree.iterparse(reply,
+                                                        ('start', 'end')):
+                if event == 'start':
+                    elements.append(element)
+                    if len(elements) == 3 and \
+                            element.tag == '{%s}Fault' % _SOAP_ENV_NS:
+                        fault = True
+                    continue
+                if len(elements) == depth and not fault and all(
+                        x.tag.rsplit('}', 1)[-1] == name
+                        for x, name in zip(elements[3:], path)):
+                    yield convert(element)
+                    # Drop the parsed item, so memory use stays constant.
+                    elements[-2].remove(element)
+                root = elements.pop()
+            if fault:
+                self._method(__inject={'reply': ElementTree.tostring(root)})
+        finally:
+            reply.close()
+
+    def _stream_path(self):
+        # Returns the names of the elements down from the response element
+        # to the array whose items are streamed, and the type of the items.
+        plan = self._returns is not None and self._plan(self._returns)
+        if plan and plan[0] == 'array':
+            return ['return'], plan[1]
+        if plan and plan[0] == 'complex':
+            arrays = [(name, self._plan(field_type)[1])
+                      for name, field_type in plan[1]
+                      if self._plan(field_type)[0] == 'array']
+            if len(arrays) == 1:
+                return ['return', arrays[0][0]], arrays[0][1]
+        return None, None
+
+    # How batched and chunked calls split and join results (see _BatchSpec):
+    # the sequence field of a structure, a structure with another sequence,
+    # and the length, slice and concatenation of sequences.
+    def _field(self, result, name):
+        return result[name]
+
+    def _with_field(self, result, name, items):
+        return dict(result, **{name: items})
+
+    def _length(self, items):
+        return len(items)
+
+    def _slice(self, items, start, stop):
+        return items[start:stop]
+
+    def _join(self, parts):
+        return [item for part in parts for item in part]
 
     def _convert_to_native_type(self, value):
         if isinstance(value, list):
@@ -680,9 +3409,498 @@ class _NativeResultProcessor(_ResultProcessor):
             return int(value)
         return value
 
+    def _plan(self, qname):
+        # Describes how values of the type qname (a (name, namespace) tuple)
+        # are represented, as one of:
+        #   ('int',), ('bool',), ('float',), ('str',), ('array', <item qname>),
+        #   ('complex', [(<name>, <qname>), ...]), ('unknown',)
+        try:
+            return self._plans[qname]
+        except KeyError:
+            pass
+        name, namespace = qname
+        plan = ('unknown',)
+        if namespace in (_XSD_NS, _SOAP_ENC_NS):
+            if name in _INTEGER_TYPES:
+                plan = ('int',)
+            elif name == 'boolean':
+                plan = ('bool',)
+            elif name in _FLOAT_TYPES:
+                plan = ('float',)
+            elif name == 'string':
+                plan = ('str',)
+        elif self._resolver is not None:
+            schema_type = self._resolver.find(name)
+            if schema_type is None:
+                pass
+            elif schema_type.enum():
+                plan = ('str',)
+            else:
+                for attribute, _ in schema_type.attributes():
+                    aty = getattr(attribute, 'aty', None)
+                    if attribute.name == 'arrayType' and aty:
+                        plan = ('array', aty)
+                        break
+                else:
+                    fields = [(child.name, child.type) for child, _ in
+                              schema_type.children()]
+                    if fields and all(field[0] and field[1] for field in
+                                      fields):
+                        plan = ('complex', fields)
+        self._plans[qname] = plan
+        return plan
+
+    def _converter(self, qname):
+        # Returns a function converting a suds value of the type qname.
+        try:
+            return self._converters[qname]
+        except KeyError:
+            pass
+        generic = self._convert_to_native_type
+        # Guards against recursive types while this one is being compiled.
+        self._converters[qname] = generic
+        plan = self._plan(qname)
+        if plan[0] == 'int':
+            def convert(value):
+                if isinstance(value, six.integer_types):
+                    return int(value)
+                return generic(value)
+        elif plan[0] == 'str':
+            def convert(value):
+                if isinstance(value, six.string_types):
+                    if PY2:
+                        return str(value.encode('utf-8'))
+                    return str(value)
+                return generic(value)
+        elif plan[0] == 'array':
+            item = self._converter(plan[1])
+            def convert(value):
+                if isinstance(value, list):
+                    return [item(x) for x in value]
+                return generic(value)
+        elif plan[0] == 'complex':
+            fields = dict((name, self._converter(field_type))
+                          for name, field_type in plan[1])
+            def convert(value):
+                if not isinstance(value, SudsObject):
+                    return generic(value)
+                attrs = value.__dict__
+                return dict((name, fields.get(name, generic)(attrs[name]))
+                            for name in value.__keylist__)
+        else:
+            convert = generic
+        self._converters[qname] = convert
+        return convert
+
+    def _xml_converter(self, qname, item=False):
+        # Returns a function converting an XML element of the type qname.
+        # Array items are converted slightly differently (see below), which
+        # is what item indicates.
+        key = (qname, item)
+        try:
+            return self._xml_converters[key]
+        except KeyError:
+            pass
+        generic = _xml_to_native
+        self._xml_converters[key] = generic
+        plan = self._plan(qname)
+        if plan[0] == 'int':
+            def convert(element):
+                if element.text is None:
+                    return None
+                return int(element.text)
+        elif plan[0] == 'bool':
+            def convert(element):
+                return _BOOLEANS.get(element.text)
+        elif plan[0] == 'float':
+            def convert(element):
+                if not element.text:
+                    return None
+                return float(element.text)
+        elif plan[0] == 'str':
+            # Like suds, return empty strings as None, except in arrays.
+            empty = '' if item else None
+            def convert(element):
+                if element.text is None:
+                    if element.get(_XSI_NIL) == 'true':
+                        return None
+                    return empty
+                return _xml_text(element.text)
+        elif plan[0] == 'array':
+            item_converter = self._xml_converter(plan[1], True)
+            def convert(element):
+                return [item_converter(x) for x in element]
+        elif plan[0] == 'complex':
+            fields = dict((name, self._xml_converter(field_type))
+                          for name, field_type in plan[1])
+            def convert(element):
+                d = {}
+                for child in element:
+                    name = child.tag.rsplit('}', 1)[-1]
+                    d[name] = fields.get(name, generic)(child)
+                return d
+        else:
+            convert = generic
+        self._xml_converters[key] = convert
+        return convert
+
+
+class Record(object):
+    """Base class of the records returned by BIGIP(result_format="records").
+
+    One subclass is generated per iControl type (named after it, e.g.
+    "Common.IPPortDefinition"), whose slots are the type's fields. Fields
+    are read as attributes or like dict items (record["port"]), and fields
+    missing from a reply are None.
+    """
+    __slots__ = ()
+    _fields = ()
+
+    def __getattr__(self, name):
+        # Only called for unset slots (and unknown names).
+        if name in self._fields:
+            return None
+        raise AttributeError(name)
+
+    def __getitem__(self, name):
+        if name not in self._fields:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def _asdict(self):
+        """Returns the fields as a dict."""
+        return dict((name, getattr(self, name)) for name in self._fields)
+
+    def _replace(self, **fields):
+        """Returns a copy of the record with some fields replaced."""
+        record = copy.copy(self)
+        for name, value in six.iteritems(fields):
+            setattr(record, name, value)
+        return record
+
+    def __eq__(self, other):
+        return type(other) is type(self) and \
+            self._asdict() == other._asdict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join(
+            '%s=%r' % (name, getattr(self, name)) for name in self._fields))
+
+    def __reduce__(self):
+        return (_new_record, (type(self).__name__, self._fields,
+                              self._asdict()))
+
+
+_record_classes = {}
+
+
+def _record_class(name, fields):
+    # Returns the Record subclass for an iControl type, generating it once.
+    key = (name, fields)
+    cls = _record_classes.get(key)
+    if cls is None:
+        fields = tuple(str(field) for field in fields)
+        cls = _record_classes.setdefault(key, type(
+            str(name), (Record,), {'__slots__': fields, '_fields': fields}))
+    return cls
+
+
+def _new_record(name, fields, values):
+    # Unpickles a Record.
+    cls = _record_class(name, fields)
+    record = cls.__new__(cls)
+    for field, value in six.iteritems(values):
+        setattr(record, field, value)
+    return record
+
+
+class _RecordResultProcessor(_NativeResultProcessor):
+    """Converts results like L{_NativeResultProcessor}, except that
+    structures become L{Record}s."""
+    def _with_field(self, result, name, items):
+        return result._replace(**{name: items})
+
+    def _converter(self, qname):
+        plan = self._plan(qname)
+        if plan[0] != 'complex' or qname in self._converters:
+            return super(_RecordResultProcessor, self)._converter(qname)
+        generic = self._convert_to_native_type
+        self._converters[qname] = generic
+        cls = _record_class(qname[0], tuple(name for name, _ in plan[1]))
+        fields = dict((name, self._converter(field_type))
+                      for name, field_type in plan[1])
+        def convert(value):
+            if not isinstance(value, SudsObject):
+                return generic(value)
+            attrs = value.__dict__
+            record = cls.__new__(cls)
+            for name in value.__keylist__:
+                field = fields.get(name)
+                if field is None:
+                    return generic(value)
+                setattr(record, name, field(attrs[name]))
+            return record
+        self._converters[qname] = convert
+        return convert
+
+    def _xml_converter(self, qname, item=False):
+        plan = self._plan(qname)
+        if plan[0] != 'complex' or (qname, item) in self._xml_converters:
+            return super(_RecordResultProcessor, self)._xml_converter(qname,
+                                                                      item)
+        generic = _xml_to_native
+        self._xml_converters[(qname, item)] = generic
+        cls = _record_class(qname[0], tuple(name for name, _ in plan[1]))
+        fields = dict((name, self._xml_converter(field_type))
+                      for name, field_type in plan[1])
+        def convert(element):
+            record = cls.__new__(cls)
+            for child in element:
+                name = child.tag.rsplit('}', 1)[-1]
+                field = fields.get(name)
+                if field is None:
+                    return generic(element)
+                setattr(record, name, field(child))
+            return record
+        self._xml_converters[(qname, item)] = convert
+        return convert
+
+
+try:
+    array('q')
+    _INT64, _UINT64 = 'q', 'Q'
+except ValueError:
+    # Python 2 has no long long arrays.
+    _INT64, _UINT64 = 'l', 'L'
+
+_ULONG64 = 'Common.ULong64'
+
+
+def _int_column(typecode, values):
+    # Returns an array of the integers, or the list when it has None values
+    # or values out of the array's range.
+    try:
+        return array(typecode, values)
+    except (TypeError, OverflowError):
+        return values
+
+
+class _ColumnarResultProcessor(_NativeResultProcessor):
+    """Converts results like L{_NativeResultProcessor}, except that arrays
+    of structures become dicts of columns, integer columns become arrays
+    and Common.ULong64 values become integers."""
+    def _length(self, items):
+        if isinstance(items, dict):
+            for column in items.values():
+                return self._length(column)
+            return 0
+        return len(items)
+
+    def _slice(self, items, start, stop):
+        if isinstance(items, dict):
+            return dict((name, self._slice(column, start, stop))
+                        for name, column in six.iteritems(items))
+        return items[start:stop]
+
+    def _join(self, parts):
+        if parts and all(isinstance(part, dict) for part in parts):
+            return dict((name, self._join([part[name] for part in parts]))
+                        for name in parts[0])
+        if parts and all(isinstance(part, array) and
+                         part.typecode == parts[0].typecode
+                         for part in parts):
+            joined = array(parts[0].typecode)
+            for part in parts:
+                joined.extend(part)
+            return joined
+        return [item for part in parts for item in part]
+
+    def _converter(self, qname):
+        if qname in self._converters:
+            return self._converters[qname]
+        plan = self._plan(qname)
+        if qname[0] == _ULONG64 and plan[0] == 'complex':
+            def convert(value):
+                if isinstance(value, SudsObject):
+                    return (int(value.high) << 32) | int(value.low)
+                return self._convert_to_native_type(value)
+        elif plan[0] == 'array' and self._plan(plan[1])[0] == 'complex':
+            columns = self._columns(plan[1])
+            def convert(value):
+                if isinstance(value, list):
+                    return columns(value)
+                return self._convert_to_native_type(value)
+        else:
+            return super(_ColumnarResultProcessor, self)._converter(qname)
+        self._converters[qname] = convert
+        return convert
+
+    def _columns(self, qname):
+        # Returns a function converting a list of suds values of the
+        # structure type qname into columns.
+        plan = self._plan(qname)
+        fields = []
+        for name, field_type in plan[1]:
+            field_plan = self._plan(field_type)
+            if field_plan[0] == 'int':
+                column = self._int_column(_INT64, int)
+            elif field_type[0] == _ULONG64:
+                column = self._int_column(_UINT64, self._converter(field_type))
+            elif field_plan[0] == 'complex':
+                # Guards against recursive types.
+                column = lambda values, field_type=field_type: \
+                    self._columns(field_type)(values)
+            else:
+                column = self._list_column(self._converter(field_type))
+            fields.append((str(name), column))
+        def convert(values):
+            values = [value if isinstance(value, SudsObject) else None
+                      for value in values]
+            return dict((name, column([value and getattr(value, name, None)
+                                       for value in values]))
+                        for name, column in fields)
+        return convert
+
+    def _xml_converter(self, qname, item=False):
+        key = (qname, item)
+        if key in self._xml_converters:
+            return self._xml_converters[key]
+        plan = self._plan(qname)
+        if qname[0] == _ULONG64 and plan[0] == 'complex':
+            def convert(element):
+                values = dict((child.tag.rsplit('}', 1)[-1], child.text)
+                              for child in element)
+                if values.get('high') is None or values.get('low') is None:
+                    return _xml_to_native(element)
+                return (int(values['high']) << 32) | int(values['low'])
+        elif plan[0] == 'array' and self._plan(plan[1])[0] == 'complex':
+            columns = self._xml_columns(plan[1])
+            def convert(element):
+                return columns(list(element))
+        else:
+            return super(_ColumnarResultProcessor, self)._xml_converter(
+                qname, item)
+        self._xml_converters[key] = convert
+        return convert
+
+    def _xml_columns(self, qname):
+        # Returns a function converting a list of XML elements of the
+        # structure type qname (or None) into columns.
+        plan = self._plan(qname)
+        fields = []
+        for name, field_type in plan[1]:
+            field_plan = self._plan(field_type)
+            if field_plan[0] == 'int':
+                column = self._int_column(
+                    _INT64, lambda x: None if x.text is None else int(x.text))
+            elif field_type[0] == _ULONG64:
+                column = self._int_column(_UINT64,
+                                          self._xml_converter(field_type))
+            elif field_plan[0] == 'complex':
+                column = lambda elements, field_type=field_type: \
+                    self._xml_columns(field_type)(elements)
+            else:
+                column = self._list_column(self._xml_converter(field_type))
+            fields.append((str(name), column))
+        def convert(elements):
+            rows = dict((name, []) for name, _ in fields)
+            for index, element in enumerate(elements):
+                for child in (element if element is not None else ()):
+                    values = rows.get(child.tag.rsplit('}', 1)[-1])
+                    if values is not None:
+                        values.append(child)
+                for values in rows.values():
+                    if len(values) == index:
+                        # The field is missing from this element.
+                        values.append(None)
+            return dict((name, column(rows[name])) for name, column in fields)
+        return convert
+
+    @staticmethod
+    def _int_column(typecode, convert):
+        def column(values):
+            return _int_column(typecode, [
+                None if value is None else convert(value)
+                for value in values])
+        return column
+
+    @staticmethod
+    def _list_column(convert):
+        def column(values):
+            return [None if value is None else convert(value)
+                    for value in values]
+        return column
+
+
+_RESULT_PROCESSORS = {'native': _NativeResultProcessor,
+                      'records': _RecordResultProcessor,
+                      'columns': _ColumnarResultProcessor}
+
+
+def _xml_text(text):
+    if PY2 and isinstance(text, six.text_type):
+        return str(text.encode('utf-8'))
+    return text
+
+
+def _xml_to_native(element):
+    # Converts an XML element of an unknown type into native types.
+    children = list(element)
+    if not children:
+        if element.get(_XSI_NIL) == 'true':
+            return None
+        return _xml_text(element.text)
+    if any(key.endswith('arrayType') for key in element.attrib):
+        return [_xml_to_native(x) for x in children]
+    return dict((x.tag.rsplit('}', 1)[-1], _xml_to_native(x))
+                for x in children)
+
 
 def _method_string(method):
     parts = []
     for part in method.method.soap.input.body.parts:
         parts.append("%s %s" % (part.type[0], part.name))
     return "%s(%s)" % (method.method.name, ', '.join(parts))
+
+
+def main(argv=None):
+    """The bigsuds command line interface."""
+    parser = argparse.ArgumentParser(prog='bigsuds')
+    subparsers = parser.add_subparsers(dest='command')
+    bundle_parser = subparsers.add_parser(
+        'bundle', help='Compile the WSDLs of a BIGIP into a bundle file that '
+        'clients can load instead of fetching WSDLs.')
+    bundle_parser.add_argument('hostname')
+    bundle_parser.add_argument('path', help='The bundle file to write.')
+    bundle_parser.add_argument('-u', '--username', default='admin')
+    bundle_parser.add_argument('-p', '--password',
+                               help='Prompted for when not specified.')
+    bundle_parser.add_argument('--port', type=int, default=443)
+    bundle_parser.add_argument('--timeout', type=int, default=90)
+    bundle_parser.add_argument('--verify', action='store_true')
+    bundle_parser.add_argument('-w', '--wsdl', action='append',
+                               dest='wsdl_names', help='A WSDL to include '
+                               '(e.g. LocalLB.Pool). May be repeated. '
+                               'Defaults to every WSDL on the BIGIP.')
+    args = parser.parse_args(argv)
+
+    if args.command == 'bundle':
+        password = args.password
+        if password is None:
+            password = getpass.getpass()
+        bundle = compile_bundle(args.hostname, args.path, args.wsdl_names,
+                                args.username, password, args.verify,
+                                args.timeout, args.port)
+        print('Wrote %d WSDLs from version %s to %s' % (
+            len(bundle), bundle.version, args.path))
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
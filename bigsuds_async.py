@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+"""asyncio support for bigsuds (Python 3.5 and newer).
+
+Example usage:
+    >>> b = AsyncBIGIP('bigip-hostname')
+    >>> await b.LocalLB.Pool.get_list()
+    ['/Common/test_pool']
+
+The iControl namespaces, arguments and results work exactly as with
+L{bigsuds.BIGIP}, and so do the exceptions. SOAP envelopes are built like
+those of a BIGIP and sent over a non-blocking HTTPS connection pool, so any
+number of calls can be in flight at once.
+"""
+import asyncio
+import logging
+
+from six.moves.urllib.parse import urlsplit
+
+import bigsuds
+import bigsuds_transport
+from bigsuds import ConnectionError
+
+log = logging.getLogger('bigsuds')
+
+try:
+    _running_loop = asyncio.get_running_loop
+except AttributeError:
+    # Python 3.5 and 3.6, where get_event_loop() returns the running loop
+    # when called from a coroutine.
+    _running_loop = asyncio.get_event_loop
+
+
+class AsyncConnectionPool(object):
+    """A pool of persistent (keep-alive) HTTPS connections to a BIGIP, for
+    use from an asyncio event loop.
+
+    At most maxsize connections are open at once. Requests made while they
+    are all busy wait for one to become free.
+    """
+    def __init__(self, hostname, port=443, verify=False, timeout=90,
+                 maxsize=8):
+        """init
+
+        @param hostname: The IP address or hostname of the BIGIP.
+        @param port: The port of the iControl portal.
+        @param verify: When True, performs SSL certificate validation.
+        @param timeout: The time (in seconds) to wait for a request to
+            complete.
+        @param maxsize: The maximum number of connections.
+        """
+        self.hostname = hostname
+        self.port = port
+        self.timeout = timeout
+        self.maxsize = maxsize
+        # The host to connect to (without IPv6 brackets).
+        self._host = hostname.strip('[]')
+        self._host_header = bigsuds_transport._host_header(self._host.lower(),
+                                                 int(port))
+        self._context = bigsuds_transport._ssl_context(verify) or True
+        self._idle = []
+        self._slots = None
+        self._stats = dict.fromkeys(
+            ('requests', 'created', 'reused', 'retried', 'discarded'), 0)
+
+    def stats(self):
+        """Returns a dict of counters describing connection reuse (see
+        L{bigsuds.ConnectionPool.stats})."""
+        return dict(self._stats)
+
+    async def request(self, method, url, body=b'', headers=None):
+        """Sends an HTTP request and reads the whole response.
+
+        @param method: The HTTP method (e.g. "POST").
+        @param url: The path (and query) to request.
+        @param body: The (bytes) request body.
+        @param headers: A dict of request headers.
+        @return: A tuple of (status, reason, headers, body). The names of the
+            response headers are lower-case.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.maxsize)
+        async with self._slots:
+            while True:
+                conn, reused = await self._acquire()
+                try:
+                    response = await asyncio.wait_for(
+                        self._exchange(conn, method, url, body, headers or {}),
+                        self.timeout)
+                except asyncio.TimeoutError:
+                    # (An OSError since Python 3.11.) The BIGIP may still
+                    # process the request, so it must not be sent again.
+                    self._discard(conn)
+                    raise
+                except _ClosedBeforeReply as e:
+                    self._discard(conn)
+                    if not reused:
+                        raise e.error
+                    # The BIGIP closed the idle connection, retry on a new
+                    # one.
+                    self._stats['retried'] += 1
+                    continue
+                except BaseException:
+                    self._discard(conn)
+                    raise
+                status, reason, response_headers, data, keep_alive = response
+                if keep_alive:
+                    self._idle.append(conn)
+                else:
+                    self._discard(conn)
+                return status, reason, response_headers, data
+
+    def close(self):
+        """Closes all idle connections."""
+        idle, self._idle = self._idle, []
+        for _, writer in idle:
+            writer.close()
+
+    async def _acquire(self):
+        self._stats['requests'] += 1
+        while self._idle:
+            conn = self._idle.pop()
+            if not conn[1].transport.is_closing():
+                self._stats['reused'] += 1
+                return conn, True
+            self._discard(conn)
+        self._stats['created'] += 1
+        conn = await asyncio.wait_for(
+            asyncio.open_connection(self._host, self.port,
+                                    ssl=self._context),
+            self.timeout)
+        return conn, False
+
+    def _discard(self, conn):
+        conn[1].close()
+        self._stats['discarded'] += 1
+
+    async def _exchange(self, conn, method, url, body, headers):
+        # Sends a request on conn and returns (status, reason, headers, body,
+        # keep_alive) for its response.
+        reader, writer = conn
+        lines = ['%s %s HTTP/1.1' % (method, url),
+                 'Host: %s' % self._host_header,
+                 'Content-Length: %d' % len(body)]
+        lines.extend('%s: %s' % item for item in headers.items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') +
+                     body)
+        try:
+            # Waits for large bodies to be sent rather than buffering them.
+            await writer.drain()
+            head = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, ConnectionResetError,
+                BrokenPipeError) as e:
+            if getattr(e, 'partial', b''):
+                raise
+            raise _ClosedBeforeReply(e)
+        lines = head.decode('latin-1').split('\r\n')
+        status_line = lines[0].split(' ', 2)
+        version, status = status_line[0], int(status_line[1])
+        reason = len(status_line) > 2 and status_line[2] or ''
+        response_headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(':')
+                response_headers[name.strip().lower()] = value.strip()
+        keep_alive = (version == 'HTTP/1.1' and
+                      response_headers.get('connection', '').lower() !=
+                      'close')
+        if 'chunked' in response_headers.get('transfer-encoding', '').lower():
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(
+                    b';')[0], 16)
+                chunk = await reader.readexactly(size + 2)
+                if not size:
+                    break
+                chunks.append(chunk[:-2])
+            data = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            data = await reader.readexactly(
+                int(response_headers['content-length']))
+        else:
+            data = await reader.read()
+            keep_alive = False
+        return status, reason, response_headers, data, keep_alive
+
+
+class _ClosedBeforeReply(Exception):
+    # Raised when the BIGIP closed a connection before any of the reply to
+    # a request was read, so that it can safely be sent again.
+    def __init__(self, error):
+        Exception.__init__(self, str(error))
+        self.error = error
+
+
+class AsyncBIGIP(object):
+    """This class exposes the BIGIP's iControl interface to asyncio code.
+
+    Every iControl method is a coroutine function:
+        >>> b = AsyncBIGIP('bigip-hostname')
+        >>> await b.LocalLB.Pool.get_member(['/Common/test_pool'])
+        [[{'port': 20020, 'address': '10.10.10.10'}]]
+
+    The WSDL of a namespace is fetched and parsed (or loaded from the cache
+    or bundle) in the event loop's default executor the first time one of
+    its methods is called. Calls raise the same exceptions as those of a
+    L{bigsuds.BIGIP}.
+
+    Unlike a L{bigsuds.BIGIP}, calls are always authenticated with the
+    username and password (basic authentication, no token), requests and
+    replies are not compressed and calls are not limited by a
+    L{bigsuds.Scheduler} (only by pool_size), so AsyncBIGIP takes no
+    token_auth, compression or scheduler arguments.
+    """
+    def __init__(self, hostname, username='admin', password='admin',
+                 cachedir=None, verify=False, timeout=90, port=443,
+                 pool_size=8, bundle=None, fast_parse=False,
+                 result_format='native'):
+        """init
+
+        @param hostname: The IP address or hostname of the BIGIP.
+        @param username: The admin username on the BIGIP.
+        @param password: The admin password on the BIGIP.
+        @param cachedir: The directory to cache parsed wsdls in, or a
+            L{bigsuds.WsdlCache}.
+        @param verify: When True, performs SSL certificate validation.
+        @param timeout: The time (in seconds) to wait for a call to
+            complete.
+        @param port: The port of the iControl portal.
+        @param pool_size: The maximum number of connections to the BIGIP.
+        @param bundle: A L{bigsuds.WsdlBundle} (or the path to one).
+        @param fast_parse: When True, iControl replies are parsed straight
+            from XML into native types, skipping the suds object tree.
+        @param result_format: How complex iControl types are returned (see
+            L{bigsuds.BIGIP}).
+        """
+        self._hostname = hostname
+        self._username = username
+        self._password = password
+        self._bigip = bigsuds.BIGIP(hostname, username, password,
+                                    cachedir=cachedir, verify=verify,
+                                    timeout=timeout, port=port, pool_size=0,
+                                    bundle=bundle, fast_parse=fast_parse,
+                                    thread_safe=True,
+                                    result_format=result_format)
+        self._pool = AsyncConnectionPool(hostname, port, verify, timeout,
+                                         pool_size)
+        self._clients = {}
+        self._headers = {}
+
+    @property
+    def connection_pool(self):
+        """The L{AsyncConnectionPool} used by this instance."""
+        return self._pool
+
+    async def with_session_id(self, session_id=None):
+        """Returns a new instance of L{AsyncBIGIP} that uses a session id
+        (see L{bigsuds.BIGIP.with_session_id}).
+
+        The new instance shares the clients and connections of this one.
+
+        Example:
+            >>> session = await b.with_session_id()
+
+        @param session_id: The integer session id to use. If None, a new
+            session id will be requested from the BIGIP.
+        """
+        if session_id is None:
+            session_id = await self.System.Session.get_session_identifier()
+        session = object.__new__(type(self))
+        session.__dict__.update(self.__dict__)
+        for name in list(session.__dict__):
+            if isinstance(session.__dict__[name], _AsyncNamespace):
+                del session.__dict__[name]
+        session._headers = {'X-iControl-Session': str(session_id)}
+        return session
+
+    def close(self):
+        """Closes all idle connections."""
+        self._pool.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            return getattr(super(AsyncBIGIP, self), attr)
+        if '_' in attr:
+            # Backwards compatibility with pycontrol:
+            first, second = attr.split('_', 1)
+            return getattr(getattr(self, first), second)
+        ns = _AsyncNamespace(attr, self)
+        setattr(self, attr, ns)
+        return ns
+
+    async def _client(self, wsdl_name):
+        # Returns the (thread-safe) bigsuds client wrapper for wsdl_name,
+        # loading it in the executor on first use.
+        future = self._clients.get(wsdl_name)
+        if future is None:
+            module, interface = wsdl_name.split('.', 1)
+            future = _running_loop().run_in_executor(
+                None, bigsuds._lookup, self._bigip, (module, interface))
+            self._clients[wsdl_name] = future
+        try:
+            return await asyncio.shield(future)
+        except bigsuds.OperationFailed:
+            # Try again on the next call.
+            if self._clients.get(wsdl_name) is future:
+                del self._clients[wsdl_name]
+            raise
+
+    async def _call(self, wsdl_name, name, args, kwargs):
+        wrapper = await self._client(wsdl_name)
+        wrapped = getattr(wrapper, name)
+        method = wrapped._method
+        if log.isEnabledFor(logging.DEBUG):
+            bigsuds._log_call('Executing', wsdl_name, name, args, kwargs)
+        args, kwargs, request = bigsuds._build_request(
+            method, wrapped._arg_processor, args, kwargs)
+        request.headers.update(self._headers)
+        request.headers['Authorization'] = bigsuds_transport._basic_auth(
+            self._username, self._password)
+        url = urlsplit(request.url).path
+        try:
+            status, reason, _, body = await self._pool.request(
+                'POST', url, request.message, request.headers)
+        except asyncio.TimeoutError:
+            raise ConnectionError('iControl call timed out')
+        except (OSError, EOFError, ValueError) as e:
+            raise ConnectionError('URLError: %s' % e)
+        if status in (202, 204):
+            return None
+        with bigsuds._translated_errors():
+            if status == 500:
+                # Raises a WebFault for the SOAP fault.
+                method(__inject={'reply': body, 'status': status,
+                                 'description': reason}, *args, **kwargs)
+            if status != 200:
+                raise ConnectionError('iControl call failed: HTTP %d %s' % (
+                    status, reason))
+            return bigsuds._process_reply(method, wrapped._result_processor,
+                                          body)
+
+
+class _AsyncNamespace(object):
+    """Represents a top level iControl namespace of an L{AsyncBIGIP}.
+
+    Example:
+        <LocalLB namespace>.Pool returns the client for "LocalLB.Pool"
+    """
+    def __init__(self, name, bigip):
+        self._name = name
+        self._bigip = bigip
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            return getattr(super(_AsyncNamespace, self), attr)
+        client = _AsyncClientWrapper('%s.%s' % (self._name, attr), self._bigip)
+        setattr(self, attr, client)
+        return client
+
+
+class _AsyncClientWrapper(object):
+    """The iControl methods of one namespace of an L{AsyncBIGIP}, as
+    coroutine functions."""
+    def __init__(self, wsdl_name, bigip):
+        self._wsdl_name = wsdl_name
+        self._bigip = bigip
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            return getattr(super(_AsyncClientWrapper, self), attr)
+        bigip, wsdl_name = self._bigip, self._wsdl_name
+
+        async def method(*args, **kwargs):
+            return await bigip._call(wsdl_name, attr, args, kwargs)
+        method.__name__ = str(attr)
+        method.__doc__ = 'Wrapper for %s.%s' % (wsdl_name, attr)
+        setattr(self, attr, method)
+        return method
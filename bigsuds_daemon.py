@@ -0,0 +1,580 @@
+#!/usr/bin/env python
+"""A daemon keeping warm iControl clients for short-lived scripts.
+
+Creating a L{bigsuds.BIGIP} and making its first calls means fetching and
+parsing WSDLs, which takes much longer than the calls themselves. The daemon
+keeps BIGIP instances (with their parsed WSDLs and keep-alive connection
+pools) and makes iControl calls for the scripts connected to it over a Unix
+domain socket, so each call costs one local round trip.
+
+Start the daemon once (e.g. from a service manager), warming the namespaces
+the scripts use:
+    $ python bigsuds_daemon.py -u admin -w LocalLB.Pool bigip1 bigip2
+
+and use L{DaemonBIGIP} in place of L{bigsuds.BIGIP} in the scripts:
+    > from bigsuds_daemon import DaemonBIGIP as BIGIP
+    > b = BIGIP('bigip1', 'admin', 'secret')
+    > b.LocalLB.Pool.get_list()
+    ['/Common/test_pool']
+
+Arguments, results and exceptions are the same as with L{bigsuds.BIGIP}.
+When no daemon is running, L{DaemonBIGIP} makes the calls itself.
+
+Requests and replies are sent as JSON. The socket is created readable and
+writable by the user running the daemon only, and clients refuse to use a
+socket owned by another user.
+"""
+import argparse
+import errno
+import getpass
+import json
+import logging
+import os
+import socket
+import stat
+import struct
+import tempfile
+import threading
+from array import array
+from collections import OrderedDict
+
+import six
+from six.moves import socketserver
+
+import bigsuds
+from bigsuds import (ArgumentError, ConnectionError, MethodNotFound,
+                     OperationFailed)
+
+log = logging.getLogger('bigsuds')
+
+_HEADER = struct.Struct('>I')
+
+
+def default_socket_path():
+    """Returns the socket path used when none is given: $BIGSUDS_SOCKET,
+    bigsuds.sock in $XDG_RUNTIME_DIR (a directory private to the user), or
+    bigsuds-<user>.sock in the temporary directory."""
+    if os.environ.get('BIGSUDS_SOCKET'):
+        return os.environ['BIGSUDS_SOCKET']
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        return os.path.join(os.environ['XDG_RUNTIME_DIR'], 'bigsuds.sock')
+    return os.path.join(tempfile.gettempdir(),
+                        'bigsuds-%s.sock' % getpass.getuser())
+
+
+class Daemon(object):
+    """Makes iControl calls for L{DaemonBIGIP} clients connected to a Unix
+    domain socket.
+
+    A thread-safe L{bigsuds.BIGIP} is kept for each device (hostname,
+    credentials and BIGIP options) clients use, created on first use or by
+    L{add_device}. Their parsed WSDLs are shared through
+    L{bigsuds.wsdl_registry} (unless share_wsdls=False is given), so a
+    client using other options for a device does not fetch WSDLs again.
+    Each client connection is served by its own thread.
+    """
+    def __init__(self, path=None, max_sessions=256):
+        """init
+
+        @param path: The socket path. Defaults to L{default_socket_path}().
+            A stale socket file left by a daemon that is no longer running is
+            replaced, unless it belongs to another user.
+        @param max_sessions: The maximum number of session instances (see
+            L{bigsuds.BIGIP.with_session_id}) kept, least recently used
+            first out.
+        @raise ConnectionError: When another daemon is listening on path, or
+            it belongs to another user.
+        """
+        self.path = path or default_socket_path()
+        self._max_sessions = max_sessions
+        self._bigips = {}
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._locks = bigsuds._LockMap()
+        self._connections = set()
+        self._counters = {'requests': 0, 'errors': 0, 'connections': 0}
+        self._thread = None
+        _remove_stale_socket(self.path)
+        # The socket is created with the right permissions, rather than
+        # changed after being bound.
+        umask = os.umask(0o177)
+        try:
+            self._server = _Server(self.path, _Handler)
+        finally:
+            os.umask(umask)
+        self._server.bigsuds_daemon = self
+
+    def add_device(self, hostname, username='admin', password='admin',
+                   namespaces=(), **options):
+        """Creates the BIGIP used by clients connecting to this device with
+        the same options, and loads the given namespaces.
+
+        @param namespaces: The namespaces to load (e.g. ["LocalLB.Pool"]).
+        @param options: The other arguments of L{bigsuds.BIGIP}.
+        @return: The L{bigsuds.BIGIP}.
+        """
+        bigip = self._bigip(_device_key(hostname, username, password,
+                                        options))
+        for wsdl_name in namespaces:
+            bigsuds._lookup(bigip, wsdl_name.split('.'))
+        return bigip
+
+    def serve_forever(self):
+        """Serves clients until L{stop} is called."""
+        log.info('bigsuds daemon listening on %s', self.path)
+        self._server.serve_forever()
+
+    def start(self):
+        """Serves clients on a background thread.
+
+        @return: The daemon.
+        """
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        name='bigsuds-daemon')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving, closes the client connections and removes the
+        socket."""
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.stop()
+
+    def stats(self):
+        """Returns a dict of the number of requests served, requests which
+        raised an error, client connections accepted, devices and sessions.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['devices'] = len(self._bigips)
+            stats['sessions'] = len(self._sessions)
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _bigip(self, key, session_id=None):
+        bigip = self._bigips.get(key)
+        if bigip is None:
+            with self._locks(key):
+                bigip = self._bigips.get(key)
+                if bigip is None:
+                    hostname, username, password, options = key
+                    options = dict(options, thread_safe=True)
+                    options.setdefault('share_wsdls', True)
+                    bigip = bigsuds.BIGIP(hostname, username, password,
+                                          **options)
+                    with self._lock:
+                        self._bigips[key] = bigip
+        if session_id is None:
+            return bigip
+        with self._lock:
+            session = self._sessions.pop((key, session_id), None)
+            if session is None:
+                session = bigip.with_session_id(session_id)
+            self._sessions[(key, session_id)] = session
+            while len(self._sessions) > self._max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def _handle(self, request):
+        # Returns the reply to a request: ("ok", result) or ("error",
+        # error state).
+        self._count('requests')
+        try:
+            key, session_id, wsdl_name, method, args, kwargs = request
+            hostname, username, password, options = key
+            key = _device_key(hostname, username, password, dict(options))
+            names = wsdl_name.split('.') + [method]
+            if any(name.startswith('_') for name in names):
+                raise MethodNotFound(method)
+            bigip = self._bigip(key, session_id)
+            return 'ok', bigsuds._lookup(bigip, names)(*args, **kwargs)
+        except Exception as e:
+            self._count('errors')
+            if not isinstance(e, OperationFailed):
+                log.debug('bigsuds daemon request failed', exc_info=True)
+            return 'error', _error_state(e)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    # Answers the requests of one client connection, one at a time.
+    def handle(self):
+        daemon = self.server.bigsuds_daemon
+        daemon._count('connections')
+        with daemon._lock:
+            daemon._connections.add(self.connection)
+        try:
+            while True:
+                try:
+                    request = _read_message(self.rfile)
+                except (EOFError, ValueError, socket.error):
+                    return
+                if request is None:
+                    return
+                reply = daemon._handle(request)
+                try:
+                    data = _encode_message(reply)
+                except (TypeError, ValueError) as e:
+                    data = _encode_message(('error', _error_state(
+                        OperationFailed("The result can't be sent by the "
+                                        "bigsuds daemon: %s" % e))))
+                self.connection.sendall(data)
+        except socket.error:
+            pass
+        finally:
+            with daemon._lock:
+                daemon._connections.discard(self.connection)
+
+
+def _remove_stale_socket(path):
+    try:
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            return
+    except OSError:
+        return
+    _check_owner(path)
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except socket.error:
+        os.unlink(path)
+    else:
+        raise ConnectionError('A bigsuds daemon is already listening on %s'
+                              % path)
+    finally:
+        probe.close()
+
+
+def _check_owner(path):
+    # Another user owning the socket could impersonate the daemon and read
+    # the credentials sent by clients.
+    try:
+        owner = os.stat(path).st_uid
+    except OSError:
+        return
+    if owner != os.getuid():
+        raise ConnectionError('The bigsuds daemon socket %s belongs to '
+                              'another user' % path)
+
+
+def _encode_message(message):
+    data = json.dumps(message, default=_encode_value,
+                      separators=(',', ':')).encode('ascii')
+    return _HEADER.pack(len(data)) + data
+
+
+def _read_message(rfile):
+    # Returns the next message, or None at the end of the stream.
+    header = rfile.read(_HEADER.size)
+    if not header:
+        return None
+    if len(header) < _HEADER.size:
+        raise EOFError('Truncated message header')
+    size, = _HEADER.unpack(header)
+    data = rfile.read(size)
+    if len(data) < size:
+        raise EOFError('Truncated message')
+    return json.loads(data.decode('utf-8'), object_hook=_decode_value)
+
+
+def _encode_value(value):
+    # Sends the values JSON has no type for (records and the arrays of
+    # result_format="columns") as tagged objects.
+    if isinstance(value, bigsuds.Record):
+        return {'__record__': [type(value).__name__, value._fields,
+                               value._asdict()]}
+    if isinstance(value, array):
+        return {'__array__': [value.typecode, value.tolist()]}
+    raise TypeError('%r is not JSON serializable' % (value,))
+
+
+def _decode_value(value):
+    # Recreates the values sent by _encode_value().
+    if len(value) == 1:
+        if '__record__' in value:
+            name, fields, values = value['__record__']
+            return bigsuds._new_record(
+                str(name), tuple(str(field) for field in fields),
+                dict((str(field), item)
+                     for field, item in six.iteritems(values)))
+        if '__array__' in value:
+            typecode, items = value['__array__']
+            return array(str(typecode), items)
+    return value
+
+
+def _device_key(hostname, username, password, options):
+    key = (hostname, username, password, tuple(sorted(options.items())))
+    try:
+        hash(key)
+    except TypeError:
+        raise ValueError('BIGIP options used through the bigsuds daemon '
+                         'must be plain values: %r' % (options,))
+    return key
+
+
+def _error_state(error):
+    # Exceptions are sent as their class name, message and plain
+    # attributes.
+    if isinstance(error, OperationFailed):
+        name = type(error).__name__
+        message = str(error)
+    else:
+        name = OperationFailed.__name__
+        message = '%s: %s' % (type(error).__name__, error)
+    attrs = {}
+    for attr, value in six.iteritems(getattr(error, '__dict__', {})):
+        if isinstance(value, OperationFailed):
+            attrs[attr] = _error_state(value)
+        elif value is None or isinstance(value, (six.string_types, int)):
+            attrs[attr] = value
+    return name, message, attrs
+
+
+def _error(state):
+    # Recreates an exception sent by _error_state().
+    name, message, attrs = state
+    cls = getattr(bigsuds, name, None)
+    if not (isinstance(cls, type) and issubclass(cls, OperationFailed)):
+        cls = OperationFailed
+    error = cls.__new__(cls)
+    Exception.__init__(error, message)
+    for attr, value in six.iteritems(attrs):
+        if isinstance(value, (tuple, list)):
+            value = _error(value)
+        setattr(error, attr, value)
+    return error
+
+
+class _DaemonNotRunning(Exception):
+    pass
+
+
+class _Channel(object):
+    # The connections of a DaemonBIGIP (and its sessions) to the daemon. Each
+    # request takes an idle connection, or opens one, so that threads don't
+    # wait for each other.
+    def __init__(self, path):
+        self.path = path
+        self._idle = []
+
+    def request(self, data):
+        # Sends a message encoded by _encode_message() and returns the reply.
+        try:
+            sock, rfile = self._idle.pop()
+        except IndexError:
+            sock, rfile = self._connect()
+        try:
+            sock.sendall(data)
+            reply = _read_message(rfile)
+            if reply is None:
+                raise EOFError('The bigsuds daemon closed the connection')
+        except (EOFError, ValueError, socket.error) as e:
+            rfile.close()
+            sock.close()
+            raise ConnectionError('Lost the connection to the bigsuds daemon '
+                                  'at %s: %s' % (self.path, e))
+        self._idle.append((sock, rfile))
+        return reply
+
+    def close(self):
+        while self._idle:
+            sock, rfile = self._idle.pop()
+            rfile.close()
+            sock.close()
+
+    def _connect(self):
+        _check_owner(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except socket.error as e:
+            sock.close()
+            if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+                raise _DaemonNotRunning(str(e))
+            raise ConnectionError('Failed to connect to the bigsuds daemon '
+                                  'at %s: %s' % (self.path, e))
+        return sock, sock.makefile('rb')
+
+
+class DaemonBIGIP(object):
+    """A drop-in replacement for L{bigsuds.BIGIP} whose iControl calls are
+    made by a L{Daemon}.
+
+    Example:
+        > b = DaemonBIGIP('bigip-hostname')
+        > b.LocalLB.Pool.get_list()
+        ['/Common/test_pool']
+
+    Each call is one round trip to the daemon, which uses its warm clients
+    for the device (hostname, credentials and options). The instance (and
+    its sessions) can be used by several threads at once.
+    """
+    def __init__(self, hostname, username='admin', password='admin',
+                 socket_path=None, fallback=True, **options):
+        """init
+
+        @param hostname: The IP address or hostname of the BIGIP.
+        @param username: The admin username on the BIGIP.
+        @param password: The admin password on the BIGIP.
+        @param socket_path: The daemon's socket. Defaults to
+            L{default_socket_path}().
+        @param fallback: When no daemon is listening on the socket, make the
+            calls with a local L{bigsuds.BIGIP} instead of raising
+            L{ConnectionError}.
+        @param options: The other arguments of L{bigsuds.BIGIP} (like port,
+            verify, timeout, fast_parse or result_format), which the daemon's
+            BIGIP for the device is created with. They must be plain values.
+        """
+        self._hostname = hostname
+        self._username = username
+        self._password = password
+        self._options = options
+        self._key = _device_key(hostname, username, password, options)
+        self._session_id = None
+        self._fallback = fallback
+        self._channel = _Channel(socket_path or default_socket_path())
+        self._local = None
+
+    def with_session_id(self, session_id=None):
+        """Returns a new instance of L{DaemonBIGIP} that uses a unique session
+        id. See L{bigsuds.BIGIP.with_session_id}.
+        """
+        if session_id is None:
+            session_id = self.System.Session.get_session_identifier()
+        if self._local is not None:
+            return self._local.with_session_id(session_id)
+        session = object.__new__(type(self))
+        session.__dict__.update(
+            (name, value) for name, value in six.iteritems(self.__dict__)
+            if name.startswith('_'))
+        session._session_id = session_id
+        return session
+
+    def close(self):
+        """Closes the connections to the daemon."""
+        self._channel.close()
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            return getattr(super(DaemonBIGIP, self), attr)
+        if '_' in attr:
+            # Backwards compatibility with pycontrol:
+            first, second = attr.split('_', 1)
+            return getattr(getattr(self, first), second)
+        return _DaemonAttribute(self, (attr,))
+
+    def _call(self, names, args, kwargs):
+        if self._local is None:
+            request = (self._key, self._session_id, '.'.join(names[:-1]),
+                       names[-1], args, kwargs)
+            try:
+                data = _encode_message(request)
+            except (TypeError, ValueError) as e:
+                raise ArgumentError('The arguments passed to method %s can '
+                                    'not be sent to the bigsuds daemon: %s' % (
+                                        '.'.join(names), e))
+            try:
+                status, value = self._channel.request(data)
+            except _DaemonNotRunning as e:
+                if not self._fallback:
+                    raise ConnectionError('No bigsuds daemon is listening on '
+                                          '%s: %s' % (self._channel.path, e))
+                log.debug('No bigsuds daemon is listening on %s, calling '
+                          '%s directly', self._channel.path, self._hostname)
+                self._local = bigsuds.BIGIP(self._hostname, self._username,
+                                            self._password, **self._options)
+                if self._session_id is not None:
+                    self._local = self._local.with_session_id(
+                        self._session_id)
+            else:
+                if status == 'error':
+                    raise _error(value)
+                return value
+        return bigsuds._lookup(self._local, names)(*args, **kwargs)
+
+
+class _DaemonAttribute(object):
+    # An attribute path (like ("LocalLB", "Pool", "get_list")) looked up on a
+    # DaemonBIGIP. Calling it calls the method through the daemon.
+    def __init__(self, bigip, names):
+        self._bigip = bigip
+        self._names = names
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            return getattr(super(_DaemonAttribute, self), attr)
+        return _DaemonAttribute(self._bigip, self._names + (attr,))
+
+    def __call__(self, *args, **kwargs):
+        return self._bigip._call(self._names, args, kwargs)
+
+
+def main(argv=None):
+    """The bigsuds daemon command line interface."""
+    parser = argparse.ArgumentParser(
+        prog='bigsuds_daemon', description='Keep warm iControl clients for '
+        'the given BIGIPs and make iControl calls for DaemonBIGIP clients.')
+    parser.add_argument('hostnames', nargs='*', metavar='hostname',
+                        help='A BIGIP to warm clients for. Clients for other '
+                        'BIGIPs are created when first used.')
+    parser.add_argument('-s', '--socket', help='The socket path. Defaults to '
+                        '$BIGSUDS_SOCKET or %s.' % default_socket_path())
+    parser.add_argument('-u', '--username', default='admin')
+    parser.add_argument('-p', '--password',
+                        help='Prompted for when not specified.')
+    parser.add_argument('--port', type=int, default=443)
+    parser.add_argument('-w', '--wsdl', action='append', dest='wsdl_names',
+                        default=[], help='A namespace to load (e.g. '
+                        'LocalLB.Pool). May be repeated.')
+    args = parser.parse_args(argv)
+
+    daemon = Daemon(args.socket)
+    if args.hostnames:
+        password = args.password
+        if password is None:
+            password = getpass.getpass()
+        options = {}
+        if args.port != 443:
+            options['port'] = args.port
+        for hostname in args.hostnames:
+            daemon.add_device(hostname, args.username, password,
+                              args.wsdl_names, **options)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.stop()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
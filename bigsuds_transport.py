@@ -0,0 +1,1228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""The HTTPS transports, connection pool, authentication,
+compression and scheduling of bigsuds' iControl requests.
+
+Everything public is also available from the bigsuds module.
+"""
+try:
+    # Python 2.x
+    import httplib
+    from urllib2 import URLError
+    from urllib2 import HTTPSHandler
+    from urllib2 import BaseHandler
+    from urllib2 import Request as URLRequest
+    from urllib import addinfourl
+except ImportError:
+     # Python 3.x
+     import http.client as httplib
+     from urllib.error import URLError
+     from urllib.request import HTTPSHandler
+     from urllib.request import BaseHandler
+     from urllib.request import Request as URLRequest
+     from urllib.response import addinfourl
+
+from six.moves.urllib.parse import unquote, urlsplit
+from six.moves.urllib.request import getproxies, proxy_bypass
+from io import BytesIO
+import base64
+import contextlib
+import errno
+import heapq
+import itertools
+import json
+import logging
+import re
+import socket
+import ssl
+import threading
+import time
+import zlib
+
+from suds.transport import TransportError, Reply
+from suds.transport.http import HttpTransport
+from suds.transport.https import HttpAuthenticated
+
+import six
+
+log = logging.getLogger('bigsuds')
+
+
+# We need to add support for SSL Contexts for Python 2.7.9+
+class HTTPSHandlerNoVerify(HTTPSHandler):
+    def __init__(self, *args, **kwargs):
+        try:
+            kwargs['context'] = ssl._create_unverified_context()
+        except AttributeError:
+            # Python prior to 2.7.9 doesn't have default-enabled certificate
+            # verification
+            pass
+
+        HTTPSHandler.__init__(self, *args, **kwargs)
+
+class HTTPSTransport(HttpAuthenticated):
+    """A suds transport which sends the credentials with every request,
+    rather than only after the BIGIP answers with a 401 challenge (which
+    costs a round trip).
+
+    @ivar auth: A L{TokenAuth} whose token is sent instead of the username
+        and password, or None.
+    @ivar compression: The L{Compression} of requests and replies, or None.
+    @ivar scheduler: The L{Scheduler} of iControl calls, or None.
+    """
+    def __init__(self, auth=None, compression=None, scheduler=None,
+                 **kwargs):
+        HttpAuthenticated.__init__(self, **kwargs)
+        self.auth = auth
+        self.compression = compression
+        self.scheduler = scheduler
+
+    def send(self, request):
+        if self.scheduler is None:
+            return HttpAuthenticated.send(self, request)
+        with self.scheduler.slot(_request_priority(self.scheduler, request)):
+            return HttpAuthenticated.send(self, request)
+
+    def __deepcopy__(self, memo=None):
+        # suds copies the options only (thread-safe clients copy the
+        # transport of their client).
+        clone = HttpAuthenticated.__deepcopy__(self, memo)
+        clone.auth = self.auth
+        clone.compression = self.compression
+        clone.scheduler = self.scheduler
+        return clone
+
+    def u2handlers(self):
+        handlers = HttpAuthenticated.u2handlers(self)
+        if self.compression is not None:
+            handlers.append(_GzipHandler(self.compression))
+        return handlers
+
+    def addcredentials(self, request):
+        if self.auth is not None:
+            request.headers.update(self.auth.headers())
+            return
+        HttpAuthenticated.addcredentials(self, request)
+        username, password = self.credentials()
+        if username is not None and password is not None:
+            request.headers['Authorization'] = _basic_auth(username, password)
+
+
+class HTTPSTransportNoVerify(HTTPSTransport):
+    def u2handlers(self):
+        handlers = HTTPSTransport.u2handlers(self)
+        handlers.append(HTTPSHandlerNoVerify())
+        return handlers
+
+
+class _GzipHandler(BaseHandler):
+    # Asks for gzip compressed replies and decompresses them, and compresses
+    # request bodies, for the urllib based transports.
+
+    # Before AbstractHTTPHandler sets the Content-Length of the body.
+    handler_order = 400
+
+    def __init__(self, compression):
+        self.compression = compression
+
+    def https_request(self, request):
+        if self.compression.accept:
+            request.add_unredirected_header('Accept-Encoding', 'gzip')
+        data = request.data
+        if data is not None:
+            body, compressed = self.compression.compress(data)
+            if compressed:
+                request.data = body
+                request.add_unredirected_header('Content-Encoding', 'gzip')
+                request.uncompressed_data = data
+        return request
+
+    def https_response(self, request, response):
+        headers = response.info()
+        encoding = headers.get('Content-Encoding')
+        reader = self.compression.reader(response, encoding)
+        if encoding == 'gzip':
+            # suds mustn't decompress the body again.
+            del headers['Content-Encoding']
+        decoded = addinfourl(reader, headers, response.geturl(),
+                             response.code)
+        decoded.msg = response.msg
+        return decoded
+
+    def http_error_415(self, request, fp, code, msg, headers):
+        # The BIGIP doesn't take compressed requests: send it uncompressed.
+        data = getattr(request, 'uncompressed_data', None)
+        if data is None:
+            return None
+        self.compression.reject()
+        fp.read()
+        fp.close()
+        retry = URLRequest(request.get_full_url(), data,
+                           dict(request.headers))
+        return self.parent.open(retry, timeout=request.timeout)
+
+    http_request = https_request
+    http_response = https_response
+
+
+def _ssl_context(verify):
+    # Returns the SSL context to use for connections to the BIGIP, or None
+    # for Python versions that don't support SSL contexts.
+    try:
+        if verify:
+            return ssl.create_default_context()
+        return ssl._create_unverified_context()
+    except AttributeError:
+        return None
+
+
+class ConnectionPool(object):
+    """A pool of persistent (keep-alive) HTTPS connections to a BIGIP.
+
+    Each connection is used for one request at a time and is put back into
+    the pool once its response has been read, so that consecutive iControl
+    calls reuse an established TCP/TLS session instead of doing a new
+    handshake each time. A L{BIGIP} shares a single pool between all of its
+    namespace clients (and the clients of its sessions).
+
+    Like the urllib2 based transports, connections are tunnelled through
+    the proxy of the https_proxy environment variable, unless no_proxy
+    lists the BIGIP.
+    """
+    def __init__(self, hostname, port=443, verify=False, timeout=90,
+                 maxsize=8):
+        """init
+
+        @param hostname: The IP address or hostname of the BIGIP.
+        @param port: The port of the iControl portal.
+        @param verify: When True, performs SSL certificate validation.
+        @param timeout: The time (in seconds) to wait before timing out
+            a connection.
+        @param maxsize: The number of idle connections kept open. More
+            connections are opened when there are more concurrent requests,
+            but only this many are kept once they finish.
+        """
+        self.hostname = hostname
+        self.port = port
+        self.verify = verify
+        self.timeout = timeout
+        self.maxsize = maxsize
+        # The host and port as urlsplit() returns them, to compare URLs with.
+        self._host = hostname.strip('[]').lower()
+        self._port = int(port)
+        self._context = _ssl_context(verify)
+        self._proxy = _https_proxy(self._host)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(
+            ('requests', 'created', 'reused', 'retried', 'discarded'), 0)
+
+    def stats(self):
+        """Returns a dict of counters describing connection reuse.
+
+        requests: The number of HTTP requests sent through the pool.
+        created: The number of new connections (TCP/TLS handshakes).
+        reused: The number of requests sent on an already open connection.
+        retried: The number of requests resent because a kept-alive
+            connection had been closed by the BIGIP before replying.
+            Requests which may have reached the BIGIP (e.g. on a timeout)
+            are not resent, as iControl calls aren't idempotent.
+        discarded: The number of connections closed by the pool.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def owns(self, url):
+        """Returns True when the url is served by this pool's BIGIP."""
+        parts = urlsplit(url)
+        return (parts.scheme == 'https' and parts.hostname == self._host
+                and (parts.port or 443) == self._port)
+
+    def request(self, method, url, body=None, headers=None):
+        """Sends an HTTP request and reads the whole response.
+
+        @param method: The HTTP method (e.g. "POST").
+        @param url: The path (and query) to request.
+        @param body: The (bytes) request body.
+        @param headers: A dict of request headers.
+        @return: A tuple of (status, reason, headers, body). The names of the
+            response headers are lower-case.
+        """
+        conn, response = self._send(method, url, body, headers)
+        try:
+            data = response.read()
+        except (socket.error, httplib.HTTPException):
+            self._discard(conn)
+            raise
+        self._finish(conn, response)
+        return (response.status, response.reason, _response_headers(response),
+                data)
+
+    def open(self, method, url, body=None, headers=None):
+        """Sends an HTTP request without reading the response body.
+
+        The connection goes back into the pool once the body has been read
+        to the end. Closing the body before that closes the connection.
+
+        @param method: The HTTP method (e.g. "POST").
+        @param url: The path (and query) to request.
+        @param body: The (bytes) request body.
+        @param headers: A dict of request headers.
+        @return: A tuple of (status, reason, headers, body). The names of the
+            response headers are lower-case and body is a file-like object.
+        """
+        conn, response = self._send(method, url, body, headers)
+        return (response.status, response.reason, _response_headers(response),
+                _PooledResponse(self, conn, response))
+
+    def pipeline(self, method, requests, depth=16):
+        """Sends HTTP requests back to back over one connection (HTTP
+        pipelining) and reads their responses in order.
+
+        Up to depth requests are sent ahead of the response being read, so
+        the requests cost one round trip rather than one each. When the
+        BIGIP closes the connection before answering them all (e.g. after
+        its maximum number of keep-alive requests), the rest are sent over
+        another connection.
+
+        @param method: The HTTP method (e.g. "POST").
+        @param requests: A list of (url, body, headers) tuples.
+        @param depth: The maximum number of requests sent ahead.
+        @return: A list of (status, reason, headers, body) tuples, one per
+            request.
+        """
+        responses = []
+        while len(responses) < len(requests):
+            conn, reused = self._acquire()
+            with self._lock:
+                self._stats['requests'] += len(requests) - len(responses) - 1
+            answered = len(responses)
+            try:
+                closed = self._pipeline(conn, method,
+                                        requests[len(responses):], depth,
+                                        responses)
+            except (socket.error, httplib.HTTPException) as e:
+                self._discard(conn)
+                if not reused or len(responses) > answered or \
+                        not _closed_before_reply(e):
+                    raise
+                # The BIGIP closed the idle connection, retry on a new one.
+                self._count('retried')
+                continue
+            if closed:
+                self._discard(conn)
+            else:
+                self._release(conn)
+        return responses
+
+    def close(self):
+        """Closes all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _send(self, method, url, body, headers):
+        # Sends a request and returns the connection and its response.
+        while True:
+            conn, reused = self._acquire()
+            try:
+                conn.request(method, url, body, headers or {})
+                return conn, conn.getresponse()
+            except (socket.error, httplib.HTTPException) as e:
+                self._discard(conn)
+                if not reused or not _closed_before_reply(e):
+                    raise
+                # The BIGIP closed the idle connection, retry on a new one.
+                self._count('retried')
+
+    def _pipeline(self, conn, method, requests, depth, responses):
+        # Sends requests over conn and appends their responses to responses
+        # until one says the connection will be closed. Returns True then.
+        if conn.sock is None:
+            conn.connect()
+        host = _host_header(self._host, self._port)
+        reader = _SharedReader(conn.sock.makefile('rb'))
+        sent = 0
+        broken = False
+        try:
+            for index in range(len(requests)):
+                while not broken and sent < len(requests) and \
+                        sent < index + depth:
+                    url, body, headers = requests[sent]
+                    lines = ['%s %s HTTP/1.1' % (method, url),
+                             'Host: %s' % host,
+                             'Content-Length: %d' % len(body or b'')]
+                    if 'Accept-Encoding' not in (headers or {}):
+                        lines.append('Accept-Encoding: identity')
+                    lines.extend('%s: %s' % item for item in
+                                 sorted(six.iteritems(headers or {})))
+                    try:
+                        conn.sock.sendall(('\r\n'.join(lines) + '\r\n\r\n')
+                                          .encode('latin-1') + (body or b''))
+                    except socket.error:
+                        if sent == index:
+                            raise
+                        # The requests sent may have been answered (the
+                        # last one saying the connection would be closed):
+                        # read their responses before sending the rest.
+                        broken = True
+                        break
+                    sent += 1
+                if index == sent:
+                    return True
+                response = httplib.HTTPResponse(reader, method=method)
+                response.begin()
+                data = response.read()
+                responses.append((response.status, response.reason,
+                                  _response_headers(response), data))
+                if response.will_close:
+                    return True
+        finally:
+            reader.close_reader()
+        return False
+
+    def _finish(self, conn, response):
+        # Puts a connection whose response has been read back into the pool.
+        if response.will_close:
+            self._discard(conn)
+        else:
+            self._release(conn)
+
+    def _acquire(self):
+        with self._lock:
+            self._stats['requests'] += 1
+            if self._idle:
+                self._stats['reused'] += 1
+                return self._idle.pop(), True
+            self._stats['created'] += 1
+        kwargs = {'timeout': self.timeout}
+        if self._context is not None:
+            kwargs['context'] = self._context
+        if self._proxy is None:
+            return httplib.HTTPSConnection(self.hostname, self.port,
+                                           **kwargs), False
+        proxy_host, proxy_port, proxy_headers = self._proxy
+        conn = httplib.HTTPSConnection(proxy_host, proxy_port, **kwargs)
+        conn.set_tunnel(self.hostname, self._port, proxy_headers)
+        return conn, False
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.maxsize:
+                self._idle.append(conn)
+                return
+        self._discard(conn)
+
+    def _discard(self, conn):
+        conn.close()
+        self._count('discarded')
+
+
+def _host_header(host, port):
+    # Returns the Host header of requests to host (without IPv6 brackets)
+    # and port, as httplib writes it.
+    if ':' in host:
+        host = '[%s]' % host
+    if port != 443:
+        host = '%s:%d' % (host, port)
+    return host
+
+
+def _https_proxy(hostname):
+    # Returns the (host, port, headers) of the proxy to tunnel connections to
+    # hostname through, as urllib2's ProxyHandler would pick it, or None.
+    url = getproxies().get('https')
+    if not url or proxy_bypass(hostname):
+        return None
+    if '://' not in url:
+        url = 'http://' + url
+    parts = urlsplit(url)
+    headers = {}
+    if parts.username is not None:
+        headers['Proxy-Authorization'] = _basic_auth(
+            unquote(parts.username), unquote(parts.password or ''))
+    return parts.hostname, parts.port or 80, headers
+
+
+def _closed_before_reply(error):
+    # Returns True when a request failed because the BIGIP closed a
+    # kept-alive connection before any of the reply was received, so that
+    # the request can safely be sent again. Timeouts are never retried: the
+    # BIGIP may still be processing the request.
+    if isinstance(error, socket.timeout):
+        return False
+    if isinstance(error, httplib.BadStatusLine):
+        # (Including RemoteDisconnected.) An empty status line means no
+        # bytes were received.
+        return error.line in ('', "''")
+    if isinstance(error, _SSL_CLOSED_ERRORS):
+        return True
+    return isinstance(error, socket.error) and \
+        getattr(error, 'errno', None) in (errno.ECONNRESET, errno.EPIPE)
+
+
+# The errors of TLS connections closed by the peer (Python 2.7.9+).
+_SSL_CLOSED_ERRORS = tuple(getattr(ssl, name) for name in
+                           ('SSLEOFError', 'SSLZeroReturnError')
+                           if hasattr(ssl, name))
+
+
+class _SharedReader(object):
+    # Hands one buffered reader of a pipelined connection to each of its
+    # responses in turn. (Responses read ahead into the buffer, so each
+    # can't have a reader of its own, and they close theirs once read.)
+
+    def __init__(self, reader):
+        self._reader = reader
+
+    def makefile(self, *args, **kwargs):
+        return self
+
+    def close(self):
+        pass
+
+    def close_reader(self):
+        self._reader.close()
+
+    def __getattr__(self, name):
+        return getattr(self._reader, name)
+
+
+def _response_headers(response):
+    return dict((name.lower(), value) for name, value in
+                response.getheaders())
+
+
+class _PooledResponse(object):
+    # The file-like body of a response opened with ConnectionPool.open().
+
+    def __init__(self, pool, conn, response):
+        self._pool = pool
+        self._conn = conn
+        self._response = response
+
+    def read(self, size=-1):
+        response = self._response
+        if response is None:
+            return b''
+        try:
+            if size is None or size < 0:
+                data = response.read()
+            else:
+                data = response.read(size)
+        except (socket.error, httplib.HTTPException) as e:
+            self.close()
+            raise URLError(e)
+        if not data or response.isclosed():
+            self._response = None
+            self._pool._finish(self._conn, response)
+        return data
+
+    def close(self):
+        if self._response is not None:
+            # The rest of the body is still on the wire, so the connection
+            # can't be reused.
+            self._response = None
+            self._pool._discard(self._conn)
+
+
+def _basic_auth(username, password):
+    # Returns the value of a basic auth Authorization header.
+    credentials = ('%s:%s' % (username, password)).encode('utf-8')
+    return 'Basic %s' % base64.b64encode(credentials).decode('ascii')
+
+
+class TokenAuth(object):
+    """Authenticates iControl requests with a BIGIP authentication token
+    (the X-F5-Auth-Token header) instead of the username and password.
+
+    The token is requested once (from /mgmt/shared/authn/login) and shared
+    by all the clients of a L{BIGIP} and of its sessions. A new one is
+    requested shortly before it expires, and when the BIGIP rejects it.
+    """
+    HEADER = 'X-F5-Auth-Token'
+
+    def __init__(self, hostname, username='admin', password='admin',
+                 port=443, verify=False, timeout=90, pool=None,
+                 login_provider='tmos', margin=60):
+        """init
+
+        @param hostname: The IP address or hostname of the BIGIP.
+        @param username: The admin username on the BIGIP.
+        @param password: The admin password on the BIGIP.
+        @param port: The port of the iControl portal.
+        @param verify: When True, performs SSL certificate validation.
+        @param timeout: The time (in seconds) to wait before timing out
+            the login request.
+        @param pool: A L{ConnectionPool} to log in over.
+        @param login_provider: The BIGIP login provider to authenticate
+            with (e.g. "tmos" for local users).
+        @param margin: How long (in seconds) before the token expires a new
+            one is requested.
+        """
+        self.hostname = hostname
+        self.username = username
+        self.password = password
+        self.login_provider = login_provider
+        self.margin = margin
+        if pool is None:
+            pool = ConnectionPool(hostname, port, verify, timeout, maxsize=1)
+        self._pool = pool
+        self._token = None
+        self._expires = 0
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(('logins', 'invalidations'), 0)
+
+    def headers(self):
+        """Returns the headers authenticating a request, logging in first
+        when there is no valid token."""
+        with self._lock:
+            if self._token is None or \
+                    time.time() >= self._expires - self.margin:
+                self._login()
+            return {self.HEADER: self._token}
+
+    def invalidate(self, headers=None):
+        """Drops the token, so that the next request logs in again.
+
+        @param headers: The headers of the request the BIGIP rejected. The
+            token is only dropped when they hold it (another thread may
+            have replaced it already).
+        """
+        with self._lock:
+            if headers is None or headers.get(self.HEADER) == self._token:
+                self._token = None
+                self._stats['invalidations'] += 1
+
+    def stats(self):
+        """Returns the number of logins and of rejected tokens."""
+        with self._lock:
+            return dict(self._stats)
+
+    def _login(self):
+        # bigsuds imports this module, so its exceptions are imported here.
+        from bigsuds import ConnectionError, ParseError
+        body = json.dumps({'username': self.username,
+                           'password': self.password,
+                           'loginProviderName': self.login_provider})
+        try:
+            status, reason, _, data = self._pool.request(
+                'POST', '/mgmt/shared/authn/login', body.encode('utf-8'),
+                {'Content-Type': 'application/json'})
+        except (socket.error, httplib.HTTPException) as e:
+            raise ConnectionError('Logging in to the BIGIP failed: %s' % e)
+        if status != httplib.OK:
+            raise ConnectionError('Logging in to the BIGIP failed: %s %s' % (
+                status, reason))
+        try:
+            token = json.loads(data.decode('utf-8'))['token']
+            self._token = str(token['token'])
+            timeout = float(token.get('timeout', 1200))
+        except (ValueError, KeyError, TypeError) as e:
+            raise ParseError('Failed to parse the BIGIP\'s login response: '
+                             '%s' % e)
+        self._expires = time.time() + timeout
+        self._stats['logins'] += 1
+
+    def __deepcopy__(self, memo):
+        # Copies of clients (and their transports) share the token.
+        return self
+
+
+class Compression(object):
+    """gzip compression of iControl replies and requests.
+
+    iControl replies (and the WSDLs) are verbose XML which compresses 10 to
+    20 times, which matters on slow links to remote BIGIPs. Replies are
+    asked for gzip compressed and decompressed as they are read. Request
+    bodies of at least request_threshold bytes (like bulk add_member calls)
+    are compressed too, until the BIGIP answers a compressed request with
+    415 Unsupported Media Type: it is then resent uncompressed, and
+    requests are no longer compressed.
+
+    One instance is shared by all the clients of a L{BIGIP} (and its
+    sessions), and counts the bytes sent and received.
+    """
+    def __init__(self, accept=True, request_threshold=None, level=6):
+        """init
+
+        @param accept: When True, replies are asked for gzip compressed.
+        @param request_threshold: The size (in bytes) from which request
+            bodies are compressed. None never compresses requests.
+        @param level: The zlib compression level of requests (1 to 9).
+        """
+        self.accept = accept
+        self.request_threshold = request_threshold
+        self.level = level
+        self.compress_requests = request_threshold is not None
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys((
+            'requests', 'requests_compressed', 'request_bytes',
+            'request_wire_bytes', 'replies', 'replies_compressed',
+            'reply_bytes', 'reply_wire_bytes'), 0)
+
+    def stats(self):
+        """Returns a dict of byte counts measuring the savings.
+
+        requests, replies: The number of request and reply bodies.
+        requests_compressed, replies_compressed: How many were compressed.
+        request_bytes, reply_bytes: Their uncompressed size.
+        request_wire_bytes, reply_wire_bytes: The size sent or received.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def compress(self, body):
+        """Compresses a request body, when it is large enough and the BIGIP
+        takes compressed requests.
+
+        @return: A tuple of the body to send and whether it is compressed.
+        """
+        if body is None:
+            return body, False
+        compressed = None
+        if self.compress_requests and \
+                len(body) >= self.request_threshold:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED,
+                                          16 + zlib.MAX_WBITS)
+            compressed = compressor.compress(body) + compressor.flush()
+        self._count('request', len(body),
+                    len(compressed if compressed is not None else body),
+                    compressed is not None)
+        if compressed is None:
+            return body, False
+        return compressed, True
+
+    def decode(self, encoding, data):
+        """Returns a reply body received with the given Content-Encoding,
+        decompressed."""
+        if encoding != 'gzip' or not data:
+            self._count('reply', len(data), len(data), False)
+            return data
+        try:
+            decoded = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+        except zlib.error as e:
+            raise URLError('Failed to decompress the reply: %s' % e)
+        self._count('reply', len(decoded), len(data), True)
+        return decoded
+
+    def reader(self, fileobj, encoding):
+        """Returns a file-like object reading the decompressed reply body
+        read from fileobj."""
+        return _DecodingReader(self, fileobj, encoding == 'gzip')
+
+    def reject(self):
+        """Stops compressing requests, after the BIGIP refused one."""
+        if self.compress_requests:
+            log.info('The BIGIP refused a compressed request, requests will '
+                     'be sent uncompressed.')
+            self.compress_requests = False
+
+    def _count(self, kind, size, wire_size, compressed):
+        with self._lock:
+            stats = self._stats
+            count = kind == 'reply' and 'replies' or 'requests'
+            stats[count] += 1
+            stats[count + '_compressed'] += compressed
+            stats[kind + '_bytes'] += size
+            stats[kind + '_wire_bytes'] += wire_size
+
+    def __deepcopy__(self, memo):
+        # Copies of clients (and their transports) share the instance.
+        return self
+
+
+# The prefixes of the names of iControl methods which only read.
+_READ_PREFIXES = ('get_', 'query_', 'is_')
+
+
+class Scheduler(object):
+    """Limits and orders the iControl calls in flight to a BIGIP.
+
+    Past a few concurrent calls, the latency of the BIGIP's control plane
+    (mcpd and the iControl portal) climbs steeply, until calls time out. A
+    scheduler shared by the clients of a L{BIGIP} (and its sessions) lets at
+    most limit requests be in flight at once. The others wait, by priority
+    (lowest first) and then in order. Reads (get_*, query_* and is_*
+    methods) are INTERACTIVE and go ahead of other calls, which are BULK;
+    see L{priority} to change the priority of the calls of a thread.
+
+    With adaptive=True, the limit follows the BIGIP's latency: when the
+    average latency goes above target_latency (or, without one, above
+    tolerance times the average latency of requests sent alone), the limit
+    is cut by a quarter (at most once per average latency). Otherwise it
+    grows by one every limit requests completed while others were waiting,
+    up to max_concurrent.
+    """
+    INTERACTIVE = 0
+    BULK = 1
+
+    def __init__(self, max_concurrent=8, min_concurrent=1, adaptive=True,
+                 target_latency=None, tolerance=3.0, classify=None):
+        """init
+
+        @param max_concurrent: The maximum number of requests in flight.
+        @param min_concurrent: The lowest the adaptive limit goes.
+        @param adaptive: When True, the limit is lowered while the latency
+            is too high.
+        @param target_latency: The average latency (in seconds) above which
+            the limit is lowered. Better than the default when calls of very
+            different sizes are made.
+        @param tolerance: Without target_latency, how many times slower than
+            requests sent alone requests may get before the limit is
+            lowered.
+        @param classify: A callable returning the priority of a call from
+            its method name (e.g. "get_list"), instead of the default.
+        """
+        if not 1 <= min_concurrent <= max_concurrent:
+            # With a limit of 0, the waiting requests would never be sent.
+            raise ValueError('1 <= min_concurrent <= max_concurrent must '
+                             'hold')
+        self.max_concurrent = max_concurrent
+        self.min_concurrent = min_concurrent
+        self.adaptive = adaptive
+        self.target_latency = target_latency
+        self.tolerance = tolerance
+        self._classify = classify
+        self._limit = float(max_concurrent)
+        self._active = 0
+        self._waiting = []
+        self._order = itertools.count()
+        self._latency = None
+        self._baseline = None
+        self._last_cut = 0.0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {'requests': 0, 'queued': 0, 'wait_seconds': 0.0,
+                       'max_wait_seconds': 0.0, 'max_waiting': 0,
+                       'max_active': 0, 'throttled': 0}
+
+    @property
+    def limit(self):
+        """The current maximum number of requests in flight."""
+        return max(self.min_concurrent, int(self._limit))
+
+    def stats(self):
+        """Returns a dict describing the scheduler.
+
+        active, waiting: The number of requests in flight and waiting.
+        limit: The current limit.
+        requests: The number of requests sent.
+        queued: The number of requests which had to wait.
+        wait_seconds, max_wait_seconds: Their total and longest wait.
+        max_active, max_waiting: The most requests in flight and waiting.
+        throttled: How many times the limit was lowered.
+        latency, baseline: The average latency of requests (in seconds),
+            and of requests sent alone, or None before any.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(active=self._active, waiting=len(self._waiting),
+                         limit=self.limit, latency=self._latency,
+                         baseline=self._baseline)
+        return stats
+
+    @contextlib.contextmanager
+    def priority(self, priority):
+        """Returns a context manager giving the calls made by the current
+        thread inside it the priority (e.g. L{BULK} for a large read)."""
+        previous = getattr(self._local, 'priority', None)
+        self._local.priority = priority
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    def priority_of(self, method_name):
+        """Returns the priority of a call to method_name made by the current
+        thread."""
+        priority = getattr(self._local, 'priority', None)
+        if priority is not None:
+            return priority
+        if self._classify is not None:
+            return self._classify(method_name)
+        if method_name.startswith(_READ_PREFIXES):
+            return self.INTERACTIVE
+        return self.BULK
+
+    @contextlib.contextmanager
+    def slot(self, priority=None):
+        """Returns a context manager which waits for the request to be let
+        through (with priority, or L{BULK}) and measures its latency."""
+        alone = self._acquire(self.BULK if priority is None else priority)
+        start = _clock()
+        try:
+            yield
+        finally:
+            self._release(_clock() - start, alone)
+
+    def _acquire(self, priority):
+        # Waits for a free slot. Returns True when no other request was in
+        # flight.
+        with self._lock:
+            self._stats['requests'] += 1
+            if self._active < self.limit and not self._waiting:
+                return self._start()
+            ready = threading.Event()
+            heapq.heappush(self._waiting,
+                           (priority, next(self._order), ready))
+            self._stats['queued'] += 1
+            self._stats['max_waiting'] = max(self._stats['max_waiting'],
+                                              len(self._waiting))
+        start = _clock()
+        ready.wait()
+        waited = _clock() - start
+        with self._lock:
+            self._stats['wait_seconds'] += waited
+            self._stats['max_wait_seconds'] = max(
+                self._stats['max_wait_seconds'], waited)
+        return False
+
+    def _start(self):
+        self._active += 1
+        self._stats['max_active'] = max(self._stats['max_active'],
+                                        self._active)
+        return self._active == 1
+
+    def _release(self, latency, alone):
+        with self._lock:
+            self._active -= 1
+            self._adapt(latency, alone)
+            while self._waiting and self._active < self.limit:
+                heapq.heappop(self._waiting)[2].set()
+                self._start()
+
+    def _adapt(self, latency, alone):
+        if self._latency is None:
+            self._latency = latency
+        else:
+            self._latency = 0.8 * self._latency + 0.2 * latency
+        if alone:
+            if self._baseline is None:
+                self._baseline = latency
+            else:
+                self._baseline = 0.8 * self._baseline + 0.2 * latency
+        if not self.adaptive:
+            return
+        target = self.target_latency
+        if target is None:
+            if self._baseline is None:
+                return
+            target = self._baseline * self.tolerance
+        now = _clock()
+        if self._latency > target:
+            if now - self._last_cut >= self._latency and \
+                    self._limit > self.min_concurrent:
+                self._limit = max(self.min_concurrent, self._limit * 0.75)
+                self._last_cut = now
+                self._stats['throttled'] += 1
+        elif self._waiting and self._limit < self.max_concurrent:
+            self._limit = min(self.max_concurrent,
+                              self._limit + 1.0 / self._limit)
+
+    def __deepcopy__(self, memo):
+        # Copies of clients (and their transports) share the instance.
+        return self
+
+
+_SOAP_METHOD = re.compile(
+    br'<(?:[\w.-]+:)?Body[^>]*>\s*<(?:[\w.-]+:)?([\w.-]+)')
+
+
+def _request_priority(scheduler, request):
+    # Returns the priority of a transport request: the one given when it
+    # was built, or that of the method named in its envelope.
+    priority = getattr(request, 'priority', None)
+    if priority is None:
+        match = _SOAP_METHOD.search(request.message or b'', 0, 4096)
+        priority = scheduler.priority_of(
+            match and match.group(1).decode('ascii') or '')
+    return priority
+
+
+class _DecodingReader(object):
+    # A file-like reply body, decompressed (when gzip encoded) as it is
+    # read. Its sizes are counted once it has been read to the end.
+
+    def __init__(self, compression, fileobj, gzipped):
+        self._compression = compression
+        self._fileobj = fileobj
+        self._decompressor = gzipped and zlib.decompressobj(
+            16 + zlib.MAX_WBITS) or None
+        self._buffer = b''
+        self._size = self._wire_size = 0
+        self._done = False
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            chunks = [self._buffer]
+            self._buffer = b''
+            while not self._done:
+                chunks.append(self._fill(65536))
+            return b''.join(chunks)
+        while len(self._buffer) < size and not self._done:
+            self._buffer += self._fill(max(size, 8192))
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def _fill(self, size):
+        # Reads a chunk of the body. An empty chunk may be returned before
+        # the end when the decompressor needs more data.
+        try:
+            data = self._fileobj.read(size)
+        except (socket.error, httplib.HTTPException) as e:
+            raise URLError(e)
+        try:
+            if not data:
+                data = self._decompressor and self._decompressor.flush() \
+                    or b''
+                self._size += len(data)
+                self._finish()
+                return data
+            self._wire_size += len(data)
+            if self._decompressor is not None:
+                data = self._decompressor.decompress(data)
+        except zlib.error as e:
+            raise URLError('Failed to decompress the reply: %s' % e)
+        self._size += len(data)
+        return data
+
+    def _finish(self):
+        if not self._done:
+            self._done = True
+            self._compression._count('reply', self._size, self._wire_size,
+                                     self._decompressor is not None)
+
+    def close(self):
+        self._fileobj.close()
+
+    def __getattr__(self, name):
+        return getattr(self._fileobj, name)
+
+
+class PooledHTTPSTransport(HttpTransport):
+    """A suds transport that sends requests over a L{ConnectionPool}.
+
+    Credentials (or the token of a L{TokenAuth}) are added to every request
+    up front (rather than in reply to a 401 challenge), and requests and
+    replies are compressed as configured by a L{Compression}. iControl
+    calls wait for a L{Scheduler} to let them through. Requests for URLs
+    that don't belong to the pool's BIGIP are sent without the pool, with
+    the same credentials and certificate validation.
+    """
+    def __init__(self, pool, auth=None, compression=None, scheduler=None,
+                 **kwargs):
+        HttpTransport.__init__(self, **kwargs)
+        self.pool = pool
+        self.auth = auth
+        self.compression = compression
+        self.scheduler = scheduler
+        self._unpooled = None
+
+    def open(self, request):
+        if not self.pool.owns(request.url):
+            return self._fallback().open(request)
+        status, reason, headers, data = self._request('GET', request)
+        data = self._decode(headers, data)
+        if status != httplib.OK:
+            raise TransportError(reason, status, BytesIO(data))
+        return BytesIO(data)
+
+    def send(self, request):
+        if not self.pool.owns(request.url):
+            return self._fallback().send(request)
+        with self._slot([request]):
+            status, reason, headers, data = self._request('POST', request)
+        data = self._decode(headers, data)
+        if status in (httplib.ACCEPTED, httplib.NO_CONTENT):
+            return None
+        if status != httplib.OK:
+            raise TransportError(reason, status, BytesIO(data))
+        return Reply(status, headers, data)
+
+    def send_pipelined(self, requests, depth=16):
+        """Sends requests back to back over one connection (see
+        L{ConnectionPool.pipeline}).
+
+        @return: A list with the reply body (or None for an empty reply) or
+            the TransportError of each request, in order.
+        """
+        if not all(self.pool.owns(request.url) for request in requests):
+            return [_send_reply(self, request) for request in requests]
+        calls = [self._prepare(request) for request in requests]
+        log.debug('POST %d pipelined requests', len(calls))
+        try:
+            with self._slot(requests):
+                responses = self.pool.pipeline('POST', calls, depth)
+        except (socket.error, httplib.HTTPException) as e:
+            raise URLError(e)
+        replies = []
+        for request, call, response in zip(requests, calls, responses):
+            if response[0] == httplib.UNSUPPORTED_MEDIA_TYPE and \
+                    'Content-Encoding' in call[2]:
+                self.compression.reject()
+                with self._slot([request]):
+                    response = self._request('POST', request)
+            status, reason, headers, data = response
+            data = self._decode(headers, data)
+            if status in (httplib.ACCEPTED, httplib.NO_CONTENT):
+                replies.append(None)
+            elif status != httplib.OK:
+                replies.append(TransportError(reason, status, BytesIO(data)))
+            else:
+                replies.append(data)
+        return replies
+
+    def send_stream(self, request):
+        """Like send(), but returns the reply body as a file-like object
+        (or None for an empty reply) which is read from the network as it
+        is consumed."""
+        if not self.pool.owns(request.url):
+            reply = self._fallback().send(request)
+            return reply and BytesIO(reply.message)
+        # The slot is held until the reply starts, not while it is read.
+        with self._slot([request]):
+            status, reason, headers, body = self._request('POST', request,
+                                                          self.pool.open)
+        if self.compression is not None:
+            body = self.compression.reader(body,
+                                           headers.get('content-encoding'))
+        if status in (httplib.ACCEPTED, httplib.NO_CONTENT):
+            body.read()
+            return None
+        if status != httplib.OK:
+            raise TransportError(reason, status, BytesIO(body.read()))
+        return body
+
+    def _request(self, method, request, send=None):
+        path, body, headers = self._prepare(request)
+        log.debug('%s %s', method, request.url)
+        send = send or self.pool.request
+        try:
+            response = send(method, path, body, headers)
+            if response[0] == httplib.UNAUTHORIZED and \
+                    self.auth is not None:
+                # The token was revoked (or the BIGIP restarted): log in
+                # again and retry once.
+                _drain(response)
+                self.auth.invalidate(headers)
+                path, body, headers = self._prepare(request)
+                response = send(method, path, body, headers)
+            if response[0] == httplib.UNSUPPORTED_MEDIA_TYPE and \
+                    'Content-Encoding' in headers:
+                # The BIGIP doesn't take compressed requests.
+                _drain(response)
+                self.compression.reject()
+                path, body, headers = self._prepare(request)
+                response = send(method, path, body, headers)
+            return response
+        except (socket.error, httplib.HTTPException) as e:
+            # Surface connection failures like urllib2 based transports do.
+            raise URLError(e)
+
+    def _prepare(self, request):
+        # Returns the (path, body, headers) to send a suds request with.
+        parts = urlsplit(request.url)
+        path = parts.path
+        if parts.query:
+            path += '?' + parts.query
+        headers = dict(request.headers)
+        username, password = self.options.username, self.options.password
+        if self.auth is not None:
+            headers.update(self.auth.headers())
+        elif username is not None and password is not None:
+            headers['Authorization'] = _basic_auth(username, password)
+        body = request.message
+        if self.compression is not None:
+            if self.compression.accept:
+                headers['Accept-Encoding'] = 'gzip'
+            body, compressed = self.compression.compress(body)
+            if compressed:
+                headers['Content-Encoding'] = 'gzip'
+        return path, body, headers
+
+    def _fallback(self):
+        # Returns the transport of requests for URLs outside the pool.
+        if self._unpooled is None:
+            self._unpooled = _transport(
+                self.options.username, self.options.password,
+                self.pool.verify, self.options.timeout, None, self.auth,
+                self.compression, self.scheduler)
+        return self._unpooled
+
+    def _slot(self, requests):
+        # Waits for the scheduler to let requests through (at the priority
+        # of the most urgent one).
+        if self.scheduler is None:
+            return _no_slot
+        return self.scheduler.slot(min(
+            _request_priority(self.scheduler, request)
+            for request in requests))
+
+    def _decode(self, headers, data):
+        if self.compression is None:
+            return data
+        return self.compression.decode(headers.get('content-encoding'), data)
+
+    def __deepcopy__(self, memo=None):
+        # suds deep copies the transport when cloning a client. The clone
+        # should keep using the same pool.
+        clone = self.__class__(self.pool, self.auth, self.compression,
+                               self.scheduler)
+        clone.options.timeout = self.options.timeout
+        clone.options.username = self.options.username
+        clone.options.password = self.options.password
+        return clone
+
+
+class _NoSlot(object):
+    # The context manager of requests sent without a scheduler.
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        pass
+
+
+_no_slot = _NoSlot()
+
+
+def _drain(response):
+    # Reads the rest of a streamed response (opened with
+    # ConnectionPool.open()), which puts its connection back.
+    if hasattr(response[3], 'read'):
+        response[3].read()
+
+
+def _transport(username, password, verify, timeout, pool, auth=None,
+               compression=None, scheduler=None):
+    # Returns the suds transport for a client of get_client().
+    if pool is not None:
+        return PooledHTTPSTransport(pool, auth, compression, scheduler,
+                                    username=username, password=password,
+                                    timeout=timeout)
+    if verify:
+        return HTTPSTransport(auth, compression, scheduler,
+                              username=username, password=password,
+                              timeout=timeout)
+    return HTTPSTransportNoVerify(auth, compression, scheduler,
+                                  username=username, password=password,
+                                  timeout=timeout)
+
+
+def _send_reply(transport, request):
+    # Sends a request and returns the raw SOAP reply, None for an empty
+    # reply or the TransportError raised for an error reply.
+    try:
+        reply = transport.send(request)
+    except TransportError as e:
+        return e
+    return reply and reply.message or None
+
+
+_clock = getattr(time, 'perf_counter', time.time)
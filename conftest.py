@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+import sys
+
+
+# The asyncio modules use async/await, which Python 2 can't even compile.
+collect_ignore = [
+    'test_bigsuds_async.py',
+    'icontrol_stub_async.py',
+    'bench_bigsuds_async.py',
+] if sys.version_info < (3, 5) else []
@@ -0,0 +1,854 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A small, local stand-in for a BIGIP's iControl portal.
+
+This is used by the offline tests and the benchmarks. It serves generated
+rpc/encoded WSDLs for a handful of iControl interfaces over HTTPS (with
+HTTP/1.1 keep-alive) and answers SOAP calls from a tiny in-memory device
+model. WSDLs and SOAP replies recorded from a real BIGIP (see L{record})
+can be served instead.
+
+Example:
+    > with StubServer() as server:
+    >     b = bigsuds.BIGIP('127.0.0.1', port=server.port)
+    >     b.LocalLB.Pool.get_list()
+"""
+import os
+import re
+import select
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import ssl
+import base64
+import json
+import time
+import zlib
+from xml.etree import ElementTree
+
+import six
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+
+
+SOAP_ENV = 'http://schemas.xmlsoap.org/soap/envelope/'
+SOAP_ENC = 'http://schemas.xmlsoap.org/soap/encoding/'
+XSI = 'http://www.w3.org/2001/XMLSchema-instance'
+
+# Type definitions shared by every generated WSDL. Each entry is one of:
+#   ('array', <element type>)
+#   ('enum', [<values>])
+#   ('struct', [(<field name>, <field type>), ...])
+TYPES = {
+    'Common.StringSequence': ('array', 'xsd:string'),
+    'Common.ULongSequence': ('array', 'xsd:long'),
+    'Common.BooleanSequence': ('array', 'xsd:boolean'),
+    'Common.DoubleSequence': ('array', 'xsd:double'),
+    'Common.EnabledState': ('enum', ['STATE_DISABLED', 'STATE_ENABLED']),
+    'Common.ULong64': ('struct', [('high', 'xsd:unsignedInt'),
+                                  ('low', 'xsd:unsignedInt')]),
+    'Common.TimeStamp': ('struct', [('year', 'xsd:long'),
+                                    ('month', 'xsd:long'),
+                                    ('day', 'xsd:long'),
+                                    ('hour', 'xsd:long'),
+                                    ('minute', 'xsd:long'),
+                                    ('second', 'xsd:long')]),
+    'Common.StatisticType': ('enum', ['STATISTIC_SERVER_SIDE_BYTES_IN',
+                                      'STATISTIC_SERVER_SIDE_BYTES_OUT',
+                                      'STATISTIC_SERVER_SIDE_PACKETS_IN',
+                                      'STATISTIC_SERVER_SIDE_PACKETS_OUT',
+                                      'STATISTIC_SERVER_SIDE_CURRENT_CONNECTIONS',
+                                      'STATISTIC_SERVER_SIDE_TOTAL_CONNECTIONS']),
+    'Common.Statistic': ('struct', [('type', 'Common.StatisticType'),
+                                    ('value', 'Common.ULong64'),
+                                    ('time_stamp', 'xsd:long')]),
+    'Common.StatisticSequence': ('array', 'Common.Statistic'),
+    'Common.IPPortDefinition': ('struct', [('address', 'xsd:string'),
+                                           ('port', 'xsd:long')]),
+    'Common.IPPortDefinitionSequence': ('array', 'Common.IPPortDefinition'),
+    'Common.IPPortDefinitionSequenceSequence': (
+        'array', 'Common.IPPortDefinitionSequence'),
+    'LocalLB.LBMethod': ('enum', ['LB_METHOD_ROUND_ROBIN',
+                                  'LB_METHOD_RATIO_MEMBER',
+                                  'LB_METHOD_LEAST_CONNECTION_MEMBER']),
+    'LocalLB.LBMethodSequence': ('array', 'LocalLB.LBMethod'),
+    'LocalLB.Pool.PoolStatisticEntry': (
+        'struct', [('pool_name', 'xsd:string'),
+                   ('statistics', 'Common.StatisticSequence')]),
+    'LocalLB.Pool.PoolStatisticEntrySequence': (
+        'array', 'LocalLB.Pool.PoolStatisticEntry'),
+    'LocalLB.Pool.PoolStatistics': (
+        'struct', [('statistics', 'LocalLB.Pool.PoolStatisticEntrySequence'),
+                   ('time_stamp', 'Common.TimeStamp')]),
+    'LocalLB.Pool.MemberStatisticEntry': (
+        'struct', [('member', 'Common.IPPortDefinition'),
+                   ('statistics', 'Common.StatisticSequence')]),
+    'LocalLB.Pool.MemberStatisticEntrySequence': (
+        'array', 'LocalLB.Pool.MemberStatisticEntry'),
+    'LocalLB.Pool.MemberStatistics': (
+        'struct', [('statistics', 'LocalLB.Pool.MemberStatisticEntrySequence'),
+                   ('time_stamp', 'Common.TimeStamp')]),
+    'LocalLB.Pool.MemberStatisticsSequence': (
+        'array', 'LocalLB.Pool.MemberStatistics'),
+    'System.ProductInformation': (
+        'struct', [('product_code', 'xsd:string'),
+                   ('product_version', 'xsd:string'),
+                   ('package_version', 'xsd:string'),
+                   ('package_build', 'xsd:string'),
+                   ('package_edition', 'xsd:string'),
+                   ('product_features', 'Common.StringSequence')]),
+}
+
+# The iControl interfaces served by the stub:
+#   {<wsdl name>: [(<method>, [(<arg>, <type>), ...], <return type>), ...]}
+INTERFACES = {
+    'LocalLB.Pool': [
+        ('get_list', [], 'Common.StringSequence'),
+        ('create', [('pool_names', 'Common.StringSequence'),
+                    ('lb_methods', 'LocalLB.LBMethodSequence'),
+                    ('members', 'Common.IPPortDefinitionSequenceSequence')],
+         None),
+        ('delete_pool', [('pool_names', 'Common.StringSequence')], None),
+        ('add_member', [('pool_names', 'Common.StringSequence'),
+                        ('members', 'Common.IPPortDefinitionSequenceSequence')],
+         None),
+        ('get_member', [('pool_names', 'Common.StringSequence')],
+         'Common.IPPortDefinitionSequenceSequence'),
+        ('get_lb_method', [('pool_names', 'Common.StringSequence')],
+         'LocalLB.LBMethodSequence'),
+        ('set_description', [('pool_names', 'Common.StringSequence'),
+                             ('descriptions', 'Common.StringSequence')], None),
+        ('get_description', [('pool_names', 'Common.StringSequence')],
+         'Common.StringSequence'),
+        ('is_empty', [('pool_names', 'Common.StringSequence')],
+         'Common.BooleanSequence'),
+        ('get_statistics', [('pool_names', 'Common.StringSequence')],
+         'LocalLB.Pool.PoolStatistics'),
+        ('get_all_statistics', [], 'LocalLB.Pool.PoolStatistics'),
+        ('get_all_member_statistics', [('pool_names', 'Common.StringSequence')],
+         'LocalLB.Pool.MemberStatisticsSequence'),
+    ],
+    'System.SystemInfo': [
+        ('get_version', [], 'xsd:string'),
+        ('get_uptime', [], 'xsd:long'),
+        ('is_licensed', [], 'xsd:boolean'),
+        ('get_load_average', [], 'Common.DoubleSequence'),
+        ('get_product_information', [], 'System.ProductInformation'),
+    ],
+    'System.Session': [
+        ('get_session_identifier', [], 'xsd:long'),
+        ('start_transaction', [], None),
+        ('submit_transaction', [], None),
+        ('rollback_transaction', [], None),
+    ],
+}
+
+
+def _wsdl_type(type_name):
+    if type_name.startswith('xsd:'):
+        return type_name
+    return 'tns:%s' % type_name
+
+
+def make_wsdl(wsdl_name):
+    """Returns the (bytes) WSDL document for the given iControl interface."""
+    module, interface = wsdl_name.split('.', 1)
+    service_ns = 'urn:iControl:%s/%s' % (module, interface)
+    out = []
+    out.append(
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<definitions name="%(name)s" targetNamespace="urn:iControl" '
+        'xmlns:tns="urn:iControl" '
+        'xmlns:xsd="http://www.w3.org/2001/XMLSchema" '
+        'xmlns:SOAP-ENC="http://schemas.xmlsoap.org/soap/encoding/" '
+        'xmlns:wsdl="http://schemas.xmlsoap.org/wsdl/" '
+        'xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/" '
+        'xmlns="http://schemas.xmlsoap.org/wsdl/">\n<types>\n'
+        '<xsd:schema targetNamespace="urn:iControl">\n' % {'name': wsdl_name})
+    for type_name in sorted(TYPES):
+        kind, detail = TYPES[type_name]
+        if kind == 'array':
+            out.append(
+                '<xsd:complexType name="%s"><xsd:complexContent>'
+                '<xsd:restriction base="SOAP-ENC:Array">'
+                '<xsd:attribute ref="SOAP-ENC:arrayType" '
+                'wsdl:arrayType="%s[]"/>'
+                '</xsd:restriction></xsd:complexContent></xsd:complexType>\n'
+                % (type_name, _wsdl_type(detail)))
+        elif kind == 'enum':
+            out.append('<xsd:simpleType name="%s">'
+                       '<xsd:restriction base="xsd:string">' % type_name)
+            for value in detail:
+                out.append('<xsd:enumeration value="%s"/>' % value)
+            out.append('</xsd:restriction></xsd:simpleType>\n')
+        else:
+            out.append('<xsd:complexType name="%s"><xsd:sequence>'
+                       % type_name)
+            for field, field_type in detail:
+                out.append('<xsd:element name="%s" type="%s" minOccurs="1" '
+                           'maxOccurs="1"/>' % (field, _wsdl_type(field_type)))
+            out.append('</xsd:sequence></xsd:complexType>\n')
+    out.append('</xsd:schema>\n</types>\n')
+
+    methods = INTERFACES[wsdl_name]
+    for method, args, returns in methods:
+        out.append('<message name="%s.%sRequest">' % (wsdl_name, method))
+        for arg, arg_type in args:
+            out.append('<part name="%s" type="%s"/>'
+                       % (arg, _wsdl_type(arg_type)))
+        out.append('</message>\n<message name="%s.%sResponse">'
+                   % (wsdl_name, method))
+        if returns is not None:
+            out.append('<part name="return" type="%s"/>'
+                       % _wsdl_type(returns))
+        out.append('</message>\n')
+
+    out.append('<portType name="%sPortType">\n' % wsdl_name)
+    for method, args, returns in methods:
+        out.append(
+            '<operation name="%(m)s"><documentation>Stub for %(n)s.%(m)s.'
+            '</documentation><input message="tns:%(n)s.%(m)sRequest"/>'
+            '<output message="tns:%(n)s.%(m)sResponse"/></operation>\n'
+            % {'m': method, 'n': wsdl_name})
+    out.append('</portType>\n')
+
+    body = ('<soap:body use="encoded" namespace="%s" encodingStyle='
+            '"http://schemas.xmlsoap.org/soap/encoding/"/>' % service_ns)
+    out.append('<binding name="%sBinding" type="tns:%sPortType">'
+               '<soap:binding style="rpc" '
+               'transport="http://schemas.xmlsoap.org/soap/http"/>\n'
+               % (wsdl_name, wsdl_name))
+    for method, args, returns in methods:
+        out.append(
+            '<operation name="%s"><documentation>Stub for %s.%s.'
+            '</documentation><soap:operation soapAction="%s"/>'
+            '<input>%s</input><output>%s</output></operation>\n'
+            % (method, wsdl_name, method, service_ns, body, body))
+    out.append('</binding>\n')
+    out.append('<service name="%(n)s"><documentation>The %(n)s interface.'
+               '</documentation><port name="%(n)sPort" '
+               'binding="tns:%(n)sBinding"><soap:address '
+               'location="https://url_to_service"/></port></service>\n'
+               '</definitions>\n' % {'n': wsdl_name})
+    return ''.join(out).encode('utf-8')
+
+
+def make_index(wsdl_names=()):
+    """Returns the (bytes) portal page listing every available WSDL (and
+    those in wsdl_names)."""
+    lines = ['<html><body>']
+    for wsdl_name in sorted(set(INTERFACES) | set(wsdl_names)):
+        lines.append('<a href="/iControl/iControlPortal.cgi?WSDL=%s">%s</a>'
+                     % (wsdl_name, wsdl_name))
+    lines.append('</body></html>')
+    return '\n'.join(lines).encode('utf-8')
+
+
+class StubFault(Exception):
+    """Raised by a stub handler to return a SOAP fault."""
+
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+_INTEGER_TYPES = ('xsd:long', 'xsd:unsignedInt')
+
+
+def decode_value(element, type_name):
+    """Decodes an rpc/encoded request element of the given type into native
+    python values."""
+    if type_name.startswith('xsd:'):
+        if type_name in _INTEGER_TYPES:
+            return int(element.text)
+        return element.text or ''
+    kind, detail = TYPES[type_name]
+    if kind == 'enum':
+        return element.text
+    if kind == 'struct':
+        fields = dict(detail)
+        return dict((_local(x.tag), decode_value(x, fields[_local(x.tag)]))
+                    for x in element)
+    return [decode_value(x, detail) for x in element]
+
+
+def _escape(value):
+    return (six.text_type(value).replace('&', '&amp;')
+            .replace('<', '&lt;').replace('>', '&gt;'))
+
+
+def encode_value(name, value, type_name):
+    """Encodes a native python value as an iControl style rpc/encoded
+    element."""
+    if type_name == 'xsd:boolean':
+        value = value and 'true' or 'false'
+    elif type_name == 'xsd:double':
+        value = repr(float(value))
+    if type_name.startswith('xsd:'):
+        return '<%s s:type="y:%s">%s</%s>' % (
+            name, type_name[4:], _escape(value), name)
+    kind, detail = TYPES[type_name]
+    if kind == 'enum':
+        return '<%s s:type="A:%s">%s</%s>' % (
+            name, type_name, _escape(value), name)
+    if kind == 'struct':
+        return '<%s s:type="A:%s">%s</%s>' % (
+            name, type_name, ''.join(encode_value(field, value[field], ftype)
+                                     for field, ftype in detail), name)
+    if detail.startswith('xsd:'):
+        item_type = 'y:%s' % detail[4:]
+    else:
+        item_type = 'A:%s' % detail
+    if TYPES.get(detail, ('',))[0] == 'array':
+        item_type += '[]'
+    return '<%s s:type="A:%s" E:arrayType="%s[%d]">%s</%s>' % (
+        name, type_name, item_type, len(value),
+        ''.join(encode_value('item', x, detail) for x in value), name)
+
+
+def make_response(wsdl_name, method, value):
+    """Returns the (bytes) SOAP envelope for a successful call."""
+    module, interface = wsdl_name.split('.', 1)
+    returns = [x[2] for x in INTERFACES[wsdl_name] if x[0] == method][0]
+    body = ''
+    if returns is not None:
+        body = encode_value('return', value, returns)
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<SOAP-ENV:Envelope xmlns:SOAP-ENV="%s" xmlns:E="%s" '
+        'xmlns:A="urn:iControl" xmlns:s="%s" '
+        'xmlns:y="http://www.w3.org/2001/XMLSchema" '
+        'xmlns:iControl="urn:iControl" E:encodingStyle="%s">'
+        '<SOAP-ENV:Body><m:%sResponse xmlns:m="urn:iControl:%s/%s">%s'
+        '</m:%sResponse></SOAP-ENV:Body></SOAP-ENV:Envelope>' % (
+            SOAP_ENV, SOAP_ENC, XSI, SOAP_ENC, method, module, interface,
+            body, method)).encode('utf-8')
+
+
+def make_fault(message):
+    """Returns the (bytes) SOAP envelope for a failed call."""
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<SOAP-ENV:Envelope xmlns:SOAP-ENV="%s"><SOAP-ENV:Body>'
+        '<SOAP-ENV:Fault><faultcode>SOAP-ENV:Server</faultcode>'
+        '<faultstring>%s</faultstring></SOAP-ENV:Fault>'
+        '</SOAP-ENV:Body></SOAP-ENV:Envelope>' % (
+            SOAP_ENV, _escape(message))).encode('utf-8')
+
+
+_TIME_STAMP = {'year': 2016, 'month': 4, 'day': 1, 'hour': 0, 'minute': 0,
+               'second': 0}
+
+
+class StubDevice(object):
+    """The in-memory configuration the stub answers iControl calls from."""
+
+    version = 'BIG-IP_v12.1.2'
+
+    def __init__(self, pools=None, stat_pools=0):
+        self.pools = dict(pools or {})
+        self.descriptions = {}
+        self.session_id = 1000
+        self.transactions = []
+        self.calls = []
+        # The pools whose statistics don't change between calls.
+        self.idle_pools = set()
+        self._lock = threading.Lock()
+        for i in range(stat_pools):
+            self.pools['/Common/stat_pool_%d' % i] = []
+
+    def call(self, wsdl_name, method, args, session=None):
+        """Runs a call and records (wsdl_name, method, session) in calls,
+        where session is the X-iControl-Session header (or None)."""
+        with self._lock:
+            self.calls.append((wsdl_name, method, session))
+            handler = getattr(self, '%s_%s' % (
+                wsdl_name.replace('.', '_'), method), None)
+            if handler is None:
+                raise StubFault('Method %s.%s is not implemented by the '
+                                'stub' % (wsdl_name, method))
+            return handler(**args)
+
+    def _require(self, pool_names):
+        for name in pool_names:
+            if name not in self.pools:
+                raise StubFault('Exception: Common::OperationFailed\n'
+                                'error_string: The requested pool (%s) was '
+                                'not found.' % name)
+
+    def LocalLB_Pool_get_list(self):
+        return sorted(self.pools)
+
+    def LocalLB_Pool_create(self, pool_names, lb_methods, members):
+        for name, pool_members in zip(pool_names, members):
+            if name in self.pools:
+                raise StubFault('Exception: Common::OperationFailed\n'
+                                'error_string: The requested pool (%s) '
+                                'already exists.' % name)
+            self.pools[name] = list(pool_members)
+
+    def LocalLB_Pool_delete_pool(self, pool_names):
+        self._require(pool_names)
+        for name in pool_names:
+            del self.pools[name]
+
+    def LocalLB_Pool_add_member(self, pool_names, members):
+        self._require(pool_names)
+        for name, pool_members in zip(pool_names, members):
+            self.pools[name].extend(pool_members)
+
+    def LocalLB_Pool_get_member(self, pool_names):
+        self._require(pool_names)
+        return [self.pools[name] for name in pool_names]
+
+    def LocalLB_Pool_get_lb_method(self, pool_names):
+        self._require(pool_names)
+        return ['LB_METHOD_ROUND_ROBIN' for name in pool_names]
+
+    def LocalLB_Pool_set_description(self, pool_names, descriptions):
+        self._require(pool_names)
+        self.descriptions.update(zip(pool_names, descriptions))
+
+    def LocalLB_Pool_get_description(self, pool_names):
+        self._require(pool_names)
+        return [self.descriptions.get(name, '') for name in pool_names]
+
+    def LocalLB_Pool_is_empty(self, pool_names):
+        self._require(pool_names)
+        return [not self.pools[name] for name in pool_names]
+
+    def _counters(self, i, pool_name):
+        # The statistics of the i-th object of a reply, which grow with
+        # every call unless the pool is idle.
+        stat_types = TYPES['Common.StatisticType'][1]
+        stats = []
+        calls = pool_name not in self.idle_pools and len(self.calls) or 0
+        for j, stat_type in enumerate(stat_types):
+            counter = (i + 1) * (j + 1) * (calls + 1)
+            stats.append({'type': stat_type,
+                          'value': {'high': counter >> 32,
+                                    'low': counter & 0xffffffff},
+                          'time_stamp': 0})
+        return stats
+
+    def _statistics(self, pool_names):
+        entries = [{'pool_name': name, 'statistics': self._counters(i, name)}
+                   for i, name in enumerate(pool_names)]
+        return {'statistics': entries, 'time_stamp': _TIME_STAMP}
+
+    def LocalLB_Pool_get_statistics(self, pool_names):
+        self._require(pool_names)
+        return self._statistics(pool_names)
+
+    def LocalLB_Pool_get_all_statistics(self):
+        return self._statistics(sorted(self.pools))
+
+    def LocalLB_Pool_get_all_member_statistics(self, pool_names):
+        self._require(pool_names)
+        return [{'statistics': [{'member': member,
+                                 'statistics': self._counters(i, name)}
+                                for i, member in enumerate(self.pools[name])],
+                 'time_stamp': _TIME_STAMP} for name in pool_names]
+
+    def System_SystemInfo_get_version(self):
+        return self.version
+
+    def System_SystemInfo_get_uptime(self):
+        return 12345
+
+    def System_SystemInfo_is_licensed(self):
+        return True
+
+    def System_SystemInfo_get_load_average(self):
+        return [0.5, 1.25, 2.0]
+
+    def System_SystemInfo_get_product_information(self):
+        return {'product_code': 'BIG-IP',
+                'product_version': self.version.split('_v')[-1],
+                'package_version': 'Build 0.0.249 - Tue Mar 14 11:08:24 PDT '
+                                   '2017',
+                'package_build': '0.0.249',
+                'package_edition': 'Final',
+                'product_features': ['Local Traffic Manager']}
+
+    def System_Session_get_session_identifier(self):
+        self.session_id += 1
+        return self.session_id
+
+    def System_Session_start_transaction(self):
+        self.transactions.append('start')
+
+    def System_Session_submit_transaction(self):
+        self.transactions.append('submit')
+
+    def System_Session_rollback_transaction(self):
+        self.transactions.append('rollback')
+
+
+_XML = 'text/xml; charset=utf-8'
+
+
+class _StubRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Write each response with a single send, as a real web server would,
+    # so that keep-alive connections don't stall on delayed ACKs.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        # Idle kept-alive connections are closed after keepalive_timeout.
+        self.timeout = self.server.stub.keepalive_timeout
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.stub.count('connections')
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, code, body, content_type=_XML, headers=None):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in six.iteritems(headers or {}):
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._reply(*self.server.stub.handle('GET', self.path, self.headers))
+
+    def do_POST(self):
+        stub = self.server.stub
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if stub.delay:
+            stub.sleep(stub.delay)
+        self._reply(*stub.handle('POST', self.path, self.headers, body))
+
+
+class _StubHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+_cert_lock = threading.Lock()
+_cert_dir = []
+
+
+def certificate():
+    """Returns the (certfile, keyfile) of a throwaway self-signed cert."""
+    with _cert_lock:
+        if not _cert_dir:
+            path = tempfile.mkdtemp(prefix='bigsuds-stub-')
+            subprocess.check_call(
+                ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+                 '-days', '2', '-subj', '/CN=localhost',
+                 '-keyout', os.path.join(path, 'key.pem'),
+                 '-out', os.path.join(path, 'cert.pem')],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            _cert_dir.append(path)
+        path = _cert_dir[0]
+        return os.path.join(path, 'cert.pem'), os.path.join(path, 'key.pem')
+
+
+def record(hostname, directory, wsdl_names, calls=(), username='admin',
+           password='admin', port=443):
+    """Records the WSDLs and SOAP replies of a real BIGIP for a
+    L{StubServer}.
+
+    @param directory: The directory to write the recordings to.
+    @param wsdl_names: The WSDLs to record (e.g. ["LocalLB.Pool"]).
+    @param calls: (wsdl name, method) pairs of argument-less calls whose
+        replies to record (e.g. [("LocalLB.Pool", "get_list")]).
+    """
+    import bigsuds
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    pool = bigsuds.ConnectionPool(hostname, port)
+    auth = bigsuds._basic_auth(username, password)
+    for wsdl_name in wsdl_names:
+        status, _, _, body = pool.request(
+            'GET', '/iControl/iControlPortal.cgi?WSDL=%s' % wsdl_name,
+            headers={'Authorization': auth})
+        if status != 200:
+            raise IOError('Failed to get %s: HTTP %d' % (wsdl_name, status))
+        with open(os.path.join(directory, wsdl_name + '.wsdl'), 'wb') as f:
+            f.write(body)
+    b = bigsuds.BIGIP(hostname, username, password, port=port, pool=pool)
+    for wsdl_name, method in calls:
+        module, interface = wsdl_name.split('.', 1)
+        client = getattr(getattr(b, module), interface)._client
+        reply = bigsuds._send_raw(getattr(client.service, method), (), {})
+        with open(os.path.join(directory, '%s.%s.xml' % (wsdl_name, method)),
+                  'wb') as f:
+            f.write(reply or b'')
+    pool.close()
+
+
+class StubServer(object):
+    """An HTTPS iControl portal on 127.0.0.1, served from a background
+    thread.
+
+    @ivar device: The L{StubDevice} answering calls.
+    @ivar counters: Number of connections, requests, calls, wsdls, logins,
+        requests authorized with a password (basic_auth), unauthorized
+        requests, gzip compressed requests (gzip_requests) and replies
+        (gzip_replies) served.
+    @ivar tokens: The expiry time of each authentication token issued by
+        /mgmt/shared/authn/login. Tokens can be removed to revoke them.
+    """
+    def __init__(self, device=None, username='admin', password='admin',
+                 delay=0, recordings=None, token_timeout=1200, gzip=False,
+                 keepalive_timeout=None):
+        """init
+
+        @param recordings: A directory written by L{record}. Its WSDLs are
+            served instead of the generated ones, and calls with a recorded
+            reply are answered with it (whatever their arguments).
+        @param token_timeout: The lifetime (in seconds) of the
+            authentication tokens issued.
+        @param gzip: When True, replies are gzip compressed for requests
+            accepting it, and gzip compressed requests are accepted. When
+            False, those are answered with 415 Unsupported Media Type.
+        @param keepalive_timeout: The time (in seconds) after which idle
+            kept-alive connections are closed, or None to keep them open.
+        """
+        self.device = device or StubDevice()
+        self.username = username
+        self.password = password
+        self.delay = delay
+        self.recordings = recordings
+        self.token_timeout = token_timeout
+        self.gzip = gzip
+        self.keepalive_timeout = keepalive_timeout
+        self.tokens = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def handle(self, method, path, headers, body=b''):
+        """Answers a request to the portal.
+
+        @param headers: The request headers (anything with a get method).
+        @return: A tuple of (status, body, content type, extra headers).
+        """
+        self.count('requests')
+        if headers.get('Content-Encoding') == 'gzip':
+            if not self.gzip:
+                return 415, b'Unsupported Media Type', 'text/html', None
+            self.count('gzip_requests')
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        status, body, content_type, extra = self._answer(method, path,
+                                                         headers, body)
+        if self.gzip and 'gzip' in (headers.get('Accept-Encoding') or ''):
+            self.count('gzip_replies')
+            compressor = zlib.compressobj(6, zlib.DEFLATED,
+                                          16 + zlib.MAX_WBITS)
+            body = compressor.compress(body) + compressor.flush()
+            extra = dict(extra or {}, **{'Content-Encoding': 'gzip'})
+        return status, body, content_type, extra
+
+    def _answer(self, method, path, headers, body):
+        if method == 'POST' and path == '/mgmt/shared/authn/login':
+            return self._login(body)
+        if self.username is not None and not self._authorized(headers):
+            self.count('unauthorized')
+            return (401, b'Unauthorized', 'text/html',
+                    {'WWW-Authenticate': 'Basic realm="BIG\\-IP"'})
+        if method == 'POST':
+            return self._call(headers, body)
+        match = re.match(r'^/iControl/iControlPortal.cgi(\?WSDL=(.+))?$', path)
+        if match is None:
+            return 404, b'Not Found', 'text/html', None
+        wsdl_name = match.group(2)
+        if wsdl_name is None:
+            self.count('indexes')
+            return 200, make_index(self._recorded('.wsdl')), 'text/html', None
+        recorded = self._recording(wsdl_name + '.wsdl')
+        if recorded is not None:
+            self.count('wsdls')
+            return 200, recorded, _XML, None
+        if wsdl_name not in INTERFACES:
+            # The real portal answers unknown WSDLs with an html error page.
+            return (200, b'<html><body>Invalid WSDL</body>', 'text/html',
+                    None)
+        self.count('wsdls')
+        return 200, make_wsdl(wsdl_name), _XML, None
+
+    def _authorized(self, headers):
+        token = headers.get('X-F5-Auth-Token')
+        if token is not None:
+            return self.tokens.get(token, 0) > time.time()
+        expected = base64.b64encode(('%s:%s' % (
+            self.username, self.password)).encode('utf-8')).decode('ascii')
+        if headers.get('Authorization') != 'Basic %s' % expected:
+            return False
+        self.count('basic_auth')
+        return True
+
+    def _login(self, body):
+        # Answers /mgmt/shared/authn/login like iControl REST does.
+        credentials = json.loads(body.decode('utf-8'))
+        if self.username is not None and (
+                credentials.get('username'), credentials.get('password')) != (
+                self.username, self.password):
+            return 401, b'{"code": 401}', 'application/json', None
+        self.count('logins')
+        with self._lock:
+            token = 'TOKEN%d' % self.counters['logins']
+            self.tokens[token] = time.time() + self.token_timeout
+        return 200, json.dumps({
+            'username': credentials.get('username'),
+            'token': {'token': token, 'timeout': self.token_timeout}
+        }).encode('utf-8'), 'application/json', None
+
+    def _call(self, headers, body):
+        self.count('calls')
+        envelope = ElementTree.fromstring(body)
+        call = list(envelope.find('{%s}Body' % SOAP_ENV))[0]
+        namespace, method = call.tag[1:].split('}')
+        wsdl_name = namespace.split(':', 2)[2].replace('/', '.')
+        recorded = self._recording('%s.%s.xml' % (wsdl_name, method))
+        if recorded is not None:
+            return 200, recorded, _XML, None
+        arg_types = [dict(x[1]) for x in INTERFACES[wsdl_name]
+                     if x[0] == method][0]
+        args = dict((_local(x.tag), decode_value(x, arg_types[_local(x.tag)]))
+                    for x in call)
+        try:
+            value = self.device.call(wsdl_name, method, args,
+                                     headers.get('X-iControl-Session'))
+        except StubFault as e:
+            return 500, make_fault(str(e)), _XML, None
+        return 200, make_response(wsdl_name, method, value), _XML, None
+
+    def _recording(self, name):
+        # Returns the contents of a recorded file, or None.
+        if self.recordings is None:
+            return None
+        try:
+            with open(os.path.join(self.recordings, name), 'rb') as f:
+                return f.read()
+        except IOError:
+            return None
+
+    def _recorded(self, suffix):
+        # Returns the names of the recorded files ending with suffix.
+        if self.recordings is None:
+            return []
+        return [name[:-len(suffix)] for name in os.listdir(self.recordings)
+                if name.endswith(suffix)]
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+
+    def sleep(self, seconds):
+        threading.Event().wait(seconds)
+
+    @property
+    def port(self):
+        return self._httpd.server_address[1]
+
+    def start(self):
+        certfile, keyfile = certificate()
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        self._httpd = _StubHTTPServer(('127.0.0.1', 0), _StubRequestHandler)
+        self._httpd.socket = context.wrap_socket(self._httpd.socket,
+                                                 server_side=True)
+        self._httpd.stub = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.stop()
+
+
+class _ProxyRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_CONNECT(self):
+        proxy = self.server.proxy
+        with proxy._lock:
+            proxy.tunnels.append(
+                (self.path, self.headers.get('Proxy-Authorization')))
+        host, port = self.path.rsplit(':', 1)
+        upstream = socket.create_connection((host.strip('[]'), int(port)))
+        self.send_response(200, 'Connection established')
+        self.end_headers()
+        self.wfile.flush()
+        sockets = [self.connection, upstream]
+        try:
+            while True:
+                readable, _, _ = select.select(sockets, [], [])
+                for sock in readable:
+                    data = sock.recv(65536)
+                    if not data:
+                        return
+                    (upstream if sock is self.connection
+                     else self.connection).sendall(data)
+        finally:
+            upstream.close()
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubProxy(object):
+    """An HTTP proxy on 127.0.0.1 which tunnels CONNECT requests (like the
+    HTTPS proxies of the https_proxy environment variable).
+
+    @ivar tunnels: The (host:port, Proxy-Authorization header) of each
+        tunnel opened.
+    """
+    def __init__(self):
+        self.tunnels = []
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._server = _StubHTTPServer(('127.0.0.1', 0), _ProxyRequestHandler)
+        self._server.proxy = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.stop()
+
+
+def cleanup():
+    """Removes the generated certificate directory."""
+    with _cert_lock:
+        while _cert_dir:
+            shutil.rmtree(_cert_dir.pop(), ignore_errors=True)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""An asyncio version of the iControl portal stub (Python 3.5 and newer).
+
+It answers requests exactly like L{icontrol_stub.StubServer}, but is served
+by the event loop it is started from, so tests of asyncio clients run
+client and portal on one loop.
+
+Example:
+    > async with AsyncStubServer() as server:
+    >     b = bigsuds_async.AsyncBIGIP('127.0.0.1', port=server.port)
+    >     await b.LocalLB.Pool.get_list()
+"""
+import asyncio
+import ssl
+
+import icontrol_stub
+
+
+class _Headers(dict):
+    # Request headers, looked up case-insensitively.
+    def get(self, name, default=None):
+        return dict.get(self, name.lower(), default)
+
+
+class AsyncStubServer(icontrol_stub.StubServer):
+    """An HTTPS iControl portal on 127.0.0.1, served by the running event
+    loop."""
+    def __init__(self, *args, **kwargs):
+        super(AsyncStubServer, self).__init__(*args, **kwargs)
+        self._server = None
+        self._connections = {}
+
+    @property
+    def port(self):
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self):
+        certfile, keyfile = icontrol_stub.certificate()
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        self._server = await asyncio.start_server(
+            self._serve, '127.0.0.1', 0, ssl=context)
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+        # Closing the server leaves open connections alone.
+        for writer in list(self._connections):
+            writer.close()
+        if self._connections:
+            await asyncio.wait(list(self._connections.values()))
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc_value, exc_tb):
+        await self.stop()
+
+    async def _serve(self, reader, writer):
+        # Answers the requests of one keep-alive connection.
+        self.count('connections')
+        done = self._connections[writer] = asyncio.Future()
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(
+                        reader.readuntil(b'\r\n\r\n'), self.keepalive_timeout)
+                except (asyncio.IncompleteReadError, ConnectionError,
+                        asyncio.TimeoutError):
+                    return
+                lines = head.decode('latin-1').split('\r\n')
+                method, path, _ = lines[0].split(' ', 2)
+                headers = _Headers()
+                for line in lines[1:]:
+                    if line:
+                        name, _, value = line.partition(':')
+                        headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(
+                    int(headers.get('Content-Length', 0)))
+                if method == 'POST' and self.delay:
+                    await asyncio.sleep(self.delay)
+                status, body, content_type, extra = self.handle(
+                    method, path, headers, body)
+                lines = ['HTTP/1.1 %d %s' % (status, status == 200 and 'OK'
+                                             or 'Error'),
+                         'Content-Type: %s' % content_type,
+                         'Content-Length: %d' % len(body)]
+                lines.extend('%s: %s' % item for item in (extra or {}).items())
+                writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode(
+                    'latin-1') + body)
+        finally:
+            writer.close()
+            del self._connections[writer]
+            done.set_result(None)
@@ -1,5 +1,11 @@
 from setuptools import setup
 import re
+import sys
+
+
+# "python setup.py test" runs the tests with pytest (see setup.cfg).
+needs_pytest = set(['pytest', 'test', 'ptr']).intersection(sys.argv)
+pytest_runner = ['pytest-runner'] if needs_pytest else []
 
 
 def extract_version(filename):
@@ -29,7 +35,8 @@ setup(
     author_email='devcentral@f5.com',
     url='http://devcentral.f5.com',
     install_requires=['suds-jurko>=0.6'],
-    py_modules=['bigsuds'],
-    test_suite='nose.collector',
-    tests_require=['nose', 'mock', 'mox'],
+    py_modules=['bigsuds', 'bigsuds_transport', 'bigsuds_daemon'] + (
+        ['bigsuds_async'] if sys.version_info >= (3, 5) else []),
+    setup_requires=pytest_runner,
+    tests_require=['pytest'],
 )
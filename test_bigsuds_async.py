@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+
+import pytest
+
+import bigsuds
+import bigsuds_async
+import icontrol_stub
+from icontrol_stub_async import AsyncStubServer
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+@pytest.fixture(autouse=True)
+def wsdl_registry():
+    # Stubs may reuse the port of an earlier test's stub.
+    yield bigsuds.wsdl_registry
+    bigsuds.wsdl_registry.clear()
+
+
+def stub_device():
+    return icontrol_stub.StubDevice(pools={
+        '/Common/pool_a': [{'address': '10.0.0.1', 'port': 80}],
+        '/Common/pool_b': []})
+
+
+def test_async_bigip():
+    async def test():
+        async with AsyncStubServer(stub_device()) as stub:
+            async with bigsuds_async.AsyncBIGIP('127.0.0.1',
+                                                port=stub.port) as b:
+                assert await b.LocalLB.Pool.get_list() == ['/Common/pool_a',
+                                                           '/Common/pool_b']
+                assert await b.LocalLB.Pool.get_member(['/Common/pool_a']) \
+                    == [[{'address': '10.0.0.1', 'port': 80}]]
+                assert await b.System.SystemInfo.get_uptime() == 12345
+                with pytest.raises(bigsuds.ServerError):
+                    await b.LocalLB.Pool.get_member(['/Common/missing'])
+                with pytest.raises(bigsuds.MethodNotFound):
+                    await b.LocalLB.Pool.missing()
+
+                session = await b.with_session_id(7)
+                await session.LocalLB.Pool.get_list()
+                assert stub.device.calls[-1] == ('LocalLB.Pool', 'get_list',
+                                                 '7')
+                # Without a session id, a new one is asked for.
+                session = await b.with_session_id()
+                await session.LocalLB.Pool.get_list()
+                assert stub.device.calls[-2:] == [
+                    ('System.Session', 'get_session_identifier', None),
+                    ('LocalLB.Pool', 'get_list', '1001')]
+    run(test())
+
+
+def test_async_bigip_envelope_writer(monkeypatch):
+    def process(self, args, kwargs):
+        raise AssertionError('The envelope was built by suds')
+
+    async def test():
+        async with AsyncStubServer(stub_device()) as stub:
+            async with bigsuds_async.AsyncBIGIP('127.0.0.1',
+                                                port=stub.port) as b:
+                await b.LocalLB.Pool.create(
+                    ['/Common/pool_c'], ['LB_METHOD_ROUND_ROBIN'],
+                    [[{'address': '10.0.0.3', 'port': 80}]])
+                assert await b.LocalLB.Pool.get_member(
+                    pool_names=['/Common/pool_c']) == [
+                        [{'address': '10.0.0.3', 'port': 80}]]
+                with pytest.raises(bigsuds.ServerError):
+                    await b.LocalLB.Pool.get_member(['/Common/missing'])
+    monkeypatch.setattr(bigsuds._DefaultArgProcessor, 'process', process)
+    run(test())
+
+
+def test_async_bigip_call_logging(caplog):
+    async def test():
+        async with AsyncStubServer(stub_device()) as stub:
+            async with bigsuds_async.AsyncBIGIP('127.0.0.1',
+                                                port=stub.port) as b:
+                await b.LocalLB.Pool.get_list()
+                caplog.set_level(logging.DEBUG, logger='bigsuds')
+                names = ['/Common/pool_%d' % i for i in range(100)]
+                with pytest.raises(bigsuds.ServerError):
+                    await b.LocalLB.Pool.get_description(names)
+                bigsuds.set_call_logging(sample_rate=0)
+                try:
+                    await b.LocalLB.Pool.get_list()
+                finally:
+                    bigsuds.set_call_logging()
+    run(test())
+    messages = [record.getMessage() for record in caplog.records
+                if record.name == 'bigsuds']
+    assert messages == [
+        "Executing iControl method: LocalLB.Pool.get_description(["
+        "'/Common/pool_0', '/Common/pool_1', '/Common/pool_2', "
+        "... (100 items)])"]
+
+
+def test_async_bigip_concurrent_calls():
+    async def test():
+        async with AsyncStubServer(stub_device(), delay=0.05) as stub:
+            async with bigsuds_async.AsyncBIGIP('127.0.0.1', port=stub.port,
+                                                pool_size=4) as b:
+                results = await asyncio.gather(*[
+                    b.LocalLB.Pool.get_list() for _ in range(100)])
+                assert results == [['/Common/pool_a', '/Common/pool_b']] * 100
+                assert b.connection_pool.stats()['created'] == 4
+            assert stub.counters['wsdls'] == 1
+    run(test())
+
+
+def test_async_bigip_large_requests():
+    device = stub_device()
+    names = ['/Common/large_pool_%d' % i for i in range(20000)]
+    for name in names:
+        device.pools[name] = []
+
+    async def test():
+        async with AsyncStubServer(device) as stub:
+            async with bigsuds_async.AsyncBIGIP('127.0.0.1',
+                                                port=stub.port) as b:
+                assert await b.LocalLB.Pool.get_description(names) == \
+                    [''] * len(names)
+    run(test())
+
+    pool = bigsuds_async.AsyncConnectionPool('[FE80::1]', '8443')
+    assert pool._host_header == '[fe80::1]:8443'
+    assert bigsuds_async.AsyncConnectionPool('bigip')._host_header == 'bigip'
+
+
+def test_async_bigip_doesnt_resend_after_timeout():
+    async def test():
+        async with AsyncStubServer(stub_device()) as stub:
+            b = bigsuds_async.AsyncBIGIP('127.0.0.1', port=stub.port,
+                                         timeout=0.3)
+            await b.LocalLB.Pool.get_list()
+            stub.delay = 0.6
+            with pytest.raises(bigsuds.ConnectionError):
+                await b.LocalLB.Pool.create(['/Common/pool_c'],
+                                            ['LB_METHOD_ROUND_ROBIN'], [[]])
+            await asyncio.sleep(0.6)
+            assert b.connection_pool.stats()['retried'] == 0
+            assert [call[1] for call in stub.device.calls].count(
+                'create') == 1
+            b.close()
+    run(test())
+
+
+def test_async_bigip_retries_closed_connections():
+    async def test():
+        async with AsyncStubServer(stub_device(),
+                                   keepalive_timeout=0.1) as stub:
+            async with bigsuds_async.AsyncBIGIP('127.0.0.1',
+                                                port=stub.port) as b:
+                await b.LocalLB.Pool.get_list()
+                await asyncio.sleep(0.3)
+                await b.LocalLB.Pool.create(['/Common/pool_c'],
+                                            ['LB_METHOD_ROUND_ROBIN'], [[]])
+                assert [call[1] for call in stub.device.calls].count(
+                    'create') == 1
+    run(test())
+
+
+def test_async_bigip_connection_error():
+    async def test():
+        b = bigsuds_async.AsyncBIGIP('127.0.0.1', port=1)
+        with pytest.raises(bigsuds.ConnectionError):
+            await b.LocalLB.Pool.get_list()
+    run(test())
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import socket
+import struct
+import threading
+from array import array
+
+import pytest
+
+import bigsuds
+import bigsuds_daemon
+import icontrol_stub
+from bigsuds_daemon import Daemon, DaemonBIGIP
+
+
+@pytest.fixture
+def stub():
+    device = icontrol_stub.StubDevice(pools={
+        '/Common/pool_a': [{'address': '10.0.0.1', 'port': 80}],
+        '/Common/pool_b': []})
+    with icontrol_stub.StubServer(device) as server:
+        yield server
+
+
+@pytest.fixture(autouse=True)
+def wsdl_registry():
+    # Stubs may reuse the port of an earlier test's stub.
+    yield bigsuds.wsdl_registry
+    bigsuds.wsdl_registry.clear()
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    with Daemon(str(tmp_path / 'bigsuds.sock')) as daemon:
+        yield daemon
+
+
+def test_daemon(stub, daemon):
+    daemon.add_device('127.0.0.1', namespaces=['LocalLB.Pool'],
+                      port=stub.port)
+    wsdls = stub.counters['wsdls']
+    b = DaemonBIGIP('127.0.0.1', socket_path=daemon.path, fallback=False,
+                    port=stub.port)
+    assert b.LocalLB.Pool.get_list() == ['/Common/pool_a', '/Common/pool_b']
+    assert b.LocalLB_Pool.get_member(['/Common/pool_a']) == \
+        [[{'address': '10.0.0.1', 'port': 80}]]
+    assert b.System.SystemInfo.get_uptime() == 12345
+    # Only the namespace which wasn't warmed was loaded.
+    assert stub.counters['wsdls'] == wsdls + 1
+
+    # New clients (like every run of a script) use the warm BIGIP.
+    for _ in range(3):
+        b = DaemonBIGIP('127.0.0.1', socket_path=daemon.path,
+                        port=stub.port)
+        b.LocalLB.Pool.get_list()
+        b.close()
+    assert stub.counters['wsdls'] == wsdls + 1
+    assert daemon.stats()['devices'] == 1
+
+    # Clients with other options share the daemon's parsed WSDLs.
+    b = DaemonBIGIP('127.0.0.1', socket_path=daemon.path, port=stub.port,
+                    result_format='records')
+    member, = b.LocalLB.Pool.get_member(['/Common/pool_a'])[0]
+    assert (member.address, member.port) == ('10.0.0.1', 80)
+    assert stub.counters['wsdls'] == wsdls + 1
+    assert daemon.stats()['devices'] == 2
+
+    session = b.with_session_id(7)
+    session.LocalLB.Pool.get_list()
+    assert stub.device.calls[-1] == ('LocalLB.Pool', 'get_list', '7')
+    b.LocalLB.Pool.get_list()
+    assert stub.device.calls[-1] == ('LocalLB.Pool', 'get_list', None)
+
+
+def test_daemon_errors(stub, daemon):
+    b = DaemonBIGIP('127.0.0.1', socket_path=daemon.path, port=stub.port)
+    with pytest.raises(bigsuds.ServerError) as info:
+        b.LocalLB.Pool.get_member(['/Common/missing'])
+    assert '/Common/missing' in str(info.value)
+    with pytest.raises(bigsuds.MethodNotFound):
+        b.LocalLB.Pool.missing()
+    with pytest.raises(bigsuds.MethodNotFound):
+        b.LocalLB.Pool._call()
+    with pytest.raises(bigsuds.ArgumentError):
+        b.LocalLB.Pool.get_list('extra')
+    # Arguments JSON can't encode are rejected before reaching the daemon.
+    cycle = []
+    cycle.append(cycle)
+    for value in (object(), cycle):
+        with pytest.raises(bigsuds.ArgumentError) as info:
+            b.LocalLB.Pool.get_member([value])
+        assert 'LocalLB.Pool.get_member' in str(info.value)
+    bad = DaemonBIGIP('127.0.0.1', password='wrong', socket_path=daemon.path,
+                      port=stub.port)
+    with pytest.raises(bigsuds.ConnectionError):
+        bad.LocalLB.Pool.get_list()
+    # The connection is still usable after errors.
+    assert b.LocalLB.Pool.get_list() == ['/Common/pool_a', '/Common/pool_b']
+    assert daemon.stats()['errors'] == 5
+
+
+def test_daemon_concurrent_clients(stub, daemon):
+    b = DaemonBIGIP('127.0.0.1', socket_path=daemon.path, port=stub.port)
+    results = []
+
+    def call():
+        for _ in range(5):
+            results.append(b.LocalLB.Pool.get_list())
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [['/Common/pool_a', '/Common/pool_b']] * 20
+    assert stub.counters['wsdls'] == 1
+    assert daemon.stats()['connections'] <= 4
+
+
+def test_daemon_fallback(stub, tmp_path):
+    path = str(tmp_path / 'missing.sock')
+    b = DaemonBIGIP('127.0.0.1', socket_path=path, port=stub.port)
+    assert b.LocalLB.Pool.get_list() == ['/Common/pool_a', '/Common/pool_b']
+    b.with_session_id(3).LocalLB.Pool.get_list()
+    assert stub.device.calls[-1] == ('LocalLB.Pool', 'get_list', '3')
+
+    b = DaemonBIGIP('127.0.0.1', socket_path=path, fallback=False,
+                    port=stub.port)
+    with pytest.raises(bigsuds.ConnectionError):
+        b.LocalLB.Pool.get_list()
+
+    # A socket left behind by a daemon that is gone is replaced, but not
+    # one a daemon listens on.
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+    with Daemon(path) as daemon:
+        with pytest.raises(bigsuds.ConnectionError):
+            Daemon(path)
+        assert b.LocalLB.Pool.get_list() == ['/Common/pool_a',
+                                             '/Common/pool_b']
+        assert daemon.stats()['requests'] == 1
+
+
+def test_daemon_result_formats(stub, daemon):
+    b = DaemonBIGIP('127.0.0.1', socket_path=daemon.path, port=stub.port,
+                    result_format='columns')
+    stats = b.LocalLB.Pool.get_statistics(['/Common/pool_a'])
+    local = bigsuds.BIGIP('127.0.0.1', port=stub.port,
+                          result_format='columns')
+    expected = local.LocalLB.Pool.get_statistics(['/Common/pool_a'])
+    columns = stats['statistics']['statistics'][0]
+    assert sorted(columns) == \
+        sorted(expected['statistics']['statistics'][0])
+    assert isinstance(columns['value'], array)
+    assert columns['value'].typecode == \
+        expected['statistics']['statistics'][0]['value'].typecode
+
+
+def test_daemon_socket_security(stub, daemon, tmp_path, monkeypatch):
+    monkeypatch.delenv('BIGSUDS_SOCKET', raising=False)
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    assert bigsuds_daemon.default_socket_path() == \
+        str(tmp_path / 'bigsuds.sock')
+
+    # Messages which aren't JSON (like pickles) are not loaded.
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(daemon.path)
+    data = b'\x80\x02cos\nsystem\nq\x00.'
+    sock.sendall(struct.pack('>I', len(data)) + data)
+    assert sock.recv(1) == b''
+    sock.close()
+
+    # Sockets of other users are neither used nor replaced.
+    uid = os.getuid()
+    monkeypatch.setattr(os, 'getuid', lambda: uid + 1)
+    b = DaemonBIGIP('127.0.0.1', socket_path=daemon.path, port=stub.port)
+    with pytest.raises(bigsuds.ConnectionError):
+        b.LocalLB.Pool.get_list()
+    stale = str(tmp_path / 'stale.sock')
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(stale)
+    sock.close()
+    with pytest.raises(bigsuds.ConnectionError):
+        Daemon(stale)
+    assert os.path.exists(stale)
+    assert daemon.stats()['requests'] == 0